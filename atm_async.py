@@ -0,0 +1,314 @@
+"""
+ATM Messina asyncio fetch motoru
+Yüzlerce durağı tek event loop ve sınırlı sayıda eşzamanlı istekle yeniler
+
+Kullanım (komut satırı):
+    python atm_async.py --eszamanli 50
+    python atm_async.py --dosya data/duraklar.json --json
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from atm_cache import sayfa_hafizasi, son_bilinen_veri
+from atm_gecikme import gecikmeyi_isle
+from atm_gecmis import gecmise_yaz
+from atm_http import (GERI_CEKILME_KODLARI, HOST_CONCURRENCY, UPSTREAM_RETRIES, VARSAYILAN_HEADERS, DevreAcik,
+                      HizSiniriAsildi, SureDoldu, butce_timeout, deneme_suresi_var, devre_kesici,
+                      hiz_sinirlayici, kalan_sure)
+from atm_parser import parse_durak_html
+
+# Aynı anda uçuşta olabilecek en fazla istek
+ASYNC_CONCURRENCY = int(os.environ.get('ATM_ASYNC_CONCURRENCY', 50))
+# Aynı host'a açık tutulacak en fazla bağlantı (varsayılan: thread motoruyla aynı sınır)
+ASYNC_PER_HOST = int(os.environ.get('ATM_ASYNC_PER_HOST', HOST_CONCURRENCY))
+
+DURAKLAR_FILE = os.path.join(os.path.dirname(__file__), 'data', 'duraklar.json')
+
+
+class AsyncDurakIstemcisi:
+    """aiohttp tabanlı, semafor ile sınırlı durak istemcisi"""
+
+    def __init__(self, concurrency: int = ASYNC_CONCURRENCY, limit_per_host: int = ASYNC_PER_HOST):
+        """
+        Args:
+            concurrency (int): Aynı anda uçuşta olabilecek en fazla istek
+            limit_per_host (int): Host başına en fazla bağlantı
+        """
+        self.concurrency = concurrency
+        self.limit_per_host = limit_per_host
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semafor: Optional[asyncio.Semaphore] = None
+
+    async def __aenter__(self):
+        await self._session_al()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.kapat()
+
+    async def _session_al(self) -> aiohttp.ClientSession:
+        """Session'ı çalışan event loop içinde (ilk kullanımda) oluştur"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.concurrency,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=300,
+                keepalive_timeout=30
+            )
+            self._session = aiohttp.ClientSession(connector=connector, headers=VARSAYILAN_HEADERS)
+            self._semafor = asyncio.Semaphore(self.concurrency)
+        return self._session
+
+    async def kapat(self):
+        """Session'ı ve bağlantı havuzunu kapat"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _indir(self, session: aiohttp.ClientSession, url: str, headers: Optional[Dict] = None,
+                     son_zaman: Optional[float] = None) -> Tuple[int, Dict, bytes]:
+        """Sayfayı senkron motorla aynı şekilde host'un devre kesicisi üzerinden indir"""
+        kesici = devre_kesici(url)
+        deneme = kesici.izin_al()
+        basarili = None
+        try:
+            sonuc = await self._tekrarli_indir(session, url, headers, son_zaman)
+            basarili = True
+            return sonuc
+        except aiohttp.ClientResponseError as e:
+            basarili = False if e.status in GERI_CEKILME_KODLARI else None
+            raise
+        except (asyncio.TimeoutError, aiohttp.ClientError):
+            basarili = False
+            raise
+        finally:
+            kesici.bildir(basarili, deneme)
+
+    async def _tekrarli_indir(self, session: aiohttp.ClientSession, url: str, headers: Optional[Dict] = None,
+                              son_zaman: Optional[float] = None) -> Tuple[int, Dict, bytes]:
+        """
+        Sayfayı indir; senkron motorla aynı şekilde hız sınırlayıcıdan geçerek
+        ve kalan süre bütçesine göre tekrar dene
+        """
+        for deneme in range(UPSTREAM_RETRIES + 1):
+            if not deneme_suresi_var(son_zaman):
+                raise SureDoldu('Süre bütçesi doldu')
+            kalan = kalan_sure(son_zaman)
+            bekleme = hiz_sinirlayici.rezerve(None if kalan is None else min(hiz_sinirlayici.max_bekleme, kalan))
+            if bekleme > 0:
+                await asyncio.sleep(bekleme)
+            # İlk deneme (10, 30), tekrarlar (15, 45); bütçe daha azsa kırpılır
+            (connect, read), kirpildi = butce_timeout((10, 30) if deneme == 0 else (15, 45), son_zaman)
+            timeout = aiohttp.ClientTimeout(total=read if kirpildi else None, sock_connect=connect, sock_read=read)
+            try:
+                async with session.get(url, headers=headers, timeout=timeout) as response:
+                    son_deneme = deneme == UPSTREAM_RETRIES or not deneme_suresi_var(son_zaman)
+                    if (hiz_sinirlayici.yanit(response.status, response.headers.get('Retry-After'))
+                            and not son_deneme):
+                        continue
+                    response.raise_for_status()
+                    return response.status, response.headers, await response.read()
+            except (asyncio.TimeoutError, aiohttp.ClientConnectionError) as e:
+                if kirpildi and isinstance(e, asyncio.TimeoutError):
+                    raise SureDoldu(f'Süre bütçesi doldu ({read:.1f} sn)') from e
+                hiz_sinirlayici.hata()
+                if deneme == UPSTREAM_RETRIES or not deneme_suresi_var(son_zaman):
+                    raise
+
+    async def fetch_durak_data(self, url: str, son_zaman: Optional[float] = None) -> Dict:
+        """fetch_durak_data'nın async karşılığı - aynı sözlük yapısını döndürür"""
+        try:
+            session = await self._session_al()
+            async with self._semafor:
+                status, headers, content = await self._indir(session, url, sayfa_hafizasi.kosullu_headers(url),
+                                                             son_zaman)
+
+            # Sayfa değişmediyse parse atlanır; değiştiyse parse CPU işidir,
+            # event loop'u bloklamamak için thread'e verilir
+            loop = asyncio.get_running_loop()
+            parse = partial(parse_durak_html, anahtar=url)
+            sonuc = await loop.run_in_executor(
+                None, sayfa_hafizasi.cozumle, url, status, headers, content, parse)
+            if sonuc is None:
+                # 304 geldi ama önceki sonuç hafızadan düşmüş: koşulsuz tekrar çek
+                async with self._semafor:
+                    status, headers, content = await self._indir(session, url, son_zaman=son_zaman)
+                sonuc = await loop.run_in_executor(
+                    None, sayfa_hafizasi.cozumle, url, status, headers, content, parse)
+            durak_adi, otobusler = sonuc
+            # Geçmiş kaydı dosyaya flush edebilir; loop'u bloklamasın
+            await loop.run_in_executor(None, gecmise_yaz, url, otobusler)
+            gecikmeyi_isle(url, otobusler)
+
+            return {
+                'success': True,
+                'otobusler': otobusler,
+                'durak_adi': durak_adi,
+                'durak_id': None,
+                'timestamp': datetime.now().isoformat()
+            }
+        except DevreAcik as e:
+            # Upstream çökmüş görünüyor: timeout beklemeden son bilinen veriyi sun
+            return son_bilinen_veri(url, e)
+        except SureDoldu as e:
+            return son_bilinen_veri(url, e, bekliyor=True)
+        except (aiohttp.ClientError, asyncio.TimeoutError, HizSiniriAsildi) as e:
+            return {
+                'success': False,
+                'error': f'Bağlantı hatası: {str(e) or type(e).__name__}',
+                'timestamp': datetime.now().isoformat()
+            }
+        except Exception as e:
+            return {
+                'success': False,
+                'error': f'Hata: {str(e)}',
+                'timestamp': datetime.now().isoformat()
+            }
+
+    async def durak_verisi_cek(self, durak: Dict, son_zaman: Optional[float] = None) -> Dict:
+        """Tek bir durağın verisini çek ve durak bilgilerini ekle"""
+        try:
+            veri = await self.fetch_durak_data(durak.get('url'), son_zaman)
+            veri['durak_adi'] = durak.get('ad', 'Bilinmeyen')
+            veri['durak_id'] = durak.get('id')
+            return veri
+        except Exception as e:
+            return {
+                'success': False,
+                'durak_adi': durak.get('ad', 'Bilinmeyen'),
+                'durak_id': durak.get('id'),
+                'error': str(e)
+            }
+
+    async def tum_duraklari_cek(self, duraklar: List[Dict],
+                                geri_cagir: Optional[Callable[[Dict, Dict], None]] = None,
+                                son_zaman: Optional[float] = None) -> List[Dict]:
+        """
+        URL'si olan tüm durakları çek; sonuçlar durak sırasıyla döner
+
+        geri_cagir verilirse her durak biter bitmez (durak, veri) ile çağrılır.
+        son_zaman (time.monotonic) upstream timeout'larını ve tekrarları sınırlar.
+        """
+        hedefler = [d for d in duraklar if d.get('url')]
+
+        async def cek(durak: Dict) -> Dict:
+            veri = await self.durak_verisi_cek(durak, son_zaman)
+            if geri_cagir is not None:
+                geri_cagir(durak, veri)
+            return veri
+
+        return list(await asyncio.gather(*(cek(d) for d in hedefler)))
+
+
+async def fetch_durak_data_async(url: str, istemci: Optional[AsyncDurakIstemcisi] = None) -> Dict:
+    """Tek seferlik async çekim; istemci verilmezse geçici bir istemci açılır"""
+    if istemci is not None:
+        return await istemci.fetch_durak_data(url)
+    async with AsyncDurakIstemcisi() as gecici:
+        return await gecici.fetch_durak_data(url)
+
+
+class AsyncKopru:
+    """
+    Senkron koddan (Flask route'ları) async motoru kullanmak için köprü
+
+    Arka planda tek bir event loop thread'i çalışır; istemci ve bağlantı
+    havuzu istekler arasında bu loop üzerinde yaşar.
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pid: Optional[int] = None
+        self._istemci: Optional[AsyncDurakIstemcisi] = None
+        self._lock = threading.Lock()
+
+    def _loop_al(self) -> asyncio.AbstractEventLoop:
+        """Event loop thread'ini (gerekirse, fork sonrası da) başlat"""
+        pid = os.getpid()
+        if self._loop is not None and self._pid == pid:
+            return self._loop
+        with self._lock:
+            if self._loop is None or self._pid != pid:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, daemon=True, name='atm-async-loop')
+                thread.start()
+                self._loop = loop
+                self._pid = pid
+                self._istemci = AsyncDurakIstemcisi()
+            return self._loop
+
+    def gonder(self, coro_fn, *args) -> concurrent.futures.Future:
+        """
+        istemci ile coro_fn(istemci, *args) coroutine'ini loop'ta başlat; beklemeden future döndür
+        """
+        loop = self._loop_al()
+        return asyncio.run_coroutine_threadsafe(coro_fn(self._istemci, *args), loop)
+
+    def calistir(self, coro_fn, *args, timeout: Optional[float] = None):
+        """
+        istemci ile coro_fn(istemci, *args) coroutine'ini loop'ta çalıştır ve sonucu bekle
+        """
+        return self.gonder(coro_fn, *args).result(timeout)
+
+    def tum_duraklari_cek(self, duraklar: List[Dict], timeout: Optional[float] = None,
+                          geri_cagir: Optional[Callable[[Dict, Dict], None]] = None) -> List[Dict]:
+        """AsyncDurakIstemcisi.tum_duraklari_cek'in senkron karşılığı"""
+        return self.calistir(AsyncDurakIstemcisi.tum_duraklari_cek, duraklar, geri_cagir, timeout=timeout)
+
+
+# Süreç genelinde paylaşılan köprü
+kopru = AsyncKopru()
+
+
+def _duraklari_oku(dosya: str) -> List[Dict]:
+    with open(dosya, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return data if isinstance(data, list) else []
+
+
+async def _cli_calistir(duraklar: List[Dict], concurrency: int, limit_per_host: int) -> List[Dict]:
+    async with AsyncDurakIstemcisi(concurrency, limit_per_host) as istemci:
+        return await istemci.tum_duraklari_cek(duraklar)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='ATM Messina duraklarını async motorla toplu yenile')
+    parser.add_argument('--dosya', default=DURAKLAR_FILE, help='Durak listesi (JSON)')
+    parser.add_argument('--eszamanli', type=int, default=ASYNC_CONCURRENCY, help='Uçuştaki en fazla istek')
+    parser.add_argument('--host-limit', type=int, default=ASYNC_PER_HOST, help='Host başına en fazla bağlantı')
+    parser.add_argument('--json', action='store_true', help='Sonuçları JSON olarak yazdır')
+    args = parser.parse_args(argv)
+
+    duraklar = _duraklari_oku(args.dosya)
+    baslangic = time.perf_counter()
+    sonuclar = asyncio.run(_cli_calistir(duraklar, args.eszamanli, args.host_limit))
+    sure = time.perf_counter() - baslangic
+
+    if args.json:
+        json.dump(sonuclar, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    else:
+        for veri in sonuclar:
+            if veri.get('success'):
+                print(f"✅ {veri.get('durak_adi')}: {len(veri.get('otobusler', []))} otobüs")
+            else:
+                print(f"❌ {veri.get('durak_adi')}: {veri.get('error')}")
+    basarili = sum(1 for v in sonuclar if v.get('success'))
+    print(f"{basarili}/{len(sonuclar)} durak {sure:.2f} saniyede yenilendi", file=sys.stderr)
+    return 0 if basarili == len(sonuclar) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,640 @@
+"""
+ATM Messina durak verisi önbelleği
+Parse edilmiş fetch_durak_data sonuçlarını TTL ve byte sınırlı LRU ile bellekte tutar
+
+Birden fazla gunicorn worker'ı varsa (ATM_SHARED_CACHE) bellekteki LRU'nun
+arkasında tüm worker'ların paylaştığı bir SQLite önbelleği durur; bir durak
+TTL başına sunucu genelinde bir kez çekilir.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+# TTL: Bu süre boyunca kayıt taze sayılır (saniye)
+# STALE: TTL dolduktan sonra bu süre boyunca eski kayıt hemen döner,
+#        arka planda yenilenir (stale-while-revalidate)
+# MAX_BYTES: Önbelleğin JSON boyutu olarak üst sınırı; aşılınca en eski kullanılan silinir
+CACHE_TTL = float(os.environ.get('ATM_CACHE_TTL', 20))
+CACHE_STALE = float(os.environ.get('ATM_CACHE_STALE', 120))
+CACHE_MAX_BYTES = int(os.environ.get('ATM_CACHE_MAX_BYTES', 8 * 1024 * 1024))
+# Ham sayfa hash'i / ETag tutulan en fazla durak sayısı
+SAYFA_HAFIZA_BOYUTU = int(os.environ.get('ATM_PAGE_MEMO_SIZE', 4096))
+# Worker'lar arası paylaşılan önbellek: 'auto' (WEB_CONCURRENCY > 1 ise), 'true', 'false'
+SHARED_CACHE = os.environ.get('ATM_SHARED_CACHE', 'auto').lower()
+SHARED_CACHE_PATH = os.environ.get('ATM_SHARED_CACHE_PATH',
+                                   os.path.join(os.path.dirname(__file__), 'data', 'cache.db'))
+# Bir worker'ın durağı çekerken tuttuğu kiranın süresi; diğerleri bu kadar bekler (saniye)
+SHARED_CACHE_LEASE = float(os.environ.get('ATM_SHARED_CACHE_LEASE', 15))
+
+
+_SQL_PAYLASIMLI_SEMA = """
+CREATE TABLE IF NOT EXISTS kayitlar (
+    anahtar TEXT PRIMARY KEY,
+    zaman REAL NOT NULL,
+    veri TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS kiralar (
+    anahtar TEXT PRIMARY KEY,
+    sahip TEXT NOT NULL,
+    bitis REAL NOT NULL
+);
+"""
+
+
+class PaylasimliOnbellek:
+    """
+    Worker'lar arası paylaşılan önbellek (SQLite, WAL)
+
+    Kayıtlar (anahtar -> JSON, yazılma zamanı) ve kiralar tutar. Kira,
+    sunucu genelinde single-flight içindir: bir durağı çekmeden önce kirayı
+    alan worker çeker, diğerleri sonucun bu tabloya yazılmasını bekler.
+    Kira sahibi süreçtir (pid); süreç içi birleştirme TekUcus'un işidir.
+    """
+
+    def __init__(self, yol: str = SHARED_CACHE_PATH, kira_suresi: float = SHARED_CACHE_LEASE,
+                 busy_timeout: float = 5.0):
+        """
+        Args:
+            yol (str): Veritabanı dosyası
+            kira_suresi (float): Kiranın (ve diğer worker'ların bekleme) süresi (saniye)
+            busy_timeout (float): Kilitli veritabanında bekleme süresi (saniye)
+        """
+        self.yol = yol
+        self.kira_suresi = kira_suresi
+        self.busy_timeout = busy_timeout
+        self._yerel = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(yol)), exist_ok=True)
+        db = self.baglanti()
+        db.execute('PRAGMA journal_mode=WAL')
+        db.executescript(_SQL_PAYLASIMLI_SEMA)
+        self._lock = threading.Lock()
+        self._sayaclar = {'okuma': 0, 'bulunan': 0, 'yazma': 0, 'kira': 0, 'kira_dolu': 0, 'bekleme': 0}
+
+    def baglanti(self) -> sqlite3.Connection:
+        """Thread (ve fork sonrası süreç) başına bir bağlantı"""
+        db = getattr(self._yerel, 'db', None)
+        if db is None or self._yerel.pid != os.getpid():
+            db = sqlite3.connect(self.yol, timeout=self.busy_timeout, isolation_level=None)
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.execute(f'PRAGMA busy_timeout={int(self.busy_timeout * 1000)}')
+            self._yerel.db = db
+            self._yerel.pid = os.getpid()
+        return db
+
+    def _say(self, sayac: str):
+        with self._lock:
+            self._sayaclar[sayac] += 1
+
+    def oku(self, key: str) -> Optional[Tuple[Dict, float]]:
+        """(deger, yazılma zamanı) veya None"""
+        self._say('okuma')
+        satir = self.baglanti().execute(
+            'SELECT veri, zaman FROM kayitlar WHERE anahtar = ?', (key,)).fetchone()
+        if satir is None:
+            return None
+        self._say('bulunan')
+        return json.loads(satir[0]), satir[1]
+
+    def zaman(self, key: str) -> Optional[float]:
+        """Kaydın yazılma zamanı (gövde okunmadan)"""
+        satir = self.baglanti().execute('SELECT zaman FROM kayitlar WHERE anahtar = ?', (key,)).fetchone()
+        return satir[0] if satir else None
+
+    def yaz(self, key: str, deger: Dict, zaman: float):
+        """Kaydı yaz; daha yeni bir kayıt varsa (başka worker yazdıysa) ezme"""
+        self._say('yazma')
+        self.baglanti().execute(
+            'INSERT INTO kayitlar (anahtar, zaman, veri) VALUES (?, ?, ?) '
+            'ON CONFLICT(anahtar) DO UPDATE SET zaman = excluded.zaman, veri = excluded.veri '
+            'WHERE excluded.zaman > kayitlar.zaman',
+            (key, zaman, json.dumps(deger, ensure_ascii=False)))
+
+    def sil(self, key: str):
+        self.baglanti().execute('DELETE FROM kayitlar WHERE anahtar = ?', (key,))
+
+    def temizle(self, en_eski: float):
+        """en_eski zamanından önce yazılmış kayıtları ve süresi dolmuş kiraları sil"""
+        db = self.baglanti()
+        db.execute('DELETE FROM kayitlar WHERE zaman < ?', (en_eski,))
+        db.execute('DELETE FROM kiralar WHERE bitis < ?', (time.time(),))
+
+    def kira_al(self, key: str) -> bool:
+        """Kira boşsa, süresi dolmuşsa veya zaten bu süreçteyse al"""
+        sahip = str(os.getpid())
+        simdi = time.time()
+        imlec = self.baglanti().execute(
+            'INSERT INTO kiralar (anahtar, sahip, bitis) VALUES (?, ?, ?) '
+            'ON CONFLICT(anahtar) DO UPDATE SET sahip = excluded.sahip, bitis = excluded.bitis '
+            'WHERE kiralar.bitis < ? OR kiralar.sahip = excluded.sahip',
+            (key, sahip, simdi + self.kira_suresi, simdi))
+        alindi = imlec.rowcount > 0
+        self._say('kira' if alindi else 'kira_dolu')
+        return alindi
+
+    def kira_birak(self, key: str):
+        self.baglanti().execute('DELETE FROM kiralar WHERE anahtar = ? AND sahip = ?', (key, str(os.getpid())))
+
+    def bekle(self, key: str, yeni: float, timeout: Optional[float] = None) -> Optional[Tuple[Dict, float]]:
+        """
+        Başka bir worker'ın kirayı bırakmasını veya yeni bir kayıt yazmasını bekle
+
+        Returns:
+            tuple: yeni zamanından sonra yazılmış (deger, zaman) veya kira
+                   sonuçsuz bırakıldıysa / süre dolduysa None
+        """
+        self._say('bekleme')
+        bitis = time.monotonic() + (timeout if timeout is not None else self.kira_suresi)
+        db = self.baglanti()
+        aralik = 0.02
+        while time.monotonic() < bitis:
+            zaman = self.zaman(key)
+            if zaman is not None and zaman >= yeni:
+                return self.oku(key)
+            kira = db.execute('SELECT bitis FROM kiralar WHERE anahtar = ?', (key,)).fetchone()
+            if kira is None or kira[0] < time.time():
+                return None
+            time.sleep(aralik)
+            aralik = min(aralik * 2, 0.2)
+        return None
+
+    def istatistik(self) -> Dict:
+        with self._lock:
+            sayaclar = dict(self._sayaclar)
+        kayit_sayisi = self.baglanti().execute('SELECT COUNT(*) FROM kayitlar').fetchone()[0]
+        return {'yol': self.yol, 'kayit_sayisi': kayit_sayisi, **sayaclar}
+
+
+def paylasimli_onbellek_olustur(ayar: str = SHARED_CACHE) -> Optional[PaylasimliOnbellek]:
+    """ATM_SHARED_CACHE ayarına göre paylaşılan önbellek (kapalıysa None)"""
+    if ayar == 'auto':
+        acik = int(os.environ.get('WEB_CONCURRENCY', 1) or 1) > 1
+    else:
+        acik = ayar == 'true'
+    return PaylasimliOnbellek() if acik else None
+
+
+class _Kayit:
+    __slots__ = ('deger', 'boyut', 'zaman')
+
+    def __init__(self, deger: Dict, boyut: int, zaman: float):
+        self.deger = deger
+        self.boyut = boyut
+        self.zaman = zaman
+
+
+class DurakOnbellegi:
+    """
+    TTL + stale-while-revalidate + byte sınırlı LRU önbellek
+
+    paylasimli verilirse bellekteki LRU birinci seviye olur: eskimiş veya
+    olmayan kayıt önce paylaşılan önbellekte aranır, çekilen her sonuç oraya
+    da yazılır ve çekimler worker'lar arası kira ile tekilleştirilir.
+    """
+
+    def __init__(self, ttl: float = CACHE_TTL, stale: float = CACHE_STALE,
+                 max_bytes: int = CACHE_MAX_BYTES, refresh_workers: int = 4,
+                 paylasimli: Optional[PaylasimliOnbellek] = None):
+        """
+        Args:
+            ttl (float): Kaydın taze sayıldığı süre (saniye)
+            stale (float): TTL sonrası eski kaydın sunulabileceği ek süre (saniye)
+            max_bytes (int): Toplam kayıt boyutu üst sınırı (byte)
+            refresh_workers (int): Arka plan yenileme thread sayısı
+            paylasimli (PaylasimliOnbellek): Worker'lar arası ikinci seviye önbellek
+        """
+        self.ttl = ttl
+        self.stale = stale
+        self.max_bytes = max_bytes
+        self.paylasimli = paylasimli
+        self._kayitlar: 'OrderedDict[str, _Kayit]' = OrderedDict()
+        self._toplam_boyut = 0
+        self._lock = threading.Lock()
+        self._yenilenenler = set()
+        self._yenileme_executor = ThreadPoolExecutor(max_workers=refresh_workers,
+                                                     thread_name_prefix='atm-cache-refresh')
+        self._paylasimli_yazma = 0
+        self._sayaclar = {'hit': 0, 'stale': 0, 'miss': 0, 'eviction': 0, 'refresh': 0,
+                          'paylasimli': 0, 'paylasimli_hata': 0}
+
+    @staticmethod
+    def _boyut_hesapla(deger: Dict) -> int:
+        return len(json.dumps(deger, ensure_ascii=False).encode('utf-8'))
+
+    def _paylasimlidan_al(self, key: str, yerel_zaman: Optional[float]) -> Optional[_Kayit]:
+        """Paylaşılan önbellekte bellektekinden yeni kayıt varsa belleğe al"""
+        try:
+            zaman = self.paylasimli.zaman(key)
+            if zaman is None or (yerel_zaman is not None and zaman <= yerel_zaman):
+                return None
+            bulunan = self.paylasimli.oku(key)
+        except sqlite3.Error as e:
+            self._paylasimli_hatasi(e)
+            return None
+        if bulunan is None:
+            return None
+        self._say('paylasimli')
+        return self._yerel_set(key, bulunan[0], bulunan[1])
+
+    def get(self, key: str) -> Optional[Tuple[Dict, float]]:
+        """Kaydı (yaşına bakmadan) döndür: (deger, yas) veya None"""
+        with self._lock:
+            kayit = self._kayitlar.get(key)
+            if kayit is not None:
+                self._kayitlar.move_to_end(key)
+        if self.paylasimli is not None and (kayit is None or time.time() - kayit.zaman > self.ttl):
+            # Bellekteki kayıt yok veya eski: başka bir worker yenilemiş olabilir
+            kayit = self._paylasimlidan_al(key, kayit.zaman if kayit is not None else None) or kayit
+        if kayit is None:
+            return None
+        return kayit.deger, time.time() - kayit.zaman
+
+    def _yerel_set(self, key: str, deger: Dict, zaman: float) -> Optional[_Kayit]:
+        boyut = self._boyut_hesapla(deger)
+        with self._lock:
+            eski = self._kayitlar.pop(key, None)
+            if eski is not None:
+                self._toplam_boyut -= eski.boyut
+            if boyut > self.max_bytes:
+                return None
+            kayit = _Kayit(deger, boyut, zaman)
+            self._kayitlar[key] = kayit
+            self._toplam_boyut += boyut
+            while self._toplam_boyut > self.max_bytes and self._kayitlar:
+                _, silinen = self._kayitlar.popitem(last=False)
+                self._toplam_boyut -= silinen.boyut
+                self._sayaclar['eviction'] += 1
+            return kayit
+
+    def set(self, key: str, deger: Dict):
+        """Kaydı ekle/güncelle; boyut sınırı aşılırsa en eski kullanılanları sil"""
+        zaman = time.time()
+        self._yerel_set(key, deger, zaman)
+        if self.paylasimli is None:
+            return
+        try:
+            self.paylasimli.yaz(key, deger, zaman)
+            self._paylasimli_yazma += 1
+            if self._paylasimli_yazma % 1000 == 0:
+                # Artık sunulamayacak kadar eski kayıtlar
+                self.paylasimli.temizle(zaman - 2 * (self.ttl + self.stale))
+        except sqlite3.Error as e:
+            self._paylasimli_hatasi(e)
+
+    def delete(self, key: str):
+        with self._lock:
+            kayit = self._kayitlar.pop(key, None)
+            if kayit is not None:
+                self._toplam_boyut -= kayit.boyut
+        if self.paylasimli is not None:
+            try:
+                self.paylasimli.sil(key)
+            except sqlite3.Error as e:
+                self._paylasimli_hatasi(e)
+
+    def clear(self):
+        with self._lock:
+            self._kayitlar.clear()
+            self._toplam_boyut = 0
+
+    def kaydet(self, key: str, deger: Dict):
+        """
+        Sadece başarılı ve taze sonuçları sakla; hata bir sonraki istekte
+        tekrar denenir, devre açıkken sunulan eski veri ise önbelleğe girmez
+        """
+        if deger.get('success') and not deger.get('stale'):
+            self.set(key, deger)
+
+    def _paylasimli_hatasi(self, e: Exception):
+        # Paylaşılan önbellek sadece hızlandırır; hata olursa bellekteki önbellekle devam
+        self._say('paylasimli_hata')
+        print(f"Paylaşılan önbellek hatası: {e}")
+
+    def kira_al(self, key: str) -> bool:
+        """Bu süreç durağı çekebilir mi (paylaşılan önbellek yoksa her zaman True)"""
+        if self.paylasimli is None:
+            return True
+        try:
+            return self.paylasimli.kira_al(key)
+        except sqlite3.Error as e:
+            self._paylasimli_hatasi(e)
+            return True
+
+    def _cek(self, key: str, fetcher: Callable[[], Dict]) -> Tuple[Dict, float, str]:
+        """
+        fetcher ile çek ve kaydet; başka bir worker aynı durağı çekiyorsa
+        (kirası ondaysa) onun sonucunu bekle
+
+        Returns:
+            tuple: (deger, yas, durum) - durum 'miss' veya başka worker'ın
+                   sonucu geldiyse 'paylasimli'
+        """
+        alindi = self.kira_al(key)
+        if not alindi:
+            baslangic = time.time()
+            try:
+                bulunan = self.paylasimli.bekle(key, baslangic)
+            except sqlite3.Error as e:
+                self._paylasimli_hatasi(e)
+                bulunan = None
+            if bulunan is not None:
+                deger, zaman = bulunan
+                self._yerel_set(key, deger, zaman)
+                self._say('paylasimli')
+                return deger, max(time.time() - zaman, 0.0), 'paylasimli'
+            # Kira sonuçsuz bırakıldı (çekim hata verdi) veya süre doldu: kendimiz çekelim
+            alindi = self.kira_al(key)
+        try:
+            deger = fetcher()
+            self.kaydet(key, deger)
+            return deger, 0.0, 'miss'
+        finally:
+            if alindi and self.paylasimli is not None:
+                try:
+                    self.paylasimli.kira_birak(key)
+                except sqlite3.Error as e:
+                    self._paylasimli_hatasi(e)
+
+    def _yenile(self, key: str, fetcher: Callable[[], Dict]):
+        try:
+            self._cek(key, fetcher)
+        except Exception as e:
+            print(f"Arka plan yenileme hatası ({key}): {e}")
+        finally:
+            with self._lock:
+                self._yenilenenler.discard(key)
+
+    def _arka_planda_yenile(self, key: str, fetcher: Callable[[], Dict]):
+        """Aynı anahtar için en fazla bir arka plan yenilemesi başlat"""
+        with self._lock:
+            if key in self._yenilenenler:
+                return
+            self._yenilenenler.add(key)
+            self._sayaclar['refresh'] += 1
+        self._yenileme_executor.submit(self._yenile, key, fetcher)
+
+    def bak(self, key: str, fetcher: Callable[[], Dict]) -> Optional[Tuple[Dict, float, str]]:
+        """
+        Sadece önbelleğe bak: taze kayıt 'hit', eski kayıt 'stale' olarak döner
+        (eski kayıt arka planda fetcher ile yenilenir). Kayıt yoksa None.
+        """
+        mevcut = self.get(key)
+        if mevcut is None:
+            return None
+        deger, yas = mevcut
+        if yas <= self.ttl:
+            self._say('hit')
+            return deger, yas, 'hit'
+        if yas <= self.ttl + self.stale:
+            self._say('stale')
+            self._arka_planda_yenile(key, fetcher)
+            return deger, yas, 'stale'
+        return None
+
+    def getir(self, key: str, fetcher: Callable[[], Dict]) -> Tuple[Dict, float, str]:
+        """
+        Önbellekten getir; yoksa veya çok eskiyse fetcher ile çek
+
+        Returns:
+            tuple: (deger, yas, durum) - durum 'hit', 'stale', 'miss' veya 'paylasimli'
+        """
+        sonuc = self.bak(key, fetcher)
+        if sonuc is not None:
+            return sonuc
+
+        self._say('miss')
+        return self._cek(key, fetcher)
+
+    def tazele(self, key: str, fetcher: Callable[[], Dict], max_yas: float) -> Dict:
+        """
+        Poller için: kayıt max_yas saniyeden gençse (ör. başka bir worker az
+        önce çektiyse) onu döndür, değilse çek
+        """
+        mevcut = self.get(key)
+        if mevcut is not None and mevcut[1] <= max_yas:
+            return mevcut[0]
+        return self._cek(key, fetcher)[0]
+
+    def _say(self, sayac: str):
+        with self._lock:
+            self._sayaclar[sayac] += 1
+
+    def istatistik(self) -> Dict:
+        with self._lock:
+            istatistik = {
+                'kayit_sayisi': len(self._kayitlar),
+                'toplam_byte': self._toplam_boyut,
+                'max_byte': self.max_bytes,
+                'ttl_sn': self.ttl,
+                'stale_sn': self.stale,
+                **self._sayaclar
+            }
+        if self.paylasimli is not None:
+            try:
+                istatistik['paylasimli_onbellek'] = self.paylasimli.istatistik()
+            except sqlite3.Error as e:
+                istatistik['paylasimli_onbellek'] = {'hata': str(e)}
+        return istatistik
+
+
+class _Ucus:
+    __slots__ = ('event', 'sonuc', 'hata')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.sonuc = None
+        self.hata: Optional[BaseException] = None
+
+
+class TekUcus:
+    """
+    Single-flight: aynı anahtar için eşzamanlı çağrıları tek bir çağrıda birleştir
+
+    İlk gelen çağrı (lider) işi yapar; o sırada gelen diğerleri bekler ve
+    liderin sonucunu (veya hatasını) paylaşır.
+    """
+
+    def __init__(self):
+        self._ucuslar: Dict[str, _Ucus] = {}
+        self._lock = threading.Lock()
+        self._sayaclar = {'cagri': 0, 'lider': 0, 'birlesen': 0, 'hata': 0}
+
+    def do(self, key: str, fn: Callable[[], Dict]) -> Tuple[Dict, bool]:
+        """
+        fn'i anahtar başına en fazla bir kez aynı anda çalıştır
+
+        Returns:
+            tuple: (sonuc, paylasildi) - paylasildi True ise başka bir çağrının sonucu
+        """
+        with self._lock:
+            self._sayaclar['cagri'] += 1
+            ucus = self._ucuslar.get(key)
+            if ucus is None:
+                ucus = _Ucus()
+                self._ucuslar[key] = ucus
+                lider = True
+                self._sayaclar['lider'] += 1
+            else:
+                lider = False
+                self._sayaclar['birlesen'] += 1
+
+        if not lider:
+            ucus.event.wait()
+            if ucus.hata is not None:
+                raise ucus.hata
+            return ucus.sonuc, True
+
+        try:
+            ucus.sonuc = fn()
+        except BaseException as e:
+            ucus.hata = e
+            with self._lock:
+                self._sayaclar['hata'] += 1
+            raise
+        finally:
+            with self._lock:
+                self._ucuslar.pop(key, None)
+            ucus.event.set()
+        return ucus.sonuc, False
+
+    def istatistik(self) -> Dict:
+        with self._lock:
+            return {'ucustaki': len(self._ucuslar), **self._sayaclar}
+
+
+class _SayfaKaydi:
+    __slots__ = ('hash', 'etag', 'last_modified', 'durak_adi', 'otobusler', 'zaman')
+
+    def __init__(self, hash_: bytes, etag: Optional[str], last_modified: Optional[str],
+                 durak_adi: str, otobusler: List[Dict]):
+        self.hash = hash_
+        self.etag = etag
+        self.last_modified = last_modified
+        self.durak_adi = durak_adi
+        self.otobusler = otobusler
+        # Upstream'in bu sayfayı en son doğruladığı an (304 ve aynı içerik dahil)
+        self.zaman = time.time()
+
+
+class SayfaHafizasi:
+    """
+    Değişmeyen sayfaları yeniden parse etmemek için durak başına son ham sayfa
+    özeti (hash, ETag, Last-Modified) ve parse sonucu
+
+    Upstream 304 dönerse veya gövde byte byte aynıysa parse atlanır.
+    """
+
+    def __init__(self, boyut: int = SAYFA_HAFIZA_BOYUTU):
+        self.boyut = boyut
+        self._kayitlar: 'OrderedDict[str, _SayfaKaydi]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._sayaclar = {'not_modified': 0, 'ayni_icerik': 0, 'degisti': 0}
+
+    def kosullu_headers(self, url: str) -> Dict[str, str]:
+        """Koşullu GET için If-None-Match / If-Modified-Since header'ları"""
+        with self._lock:
+            kayit = self._kayitlar.get(url)
+        headers = {}
+        if kayit is not None:
+            if kayit.etag:
+                headers['If-None-Match'] = kayit.etag
+            if kayit.last_modified:
+                headers['If-Modified-Since'] = kayit.last_modified
+        return headers
+
+    def cozumle(self, url: str, status_code: int, headers, content: bytes,
+                parser: Callable[[bytes], Tuple[str, List[Dict]]]) -> Optional[Tuple[str, List[Dict]]]:
+        """
+        Yanıtı parse et; sayfa değişmediyse önceki parse sonucunu döndür
+
+        Returns:
+            tuple: (durak_adi, otobusler) veya 304 geldi ama kayıt yoksa None
+        """
+        with self._lock:
+            kayit = self._kayitlar.get(url)
+            if kayit is not None:
+                self._kayitlar.move_to_end(url)
+
+        if status_code == 304:
+            if kayit is None:
+                return None
+            kayit.zaman = time.time()
+            self._say('not_modified')
+            return kayit.durak_adi, kayit.otobusler
+
+        ozet = hashlib.blake2b(content, digest_size=16).digest()
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        if kayit is not None and kayit.hash == ozet:
+            kayit.etag = etag
+            kayit.last_modified = last_modified
+            kayit.zaman = time.time()
+            self._say('ayni_icerik')
+            return kayit.durak_adi, kayit.otobusler
+
+        durak_adi, otobusler = parser(content)
+        with self._lock:
+            self._kayitlar[url] = _SayfaKaydi(ozet, etag, last_modified, durak_adi, otobusler)
+            self._kayitlar.move_to_end(url)
+            while len(self._kayitlar) > self.boyut:
+                self._kayitlar.popitem(last=False)
+            self._sayaclar['degisti'] += 1
+        return durak_adi, otobusler
+
+    def son_bilinen(self, url: str) -> Optional[Tuple[str, List[Dict], float]]:
+        """Upstream'e gidilemediğinde sunulacak son parse sonucu: (durak_adi, otobusler, zaman)"""
+        with self._lock:
+            kayit = self._kayitlar.get(url)
+            if kayit is None:
+                return None
+            return kayit.durak_adi, kayit.otobusler, kayit.zaman
+
+    def _say(self, sayac: str):
+        with self._lock:
+            self._sayaclar[sayac] += 1
+
+    def istatistik(self) -> Dict:
+        with self._lock:
+            return {'kayit_sayisi': len(self._kayitlar), **self._sayaclar}
+
+
+# Senkron ve async fetch yollarının paylaştığı sayfa hafızası
+sayfa_hafizasi = SayfaHafizasi()
+
+
+def son_bilinen_veri(url: str, hata: Exception, bekliyor: bool = False) -> Dict:
+    """
+    Upstream'e gidilemediğinde (devre açık, süre bütçesi doldu) durağın son
+    başarılı parse sonucunu eski (stale) olarak döndür
+
+    bekliyor True ise çekim arka planda sürüyordur; yanıt 'pending' işaretlenir.
+    """
+    son = sayfa_hafizasi.son_bilinen(url)
+    if son is None:
+        veri = {
+            'success': False,
+            'error': f'Bağlantı hatası: {str(hata)}',
+            'timestamp': datetime.now().isoformat()
+        }
+    else:
+        durak_adi, otobusler, zaman = son
+        veri = {
+            'success': True,
+            'otobusler': otobusler,
+            'durak_adi': durak_adi,
+            'durak_id': None,
+            'timestamp': datetime.fromtimestamp(zaman).isoformat(),
+            'stale': True,
+            'veri_yasi': round(time.time() - zaman, 1),
+            'uyari': str(hata)
+        }
+    if bekliyor:
+        veri['pending'] = True
+    return veri
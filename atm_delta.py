@@ -0,0 +1,327 @@
+"""
+ATM Messina delta takibi
+Durak başına sürüm sayacı tutar; istemci son gördüğü sürümü (cursor) gönderip
+sadece o sürümden sonra otobüs listesi değişen durakları alabilir.
+Değişiklikler ayrıca bir olay halkasına yazılır (SSE canlı akışı buradan beslenir).
+
+Birden fazla worker varsa (ATM_SHARED_CACHE) defter paylaşılan SQLite
+veritabanında tutulur; cursor'lar ve SSE olay id'leri her worker'da geçerlidir.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Yanıta giren ama "değişiklik" sayılmayan alanlar (her çekimde farklı olurlar;
+# eski/bekleyen veri işaretleri de otobüs listesini değiştirmez)
+_OYNAK_ALANLAR = ('timestamp', 'cache', 'cache_yasi', 'stale', 'pending', 'veri_yasi', 'uyari')
+# Yeniden bağlanan istemcilere tekrar oynatılabilecek en fazla olay
+OLAY_HALKASI_BOYUTU = int(os.environ.get('ATM_EVENT_BUFFER', 1024))
+# Paylaşılan defterde başka worker'ların yazdığı olaylar için yoklama aralığı (saniye)
+PAYLASIMLI_YOKLAMA = 0.5
+
+_SQL_DEFTER_SEMA = """
+CREATE TABLE IF NOT EXISTS defter_ayar (
+    anahtar TEXT PRIMARY KEY,
+    deger TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS defter_surumler (
+    durak_id INTEGER PRIMARY KEY,
+    parmak_izi BLOB NOT NULL,
+    surum INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS defter_olaylar (
+    surum INTEGER PRIMARY KEY AUTOINCREMENT,
+    tur TEXT NOT NULL,
+    veri TEXT NOT NULL
+);
+"""
+
+
+def parmak_izi(veri: Dict) -> bytes:
+    """Oynak alanlar hariç yanıt içeriğinin özeti (sürüm karşılaştırması ve ETag için)"""
+    icerik = {k: v for k, v in veri.items() if k not in _OYNAK_ALANLAR}
+    ham = json.dumps(icerik, ensure_ascii=False, sort_keys=True).encode('utf-8')
+    return hashlib.blake2b(ham, digest_size=16).digest()
+
+
+class SurumDefteri:
+    """
+    Durak başına (parmak izi, sürüm) kaydı ve süreç genelinde artan bir sayaç
+
+    Cursor '<donem>:<surum>' biçimindedir. Dönem süreç başına rastgele
+    üretilir; süreç yeniden başlarsa eski cursor tanınmaz ve istemciye tam
+    liste gönderilir. Birden fazla worker için PaylasimliSurumDefteri kullanılır.
+    """
+
+    def __init__(self, halka_boyutu: int = OLAY_HALKASI_BOYUTU):
+        self.donem = os.urandom(4).hex()
+        self._surum = 0
+        # durak_id -> (parmak_izi, surum)
+        self._kayitlar: Dict[int, Tuple[bytes, int]] = {}
+        # (surum, olay_turu, veri) - 'durak' veya 'silindi'
+        self._olaylar: deque = deque(maxlen=halka_boyutu)
+        self._lock = threading.RLock()
+        self._yeni_olay = threading.Condition(self._lock)
+        self._sayaclar = {'tam': 0, 'delta': 0, 'gonderilen': 0, 'atlanan': 0}
+
+    @property
+    def cursor(self) -> str:
+        return f'{self.donem}:{self._surum}'
+
+    def cursor_coz(self, cursor: Optional[str]) -> Optional[int]:
+        """Bu süreçte üretilmiş geçerli bir cursor ise sürüm numarasını döndür"""
+        if not cursor:
+            return None
+        donem, _, surum = cursor.partition(':')
+        if donem != self.donem or not surum.isdigit():
+            return None
+        surum = int(surum)
+        return surum if surum <= self._surum else None
+
+    def _olay_ekle(self, tur: str, veri: Dict) -> int:
+        self._surum += 1
+        self._olaylar.append((self._surum, tur, veri))
+        self._yeni_olay.notify_all()
+        return self._surum
+
+    def guncelle(self, veri: Dict) -> int:
+        """
+        Tek bir durağın yeni sonucunu işle; içerik değiştiyse yeni sürüm ver
+
+        Başarısız veya henüz bekleyen (süre bütçesine yetişmeyen) sonuçlar
+        defteri değiştirmez: geçici bir hata sürümü ileri atıp canlı akışa
+        hata/veri/hata olayları göndermesin. Durağın mevcut sürümü (yoksa 0) döner.
+        """
+        durak_id = veri.get('durak_id')
+        if not veri.get('success') or veri.get('pending'):
+            with self._lock:
+                kayit = self._kayitlar.get(durak_id)
+                return kayit[1] if kayit else 0
+        iz = parmak_izi(veri)
+        with self._lock:
+            kayit = self._kayitlar.get(durak_id)
+            if kayit is None or kayit[0] != iz:
+                kayit = (iz, self._olay_ekle('durak', veri))
+                self._kayitlar[durak_id] = kayit
+            return kayit[1]
+
+    def budama(self, idler: List[int]):
+        """Listede olmayan (silinmiş) durakların kaydını düşür ve 'silindi' olayı yaz"""
+        gorulen = set(idler)
+        with self._lock:
+            for durak_id in [d for d in self._kayitlar if d not in gorulen]:
+                del self._kayitlar[durak_id]
+                self._olay_ekle('silindi', {'durak_id': durak_id})
+
+    def isle(self, sonuclar: List[Dict]) -> Tuple[List[int], str]:
+        """
+        Yeni çekilen sonuçları deftere işle; içeriği değişen duraklara yeni sürüm ver
+
+        Returns:
+            tuple: (her sonucun aynı sırayla güncel sürümü, işlem anındaki cursor)
+        """
+        with self._lock:
+            surumler = [self.guncelle(veri) for veri in sonuclar]
+            self.budama([veri.get('durak_id') for veri in sonuclar])
+            return surumler, self.cursor
+
+    def delta(self, sonuclar: List[Dict], since: Optional[str]) -> Dict:
+        """
+        since cursor'ından sonra değişen durakları içeren delta yanıtı
+
+        Returns:
+            dict: cursor (yeni), tam (since tanınmadıysa True), idler (güncel
+                  durak sırası - listede olmayanlar silinmiştir) ve duraklar
+                  (sadece değişenler)
+        """
+        surumler, cursor = self.isle(sonuclar)
+        onceki = self.cursor_coz(since)
+        if onceki is None:
+            degisenler = sonuclar
+        else:
+            degisenler = [v for v, s in zip(sonuclar, surumler) if s > onceki]
+
+        with self._lock:
+            self._sayaclar['tam' if onceki is None else 'delta'] += 1
+            self._sayaclar['gonderilen'] += len(degisenler)
+            self._sayaclar['atlanan'] += len(sonuclar) - len(degisenler)
+
+        return {
+            'cursor': cursor,
+            'tam': onceki is None,
+            'idler': [v.get('durak_id') for v in sonuclar],
+            'duraklar': degisenler
+        }
+
+    def olaylari_bekle(self, sonraki: int, timeout: float) -> Optional[List[Tuple[int, str, Dict]]]:
+        """
+        sonraki sürümünden büyük olayları döndür; yoksa timeout kadar bekle
+
+        Returns:
+            list: (surum, tur, veri) olayları (timeout olduysa boş liste) veya
+                  istenen olaylar halkadan düşmüşse None (istemci tam liste almalı)
+        """
+        with self._yeni_olay:
+            if self._surum <= sonraki:
+                self._yeni_olay.wait(timeout)
+            if self._surum <= sonraki:
+                return []
+            if not self._olaylar or self._olaylar[0][0] > sonraki + 1:
+                return None
+            return [olay for olay in self._olaylar if olay[0] > sonraki]
+
+    def istatistik(self) -> Dict:
+        with self._lock:
+            return {
+                'cursor': self.cursor,
+                'durak_sayisi': len(self._kayitlar),
+                'olay_sayisi': len(self._olaylar),
+                **self._sayaclar
+            }
+
+
+class PaylasimliSurumDefteri(SurumDefteri):
+    """
+    Worker'ların paylaştığı sürüm defteri (PaylasimliOnbellek'in SQLite veritabanında)
+
+    Dönem veritabanında bir kez üretilir, sürüm sayacı olay tablosunun
+    AUTOINCREMENT anahtarıdır; bu yüzden bir worker'ın verdiği cursor veya
+    SSE Last-Event-ID başka bir worker'da da tanınır. Bir durağın aynı içeriği
+    farklı worker'ların poller'larından gelse de tek sürüm alır.
+    """
+
+    def __init__(self, baglanti: Callable[[], sqlite3.Connection],
+                 halka_boyutu: int = OLAY_HALKASI_BOYUTU):
+        """
+        Args:
+            baglanti: Thread başına SQLite bağlantısı veren fonksiyon (PaylasimliOnbellek.baglanti)
+            halka_boyutu (int): Tutulan en fazla olay
+        """
+        super().__init__(halka_boyutu)
+        self._baglanti = baglanti
+        self._halka_boyutu = halka_boyutu
+        db = baglanti()
+        db.executescript(_SQL_DEFTER_SEMA)
+        db.execute('INSERT OR IGNORE INTO defter_ayar (anahtar, deger) VALUES (?, ?)',
+                   ('donem', os.urandom(4).hex()))
+        self.donem = db.execute("SELECT deger FROM defter_ayar WHERE anahtar = 'donem'").fetchone()[0]
+
+    def _son_surum(self, db: sqlite3.Connection) -> int:
+        return db.execute('SELECT COALESCE(MAX(surum), 0) FROM defter_olaylar').fetchone()[0]
+
+    def _islem(self, fn: Callable[[sqlite3.Connection], object]):
+        """fn'i tek bir yazma işleminde çalıştır (worker'lar arası atomik)"""
+        db = self._baglanti()
+        if db.in_transaction:
+            return fn(db)
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            sonuc = fn(db)
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+        with self._yeni_olay:
+            self._yeni_olay.notify_all()
+        return sonuc
+
+    def _olay_yaz(self, db: sqlite3.Connection, tur: str, veri: Dict) -> int:
+        surum = db.execute('INSERT INTO defter_olaylar (tur, veri) VALUES (?, ?)',
+                           (tur, json.dumps(veri, ensure_ascii=False))).lastrowid
+        db.execute('DELETE FROM defter_olaylar WHERE surum <= ?', (surum - self._halka_boyutu,))
+        return surum
+
+    @property
+    def cursor(self) -> str:
+        return f'{self.donem}:{self._son_surum(self._baglanti())}'
+
+    def cursor_coz(self, cursor: Optional[str]) -> Optional[int]:
+        if not cursor:
+            return None
+        donem, _, surum = cursor.partition(':')
+        if donem != self.donem or not surum.isdigit():
+            return None
+        surum = int(surum)
+        return surum if surum <= self._son_surum(self._baglanti()) else None
+
+    def guncelle(self, veri: Dict) -> int:
+        durak_id = veri.get('durak_id')
+        if not veri.get('success') or veri.get('pending') or durak_id is None:
+            satir = self._baglanti().execute(
+                'SELECT surum FROM defter_surumler WHERE durak_id = ?', (durak_id,)).fetchone()
+            return satir[0] if satir else 0
+        iz = parmak_izi(veri)
+
+        def yaz(db: sqlite3.Connection) -> int:
+            satir = db.execute('SELECT parmak_izi, surum FROM defter_surumler WHERE durak_id = ?',
+                               (durak_id,)).fetchone()
+            if satir is not None and bytes(satir[0]) == iz:
+                return satir[1]
+            surum = self._olay_yaz(db, 'durak', veri)
+            db.execute('INSERT OR REPLACE INTO defter_surumler (durak_id, parmak_izi, surum) VALUES (?, ?, ?)',
+                       (durak_id, iz, surum))
+            return surum
+
+        return self._islem(yaz)
+
+    def budama(self, idler: List[int]):
+        gorulen = set(idler)
+
+        def sil(db: sqlite3.Connection):
+            for (durak_id,) in db.execute('SELECT durak_id FROM defter_surumler').fetchall():
+                if durak_id not in gorulen:
+                    db.execute('DELETE FROM defter_surumler WHERE durak_id = ?', (durak_id,))
+                    self._olay_yaz(db, 'silindi', {'durak_id': durak_id})
+
+        self._islem(sil)
+
+    def isle(self, sonuclar: List[Dict]) -> Tuple[List[int], str]:
+        def yaz(db: sqlite3.Connection) -> Tuple[List[int], str]:
+            surumler = [self.guncelle(veri) for veri in sonuclar]
+            self.budama([veri.get('durak_id') for veri in sonuclar])
+            return surumler, f'{self.donem}:{self._son_surum(db)}'
+
+        return self._islem(yaz)
+
+    def olaylari_bekle(self, sonraki: int, timeout: float) -> Optional[List[Tuple[int, str, Dict]]]:
+        # Bu süreçteki yazmalar koşulu uyandırır; diğer worker'larınki yoklanarak görülür
+        bitis = time.monotonic() + timeout
+        db = self._baglanti()
+        while True:
+            en_eski, en_yeni = db.execute(
+                'SELECT COALESCE(MIN(surum), 0), COALESCE(MAX(surum), 0) FROM defter_olaylar').fetchone()
+            if en_yeni > sonraki:
+                if en_eski > sonraki + 1:
+                    return None
+                return [(surum, tur, json.loads(veri)) for surum, tur, veri in db.execute(
+                    'SELECT surum, tur, veri FROM defter_olaylar WHERE surum > ? ORDER BY surum', (sonraki,))]
+            kalan = bitis - time.monotonic()
+            if kalan <= 0:
+                return []
+            with self._yeni_olay:
+                self._yeni_olay.wait(min(kalan, PAYLASIMLI_YOKLAMA))
+
+    def istatistik(self) -> Dict:
+        db = self._baglanti()
+        with self._lock:
+            sayaclar = dict(self._sayaclar)
+        return {
+            'cursor': self.cursor,
+            'paylasimli': True,
+            'durak_sayisi': db.execute('SELECT COUNT(*) FROM defter_surumler').fetchone()[0],
+            'olay_sayisi': db.execute('SELECT COUNT(*) FROM defter_olaylar').fetchone()[0],
+            **sayaclar
+        }
+
+
+def surum_defteri_olustur(paylasimli=None) -> SurumDefteri:
+    """Paylaşılan önbellek açıksa (PaylasimliOnbellek) defter de onun veritabanında tutulur"""
+    if paylasimli is None:
+        return SurumDefteri()
+    return PaylasimliSurumDefteri(paylasimli.baglanti)
@@ -0,0 +1,533 @@
+"""
+ATM Messina durak deposu
+Durak listesini bellekte (id indeksli) tutar; depolama sadece değişince
+yeniden okunur, değişiklikler depolamaya hemen yazılır
+
+Depolama backend'leri:
+    json   - data/duraklar.json (varsayılan)
+    sqlite - data/duraklar.db (WAL); ilk açılışta duraklar.json bir kez içe aktarılır
+
+Kullanım (komut satırı):
+    python atm_depo.py --sqlite data/duraklar.db --json data/duraklar.json
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+# Depolama backend'i: 'json' veya 'sqlite'
+STORAGE = os.environ.get('ATM_STORAGE', 'json').lower()
+SQLITE_FILE = os.environ.get('ATM_SQLITE_PATH', os.path.join(DATA_DIR, 'duraklar.db'))
+
+Guncelleyici = Callable[[Dict], Dict]
+
+
+def palina_numarasi(url: Optional[str]) -> Optional[str]:
+    """URL'deki palina numarası (smartpoles2.php?palina=1766&rnd=7 -> '1766')"""
+    if not url:
+        return None
+    degerler = parse_qs(urlsplit(url).query).get('palina')
+    if not degerler or not degerler[0].strip():
+        return None
+    return degerler[0].strip()
+
+
+class IdDagitici:
+    """
+    Yeni durak id'si: mevcut en büyük id + 1
+
+    En büyük id bir kez hesaplanır ve eklemelerle ilerletilir; sadece en
+    büyük id'li durak silinirse yeniden hesaplanır (önceki davranışla aynı id'ler).
+    Ayrılan id'ler yazma başarısız olursa geri_ver ile geri alınır.
+    """
+
+    def __init__(self, duraklar: List[Dict]):
+        self._en_buyuk = self._hesapla(duraklar)
+
+    @staticmethod
+    def _hesapla(duraklar: List[Dict]) -> int:
+        # Elle düzenlenmiş dosyadaki id'si eksik/sayı olmayan kayıtlar sayılmaz
+        return max((d['id'] for d in duraklar if isinstance(d.get('id'), int)), default=0)
+
+    def al(self, adet: int = 1) -> int:
+        """adet kadar ardışık id ayır; ilkini döndür"""
+        ilk = self._en_buyuk + 1
+        self._en_buyuk += adet
+        return ilk
+
+    def geri_ver(self, ilk: int, adet: int):
+        """al ile ayrılıp kullanılamayan (yazılamayan) id'leri geri ver"""
+        if self._en_buyuk == ilk + adet - 1:
+            self._en_buyuk = ilk - 1
+
+    def silindi(self, durak_id: int, kalanlar: List[Dict]):
+        if durak_id == self._en_buyuk:
+            self._en_buyuk = self._hesapla(kalanlar)
+
+
+class JsonDepolama:
+    """
+    Tüm listeyi tek bir JSON dosyasında tutan depolama
+
+    Değişiklikler oku-değiştir-yaz şeklindedir; süreçler arası çakışmayı
+    önlemek için (destekleniyorsa) '.lock' dosyası üzerinde flock alınır.
+    """
+
+    ad = 'json'
+
+    def __init__(self, dosya: str):
+        self.dosya = dosya
+        # Son okunan/yazılan liste, damgası, id indeksi ve id dağıtıcısı:
+        # kendi yazdığımızı tekrar parse etmeyelim, yazarken taramayalım
+        self._son_damga: Optional[str] = None
+        self._son_liste: List[Dict] = []
+        self._id_indeksi: Dict[int, Dict] = {}
+        self._ids = IdDagitici([])
+        self._lock = threading.RLock()
+
+    def damga(self) -> Optional[str]:
+        """Dosyanın sürümü: mtime ve boyut (dosya yoksa None)"""
+        try:
+            st = os.stat(self.dosya)
+        except OSError:
+            return None
+        return f'{st.st_mtime_ns:x}-{st.st_size:x}'
+
+    def _onbellege_al(self, damga: Optional[str], duraklar: List[Dict], ids: Optional[IdDagitici] = None):
+        self._son_damga = damga
+        self._son_liste = duraklar
+        self._id_indeksi = {d.get('id'): d for d in duraklar}
+        self._ids = ids if ids is not None else IdDagitici(duraklar)
+
+    def _dosyadan_oku(self) -> List[Dict]:
+        try:
+            with open(self.dosya, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+                # Eğer data bir liste değilse, boş liste döndür
+                if not isinstance(data, list):
+                    print(f"Uyarı: duraklar.json dosyası geçersiz format - liste bekleniyordu")
+                    return []
+                return data
+        except FileNotFoundError:
+            return []
+        except json.JSONDecodeError as e:
+            print(f"JSON parse hatası: {e}")
+            return []
+        except Exception as e:
+            print(f"Dosya okuma hatası: {e}")
+            return []
+
+    def oku(self) -> List[Dict]:
+        damga = self.damga()
+        if damga != self._son_damga:
+            self._onbellege_al(damga, self._dosyadan_oku() if damga else [])
+        return self._son_liste
+
+    @contextmanager
+    def _kilitli(self):
+        """Süreç içi ve (flock ile) süreçler arası yazma kilidi"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            os.makedirs(os.path.dirname(self.dosya), exist_ok=True)
+            with open(self.dosya + '.lock', 'w') as kilit:
+                fcntl.flock(kilit, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(kilit, fcntl.LOCK_UN)
+
+    def _yaz(self, duraklar: List[Dict]):
+        """Atomic write: önce geçici dosyaya yaz, sonra taşı"""
+        try:
+            os.makedirs(os.path.dirname(self.dosya), exist_ok=True)
+            # Geçici dosya adı süreç/thread'e özel; worker'lar aynı .tmp'yi ezmesin
+            temp_file = f'{self.dosya}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(duraklar, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())  # Disk'e yazıldığından emin ol
+            os.replace(temp_file, self.dosya)
+        except Exception as e:
+            print(f"Dosya kaydetme hatası: {e}")
+            raise
+
+    def kaydet(self, duraklar: List[Dict]):
+        with self._kilitli():
+            self._yaz(duraklar)
+            self._onbellege_al(self.damga(), duraklar)
+
+    def ekle(self, alanlar: Dict) -> Dict:
+        return self.toplu_ekle([alanlar])[0]
+
+    def toplu_ekle(self, alanlar_listesi: List[Dict]) -> List[Dict]:
+        with self._kilitli():
+            duraklar = self.oku()
+            ilk_id = self._ids.al(len(alanlar_listesi))
+            yeniler = [{'id': ilk_id + i, **alanlar} for i, alanlar in enumerate(alanlar_listesi)]
+            duraklar = duraklar + yeniler
+            try:
+                self._yaz(duraklar)
+            except Exception:
+                # Yazılamayan id'ler yanmasın; bir sonraki ekleme aynı id'leri alır
+                self._ids.geri_ver(ilk_id, len(alanlar_listesi))
+                raise
+            self._onbellege_al(self.damga(), duraklar, self._ids)
+            return yeniler
+
+    def guncelle(self, durak_id: int, fn: Guncelleyici) -> Optional[Dict]:
+        with self._kilitli():
+            duraklar = self.oku()
+            eski = self._id_indeksi.get(durak_id)
+            if eski is None:
+                return None
+            yeni = fn(eski)
+            duraklar = [yeni if d is eski else d for d in duraklar]
+            self._yaz(duraklar)
+            self._onbellege_al(self.damga(), duraklar, self._ids)
+            return yeni
+
+    def sil(self, durak_id: int) -> bool:
+        with self._kilitli():
+            duraklar = self.oku()
+            if durak_id not in self._id_indeksi:
+                return False
+            kalanlar = [d for d in duraklar if d.get('id') != durak_id]
+            self._yaz(kalanlar)
+            self._ids.silindi(durak_id, kalanlar)
+            self._onbellege_al(self.damga(), kalanlar, self._ids)
+            return True
+
+
+# SQLite: sorgular sabit metinler; sqlite3 modülü bunları bağlantı başına
+# derlenmiş (prepared) olarak önbellekte tutar
+_SQL_SEMA = """
+CREATE TABLE IF NOT EXISTS duraklar (
+    id INTEGER PRIMARY KEY,
+    favori INTEGER NOT NULL DEFAULT 0,
+    veri TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS duraklar_favori ON duraklar (favori);
+CREATE TABLE IF NOT EXISTS meta (
+    anahtar TEXT PRIMARY KEY,
+    deger INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (anahtar, deger) VALUES ('surum', 0);
+"""
+_SQL_HEPSI = 'SELECT veri FROM duraklar ORDER BY id'
+_SQL_GETIR = 'SELECT veri FROM duraklar WHERE id = ?'
+# id INTEGER PRIMARY KEY (rowid): MAX(id) tablo taranmadan B-tree'nin sonundan okunur
+_SQL_MAX_ID = 'SELECT COALESCE(MAX(id), 0) FROM duraklar'
+_SQL_EKLE = 'INSERT INTO duraklar (id, favori, veri) VALUES (?, ?, ?)'
+_SQL_GUNCELLE = 'UPDATE duraklar SET favori = ?, veri = ? WHERE id = ?'
+_SQL_SIL = 'DELETE FROM duraklar WHERE id = ?'
+_SQL_TEMIZLE = 'DELETE FROM duraklar'
+_SQL_SURUM = "SELECT deger FROM meta WHERE anahtar = 'surum'"
+_SQL_SURUM_ARTIR = "UPDATE meta SET deger = deger + 1 WHERE anahtar = 'surum'"
+_SQL_META_GETIR = 'SELECT deger FROM meta WHERE anahtar = ?'
+_SQL_META_YAZ = 'INSERT OR REPLACE INTO meta (anahtar, deger) VALUES (?, ?)'
+
+
+class SqliteDepolama:
+    """
+    SQLite (WAL) depolama
+
+    Her durak bir satır: id (PRIMARY KEY), favori (indeksli) ve durağın JSON'u.
+    Yazmalar BEGIN IMMEDIATE ile yapılır; eşzamanlı yazanlar busy timeout
+    kadar sırayla bekler. meta tablosundaki 'surum' her yazmada artar ve
+    diğer süreçlerin önbelleklerini geçersiz kılmak için kullanılır.
+    """
+
+    ad = 'sqlite'
+
+    def __init__(self, yol: str, json_dosya: Optional[str] = None, busy_timeout: float = 30.0):
+        """
+        Args:
+            yol (str): Veritabanı dosyası
+            json_dosya (str): Verilirse ve daha önce yapılmadıysa bir kez içe aktarılır
+            busy_timeout (float): Kilitli veritabanında bekleme süresi (saniye)
+        """
+        self.yol = yol
+        self.busy_timeout = busy_timeout
+        self._yerel = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(yol)), exist_ok=True)
+        db = self._baglanti()
+        db.execute('PRAGMA journal_mode=WAL')
+        db.executescript(_SQL_SEMA)
+        if json_dosya:
+            self.jsondan_aktar(json_dosya)
+
+    def _baglanti(self) -> sqlite3.Connection:
+        """Thread (ve fork sonrası süreç) başına bir bağlantı"""
+        db = getattr(self._yerel, 'db', None)
+        if db is None or self._yerel.pid != os.getpid():
+            db = sqlite3.connect(self.yol, timeout=self.busy_timeout, isolation_level=None)
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.execute(f'PRAGMA busy_timeout={int(self.busy_timeout * 1000)}')
+            self._yerel.db = db
+            self._yerel.pid = os.getpid()
+        return db
+
+    @contextmanager
+    def _yazma(self):
+        """Tek yazma transaction'ı; başarılı olursa sürümü artır"""
+        db = self._baglanti()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+            db.execute(_SQL_SURUM_ARTIR)
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+
+    @staticmethod
+    def _satir(durak: Dict):
+        return (durak.get('id'), 1 if durak.get('favori') else 0,
+                json.dumps(durak, ensure_ascii=False))
+
+    def jsondan_aktar(self, json_dosya: str) -> int:
+        """
+        duraklar.json'u bir kez içe aktar (meta 'json_aktarildi' ile işaretlenir)
+
+        Returns:
+            int: Aktarılan durak sayısı (daha önce aktarıldıysa 0)
+        """
+        with self._yazma() as db:
+            if db.execute(_SQL_META_GETIR, ('json_aktarildi',)).fetchone():
+                return 0
+            duraklar = JsonDepolama(json_dosya).oku() if os.path.exists(json_dosya) else []
+            gorulen = {satir[0] for satir in db.execute('SELECT id FROM duraklar')}
+            gecerli, gecersiz, tekrarlar = [], [], []
+            for durak in duraklar:
+                durak_id = durak.get('id')
+                if not isinstance(durak_id, int):
+                    gecersiz.append(durak_id)
+                elif durak_id in gorulen:
+                    tekrarlar.append(durak_id)
+                else:
+                    gorulen.add(durak_id)
+                    gecerli.append(durak)
+            db.executemany(
+                'INSERT OR IGNORE INTO duraklar (id, favori, veri) VALUES (?, ?, ?)',
+                [self._satir(d) for d in gecerli])
+            db.execute(_SQL_META_YAZ, ('json_aktarildi', 1))
+        if gecerli:
+            print(f"📦 {len(gecerli)} durak {json_dosya} dosyasından SQLite'a aktarıldı")
+        if gecersiz:
+            print(f"⚠️ id'si eksik veya sayı olmayan {len(gecersiz)} durak aktarılmadı: {gecersiz}")
+        if tekrarlar:
+            print(f"⚠️ id'si tekrarlanan {len(tekrarlar)} durak aktarılmadı: {tekrarlar}")
+        return len(gecerli)
+
+    def damga(self) -> Optional[str]:
+        surum = self._baglanti().execute(_SQL_SURUM).fetchone()[0]
+        return f'sqlite-{surum:x}'
+
+    def oku(self) -> List[Dict]:
+        return [json.loads(veri) for (veri,) in self._baglanti().execute(_SQL_HEPSI)]
+
+    def kaydet(self, duraklar: List[Dict]):
+        with self._yazma() as db:
+            db.execute(_SQL_TEMIZLE)
+            db.executemany(_SQL_EKLE, [self._satir(d) for d in duraklar])
+
+    def ekle(self, alanlar: Dict) -> Dict:
+        with self._yazma() as db:
+            durak = {'id': db.execute(_SQL_MAX_ID).fetchone()[0] + 1, **alanlar}
+            db.execute(_SQL_EKLE, self._satir(durak))
+            return durak
+
+    def toplu_ekle(self, alanlar_listesi: List[Dict]) -> List[Dict]:
+        with self._yazma() as db:
+            ilk_id = db.execute(_SQL_MAX_ID).fetchone()[0] + 1
+            yeniler = [{'id': ilk_id + i, **alanlar} for i, alanlar in enumerate(alanlar_listesi)]
+            db.executemany(_SQL_EKLE, [self._satir(d) for d in yeniler])
+            return yeniler
+
+    def guncelle(self, durak_id: int, fn: Guncelleyici) -> Optional[Dict]:
+        with self._yazma() as db:
+            satir = db.execute(_SQL_GETIR, (durak_id,)).fetchone()
+            if satir is None:
+                return None
+            yeni = fn(json.loads(satir[0]))
+            _, favori, veri = self._satir(yeni)
+            db.execute(_SQL_GUNCELLE, (favori, veri, durak_id))
+            return yeni
+
+    def sil(self, durak_id: int) -> bool:
+        with self._yazma() as db:
+            return db.execute(_SQL_SIL, (durak_id,)).rowcount > 0
+
+
+class DurakDeposu:
+    """
+    Depolama önünde bellek içi durak listesi
+
+    Okumalar kilit almadan bellekteki listeden yapılır; her okumada
+    depolamanın damgasına (JSON: mtime/boyut, SQLite: sürüm sayacı) bakılır,
+    başka bir süreç değiştirdiyse liste yeniden yüklenir. Yazmalar hemen
+    depolamaya gider; bellekteki liste bir sonraki okumada tazelenir.
+    """
+
+    def __init__(self, depolama):
+        self.depolama = depolama
+        self._duraklar: List[Dict] = []
+        self._id_indeksi: Dict[int, Dict] = {}
+        self._palina_indeksi: Dict[str, List[Dict]] = {}
+        self._damga: Optional[str] = None
+        self._lock = threading.RLock()
+        self._sayaclar = {'okuma': 0, 'yukleme': 0, 'yazma': 0}
+
+    def _yerlestir(self, duraklar: List[Dict], damga: Optional[str]):
+        """Listeyi ve indeksleri tek seferde değiştir (okuyucular kilit almaz)"""
+        palina_indeksi: Dict[str, List[Dict]] = {}
+        for d in duraklar:
+            palina = palina_numarasi(d.get('url'))
+            if palina is not None:
+                palina_indeksi.setdefault(palina, []).append(d)
+        self._id_indeksi = {d.get('id'): d for d in duraklar}
+        self._palina_indeksi = palina_indeksi
+        self._duraklar = duraklar
+        self._damga = damga
+
+    def _guncel_tut(self):
+        """Depolama bellektekinden farklıysa yeniden yükle"""
+        damga = self.depolama.damga()
+        if damga == self._damga:
+            return
+        with self._lock:
+            damga = self.depolama.damga()
+            if damga != self._damga:
+                self._yerlestir(self.depolama.oku() if damga else [], damga)
+                self._sayaclar['yukleme'] += 1
+
+    def _yazildi(self):
+        self._sayaclar['yazma'] += 1
+        self._guncel_tut()
+
+    # Okuma
+
+    def listele(self) -> List[Dict]:
+        """Durakların kopyası (çağıran değiştirebilir)"""
+        self._guncel_tut()
+        self._sayaclar['okuma'] += 1
+        return [dict(d) for d in self._duraklar]
+
+    def getir(self, durak_id: int) -> Optional[Dict]:
+        """id ile durak (kopya) veya None"""
+        self._guncel_tut()
+        self._sayaclar['okuma'] += 1
+        durak = self._id_indeksi.get(durak_id)
+        return dict(durak) if durak is not None else None
+
+    def palina_ile_bul(self, palina: str) -> List[Dict]:
+        """Bu palina numarasını takip eden duraklar (kopya); yoksa boş liste"""
+        self._guncel_tut()
+        self._sayaclar['okuma'] += 1
+        return [dict(d) for d in self._palina_indeksi.get(str(palina).strip(), [])]
+
+    def surum(self) -> str:
+        """Durak listesinin sürümü (boş depo için '0')"""
+        self._guncel_tut()
+        return self._damga or '0'
+
+    # Yazma (hepsi depolamaya hemen yazılır)
+
+    def kaydet(self, duraklar: List[Dict]):
+        """Tüm listeyi değiştir"""
+        with self._lock:
+            self.depolama.kaydet([dict(d) for d in duraklar])
+            self._yazildi()
+
+    def ekle(self, alanlar: Dict) -> Dict:
+        """Yeni durak ekle; id mevcut en büyük id + 1"""
+        with self._lock:
+            durak = self.depolama.ekle(alanlar)
+            self._yazildi()
+            return dict(durak)
+
+    def toplu_ekle(self, alanlar_listesi: List[Dict]) -> List[Dict]:
+        """Birden çok durağı tek yazmada ekle; id'ler sırayla verilir"""
+        if not alanlar_listesi:
+            return []
+        with self._lock:
+            yeniler = self.depolama.toplu_ekle(alanlar_listesi)
+            self._yazildi()
+            return [dict(d) for d in yeniler]
+
+    def guncelle(self, durak_id: int, alanlar: Dict) -> Optional[Dict]:
+        """Durağın verilen alanlarını güncelle; durak yoksa None"""
+        with self._lock:
+            durak = self.depolama.guncelle(durak_id, lambda eski: {**eski, **alanlar})
+            if durak is None:
+                return None
+            self._yazildi()
+            return dict(durak)
+
+    def favori_degistir(self, durak_id: int) -> Optional[bool]:
+        """Favori durumunu tersine çevir; yeni durumu (durak yoksa None) döndür"""
+        with self._lock:
+            durak = self.depolama.guncelle(
+                durak_id, lambda eski: {**eski, 'favori': not eski.get('favori', False)})
+            if durak is None:
+                return None
+            self._yazildi()
+            return durak['favori']
+
+    def sil(self, durak_id: int) -> bool:
+        """Durağı sil; silinecek durak yoksa False"""
+        with self._lock:
+            silindi = self.depolama.sil(durak_id)
+            if silindi:
+                self._yazildi()
+            return silindi
+
+    def istatistik(self) -> Dict:
+        return {
+            'backend': self.depolama.ad,
+            'durak_sayisi': len(self._duraklar),
+            'palina_sayisi': len(self._palina_indeksi),
+            **self._sayaclar
+        }
+
+
+def depo_olustur(storage: str = STORAGE, json_dosya: str = os.path.join(DATA_DIR, 'duraklar.json'),
+                 sqlite_dosya: str = SQLITE_FILE) -> DurakDeposu:
+    """ATM_STORAGE ayarına göre depo oluştur (sqlite: JSON bir kez içe aktarılır)"""
+    if storage == 'sqlite':
+        return DurakDeposu(SqliteDepolama(sqlite_dosya, json_dosya))
+    if storage != 'json':
+        print(f"Uyarı: bilinmeyen ATM_STORAGE '{storage}', json kullanılıyor")
+    return DurakDeposu(JsonDepolama(json_dosya))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="duraklar.json'u SQLite'a aktar")
+    parser.add_argument('--json', default=os.path.join(DATA_DIR, 'duraklar.json'), help='Kaynak JSON dosyası')
+    parser.add_argument('--sqlite', default=SQLITE_FILE, help='Hedef SQLite veritabanı')
+    args = parser.parse_args(argv)
+
+    depolama = SqliteDepolama(args.sqlite)
+    aktarilan = depolama.jsondan_aktar(args.json)
+    toplam = len(depolama.oku())
+    if not aktarilan:
+        print(f"Aktarılacak yeni kayıt yok (veritabanında {toplam} durak)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,335 @@
+"""
+ATM Messina gecikme takibi
+Ardışık çekimlerde "Tempo Reale" tahminlerini aynı seferin "Schedulato"
+(tarifeli) saatiyle eşleştirir ve sefer başına gecikmeyi hesaplar
+
+Eşleştirme (durak + hat + varış yeri başına):
+    - Önceki çekimde tarifeli olan bir saat kaybolurken yeni bir gerçek zamanlı
+      tahmin belirirse ikisi aynı seferdir (gecikme = tahmin - tarife)
+    - Sonraki çekimlerde gerçek zamanlı tahmin, önceki tahminine en yakın
+      seferle eşleşir (tahmin çekimden çekime kayabilir)
+    - Sefer listeden düşünce (otobüs geçti) son gecikmesi hattın dağılımına eklenir
+
+Hat başına dağılım son ATM_DELAY_WINDOW_HOURS saatlik, saatlik kovalara bölünmüş
+dakikalık histogramlardır: sınırlı bellek, dakika çözünürlüğünde kesin p50/p90.
+Takip süreç içidir; birden fazla worker varsa her biri kendi çektiği durakları görür.
+"""
+
+import os
+import threading
+import time
+from array import array
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from atm_depo import palina_numarasi
+
+GECIKME_ENABLED = os.environ.get('ATM_DELAY_TRACKING', 'False').lower() == 'true'
+# Dağılımın kapsadığı süre (saat); saatlik kovalarla kayar
+GECIKME_PENCERE_SAAT = int(os.environ.get('ATM_DELAY_WINDOW_HOURS', 24))
+# Eşleştirmede kabul edilen en büyük gecikme / erken gelme (dakika)
+GECIKME_MAX = int(os.environ.get('ATM_DELAY_MAX', 60))
+GECIKME_MAX_ERKEN = int(os.environ.get('ATM_DELAY_MAX_EARLY', 10))
+# Bir seferin tahmini iki çekim arasında en fazla bu kadar kayabilir (dakika)
+GECIKME_TOLERANS = int(os.environ.get('ATM_DELAY_MATCH_TOLERANCE', 10))
+# Bu kadar dakika güncellenmeyen durak/hat grupları unutulur
+_GRUP_ZAMAN_ASIMI = 120
+
+
+def mutlak_dakika(saat: Optional[str], zaman: float,
+                  yerel: Optional[time.struct_time] = None) -> Optional[int]:
+    """
+    '18:05' saatini gözlem zamanına göre mutlak dakikaya (unix dakika) çevir
+
+    Gece yarısını geçen tahminler (23:58'de görülen 00:05) ertesi güne sayılır.
+    yerel: time.localtime(zaman) (aynı çekimdeki saatler için bir kez hesaplanır)
+    """
+    try:
+        saat_str, dakika_str = (saat or '').split(':')
+        gun_dakikasi = int(saat_str) * 60 + int(dakika_str)
+    except ValueError:
+        return None
+    yerel = yerel or time.localtime(zaman)
+    simdi = yerel.tm_hour * 60 + yerel.tm_min
+    gece_yarisi = int(zaman // 60) - simdi
+    if gun_dakikasi - simdi < -720:
+        gun_dakikasi += 1440
+    elif gun_dakikasi - simdi > 720:
+        gun_dakikasi -= 1440
+    return gece_yarisi + gun_dakikasi
+
+
+class GecikmeDagilimi:
+    """
+    Kayan pencereli gecikme dağılımı: saatlik kovalarda dakikalık histogram
+
+    Bellek (pencere_saat x histogram genişliği) ile sınırlıdır; gecikmeler
+    dakika çözünürlüğünde olduğu için yüzdelikler kesindir.
+    """
+
+    def __init__(self, pencere_saat: int = GECIKME_PENCERE_SAAT,
+                 en_erken: int = GECIKME_MAX_ERKEN, en_gec: int = GECIKME_MAX):
+        self.pencere_saat = pencere_saat
+        self.en_erken = en_erken
+        self.genislik = en_erken + en_gec + 1
+        # (saat indeksi, histogram) - en eski solda
+        self._kovalar: deque = deque()
+
+    def _kova(self, saat_indeksi: int) -> array:
+        if not self._kovalar or self._kovalar[-1][0] < saat_indeksi:
+            self._kovalar.append((saat_indeksi, array('I', bytes(4 * self.genislik))))
+        self._budama(saat_indeksi)
+        return self._kovalar[-1][1]
+
+    def _budama(self, saat_indeksi: int):
+        while self._kovalar and self._kovalar[0][0] <= saat_indeksi - self.pencere_saat:
+            self._kovalar.popleft()
+
+    def ekle(self, gecikme: int, zaman: float):
+        gecikme = min(max(gecikme, -self.en_erken), self.genislik - self.en_erken - 1)
+        self._kova(int(zaman // 3600))[gecikme + self.en_erken] += 1
+
+    def histogram(self, zaman: float) -> List[int]:
+        self._budama(int(zaman // 3600))
+        toplam = [0] * self.genislik
+        for _, kova in self._kovalar:
+            for i, adet in enumerate(kova):
+                if adet:
+                    toplam[i] += adet
+        return toplam
+
+    def ozet(self, zaman: float) -> Dict:
+        """adet, ortalama, p50, p90, zamaninda_orani (-1..+3 dakika)"""
+        histogram = self.histogram(zaman)
+        adet = sum(histogram)
+        if not adet:
+            return {'adet': 0, 'ortalama': None, 'p50': None, 'p90': None, 'zamaninda_orani': None}
+
+        def yuzdelik(oran: float) -> int:
+            hedef = max(1, -(-oran * adet // 1))
+            kumulatif = 0
+            for i, sayi in enumerate(histogram):
+                kumulatif += sayi
+                if kumulatif >= hedef:
+                    return i - self.en_erken
+            return self.genislik - 1 - self.en_erken
+
+        toplam = sum((i - self.en_erken) * sayi for i, sayi in enumerate(histogram))
+        zamaninda = sum(histogram[max(0, self.en_erken - 1):self.en_erken + 4])
+        return {
+            'adet': adet,
+            'ortalama': round(toplam / adet, 2),
+            'p50': yuzdelik(0.5),
+            'p90': yuzdelik(0.9),
+            'zamaninda_orani': round(zamaninda / adet, 3)
+        }
+
+
+class _Sefer:
+    __slots__ = ('tarife', 'tahmin', 'ilk_gorulme', 'son_gorulme')
+
+    def __init__(self, tarife: int, tahmin: int, zaman: float):
+        self.tarife = tarife
+        self.tahmin = tahmin
+        self.ilk_gorulme = zaman
+        self.son_gorulme = zaman
+
+    @property
+    def gecikme(self) -> int:
+        return self.tahmin - self.tarife
+
+
+class _Grup:
+    """Bir durak + hat + varış yeri için tarifeli saatler ve izlenen seferler"""
+
+    __slots__ = ('planli', 'kaybolan', 'seferler', 'son_guncelleme')
+
+    def __init__(self):
+        # Son çekimdeki tarifeli saatler (mutlak dakika)
+        self.planli: set = set()
+        # Listeden düşmüş, henüz bir tahminle eşleşmemiş tarifeli saat -> düştüğü dakika
+        self.kaybolan: Dict[int, int] = {}
+        self.seferler: List[_Sefer] = []
+        self.son_guncelleme = 0.0
+
+
+class GecikmeTakipcisi:
+    """Durak başına sefer eşleştirmesi ve hat başına kayan gecikme dağılımı"""
+
+    def __init__(self, pencere_saat: int = GECIKME_PENCERE_SAAT, tolerans: int = GECIKME_TOLERANS,
+                 en_erken: int = GECIKME_MAX_ERKEN, en_gec: int = GECIKME_MAX):
+        """
+        Args:
+            pencere_saat (int): Hat dağılımlarının kapsadığı süre (saat)
+            tolerans (int): Bir tahminin iki çekim arasında kayabileceği en fazla dakika
+            en_erken (int): Eşleştirmede kabul edilen en fazla erken gelme (dakika)
+            en_gec (int): Eşleştirmede kabul edilen en fazla gecikme (dakika)
+        """
+        self.pencere_saat = pencere_saat
+        self.tolerans = tolerans
+        self.en_erken = en_erken
+        self.en_gec = en_gec
+        # (palina, hat, varis) -> _Grup
+        self._gruplar: Dict[Tuple[str, str, str], _Grup] = {}
+        # palina -> o durağın grup anahtarları
+        self._palina_gruplari: Dict[str, set] = {}
+        self._dagilimlar: Dict[str, GecikmeDagilimi] = {}
+        self._lock = threading.Lock()
+        self._son_temizlik = 0.0
+        self._sayaclar = {'cekim': 0, 'eslesen': 0, 'eslesmeyen': 0, 'biten': 0}
+
+    def guncelle(self, url: str, otobusler: List[Dict], zaman: Optional[float] = None):
+        """Bir durağın yeni çekim sonucunu işle"""
+        palina = palina_numarasi(url)
+        if palina is None:
+            return
+        zaman = zaman if zaman is not None else time.time()
+
+        # (hat, varis) -> (tarifeli saatler, gerçek zamanlı tahminler)
+        gorulen: Dict[Tuple[str, str], Tuple[set, List[int]]] = {}
+        yerel = time.localtime(zaman)
+        for otobus in otobusler:
+            dakika = mutlak_dakika(otobus.get('saat'), zaman, yerel)
+            if dakika is None:
+                continue
+            planli, gercek = gorulen.setdefault((otobus.get('hat') or '', otobus.get('varis') or ''), (set(), []))
+            if otobus.get('tip') == 'Tempo Reale':
+                gercek.append(dakika)
+            else:
+                planli.add(dakika)
+
+        with self._lock:
+            self._sayaclar['cekim'] += 1
+            # Bu çekimde hiç görünmeyen hat/varış gruplarının seferleri de bitmiştir
+            durak_gruplari = self._palina_gruplari.setdefault(palina, set())
+            for anahtar in durak_gruplari | {(palina,) + k for k in gorulen}:
+                planli, gercek = gorulen.get(anahtar[1:], (set(), []))
+                grup = self._gruplar.get(anahtar)
+                if grup is None:
+                    grup = self._gruplar[anahtar] = _Grup()
+                    durak_gruplari.add(anahtar)
+                self._grubu_guncelle(anahtar[1], grup, planli, sorted(gercek), zaman)
+                if not grup.seferler and not grup.planli and not grup.kaybolan:
+                    self._grubu_sil(anahtar)
+            if zaman - self._son_temizlik > 600:
+                self._temizle(zaman)
+
+    def _grubu_guncelle(self, hat: str, grup: _Grup, planli: set, gercek: List[int], zaman: float):
+        simdi = int(zaman // 60)
+        for tarife in grup.planli - planli:
+            grup.kaybolan[tarife] = simdi
+        # Eşleşmeden bir saatten uzun kalan kaybolmuş tarifeler unutulur
+        grup.kaybolan = {t: d for t, d in grup.kaybolan.items() if simdi - d <= 60 and t not in planli}
+        grup.planli = planli
+        grup.son_guncelleme = zaman
+
+        # 1) Tahminleri, önceki tahmini en yakın olan izlenen seferlerle eşleştir
+        kalan_seferler = list(grup.seferler)
+        yeni_tahminler = []
+        for tahmin in gercek:
+            aday = min(kalan_seferler, key=lambda s: abs(s.tahmin - tahmin), default=None)
+            if aday is not None and abs(aday.tahmin - tahmin) <= self.tolerans:
+                aday.tahmin = tahmin
+                aday.son_gorulme = zaman
+                kalan_seferler.remove(aday)
+            else:
+                yeni_tahminler.append(tahmin)
+
+        # 2) Listede olmayan seferler bitti: son gecikme hattın dağılımına
+        for sefer in kalan_seferler:
+            grup.seferler.remove(sefer)
+            self._dagilim(hat).ekle(sefer.gecikme, zaman)
+            self._sayaclar['biten'] += 1
+
+        # 3) Yeni beliren tahminleri listeden düşen tarifeli saatlerle eşleştir
+        for tahmin in yeni_tahminler:
+            adaylar = [t for t in grup.kaybolan if -self.en_erken <= tahmin - t <= self.en_gec]
+            if not adaylar:
+                self._sayaclar['eslesmeyen'] += 1
+                continue
+            # Önce bu çekimde düşenler (tarifeli -> gerçek zamanlı geçişi), sonra en yakın saat
+            tarife = min(adaylar, key=lambda t: (simdi - grup.kaybolan[t] > 1, abs(tahmin - t)))
+            del grup.kaybolan[tarife]
+            grup.seferler.append(_Sefer(tarife, tahmin, zaman))
+            self._sayaclar['eslesen'] += 1
+
+    def _grubu_sil(self, anahtar: Tuple[str, str, str]):
+        del self._gruplar[anahtar]
+        durak_gruplari = self._palina_gruplari.get(anahtar[0])
+        if durak_gruplari is not None:
+            durak_gruplari.discard(anahtar)
+            if not durak_gruplari:
+                del self._palina_gruplari[anahtar[0]]
+
+    def _dagilim(self, hat: str) -> GecikmeDagilimi:
+        dagilim = self._dagilimlar.get(hat)
+        if dagilim is None:
+            dagilim = self._dagilimlar[hat] = GecikmeDagilimi(self.pencere_saat, self.en_erken, self.en_gec)
+        return dagilim
+
+    def _temizle(self, zaman: float):
+        """Uzun süredir çekilmeyen durakların gruplarını kapat (seferleri dağılıma eklenir)"""
+        self._son_temizlik = zaman
+        for anahtar, grup in list(self._gruplar.items()):
+            if zaman - grup.son_guncelleme > _GRUP_ZAMAN_ASIMI * 60:
+                for sefer in grup.seferler:
+                    self._dagilim(anahtar[1]).ekle(sefer.gecikme, grup.son_guncelleme)
+                    self._sayaclar['biten'] += 1
+                self._grubu_sil(anahtar)
+
+    def hatlar(self, hat: Optional[str] = None) -> List[Dict]:
+        """Hat başına kayan pencere gecikme özeti ve izlenen sefer sayısı"""
+        simdi = time.time()
+        with self._lock:
+            aktif: Dict[str, int] = {}
+            for (_, grup_hat, _), grup in self._gruplar.items():
+                aktif[grup_hat] = aktif.get(grup_hat, 0) + len(grup.seferler)
+            adlar = sorted(set(self._dagilimlar) | {h for h, n in aktif.items() if n})
+            if hat is not None:
+                adlar = [h for h in adlar if h == hat]
+            return [{
+                'hat': ad,
+                **(self._dagilimlar[ad].ozet(simdi) if ad in self._dagilimlar else GecikmeDagilimi().ozet(simdi)),
+                'aktif_sefer': aktif.get(ad, 0)
+            } for ad in adlar]
+
+    def seferler(self, palina: Optional[str] = None, hat: Optional[str] = None) -> List[Dict]:
+        """İzlenen (henüz durağa gelmemiş) seferler ve anlık gecikmeleri"""
+        with self._lock:
+            sonuc = []
+            for (grup_palina, grup_hat, varis), grup in self._gruplar.items():
+                if (palina is not None and grup_palina != palina) or (hat is not None and grup_hat != hat):
+                    continue
+                for sefer in grup.seferler:
+                    sonuc.append({
+                        'palina': grup_palina,
+                        'hat': grup_hat,
+                        'varis': varis,
+                        'tarife': time.strftime('%H:%M', time.localtime(sefer.tarife * 60)),
+                        'tahmin': time.strftime('%H:%M', time.localtime(sefer.tahmin * 60)),
+                        'gecikme': sefer.gecikme
+                    })
+            return sorted(sonuc, key=lambda s: (s['palina'], s['hat'], s['tahmin']))
+
+    def istatistik(self) -> Dict:
+        with self._lock:
+            return {
+                'grup_sayisi': len(self._gruplar),
+                'hat_sayisi': len(self._dagilimlar),
+                'aktif_sefer': sum(len(g.seferler) for g in self._gruplar.values()),
+                **self._sayaclar
+            }
+
+
+# Senkron ve async fetch yollarının paylaştığı takipçi (ATM_DELAY_TRACKING=true değilse None)
+gecikme_takipcisi = GecikmeTakipcisi() if GECIKME_ENABLED else None
+
+
+def gecikmeyi_isle(url: str, otobusler: List[Dict]):
+    """Fetch yollarından çağrılır; takip hatası durak yanıtını bozmaz"""
+    if gecikme_takipcisi is None:
+        return
+    try:
+        gecikme_takipcisi.guncelle(url, otobusler)
+    except Exception as e:
+        print(f"Gecikme takip hatası ({url}): {e}")
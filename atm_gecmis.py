@@ -0,0 +1,565 @@
+"""
+ATM Messina varış geçmişi
+Parse edilen her varışı (palina, hat, varış yeri, saat, tip, gözlem zamanı)
+günlük bölümlere, sütun başına bir array olacak şekilde kaydeder
+
+Disk düzeni (ATM_HISTORY_DIR, varsayılan data/gecmis):
+    dizgiler.jsonl   - intern edilmiş hat/varış metinleri (satır numarası = indeks)
+    YYYY-MM-DD.bin   - bir günün satırları; her flush dosyaya bir blok ekler
+                       (JSON başlık satırı + her sütunun ham byte'ları)
+    .lock            - worker'lar arası yazma kilidi (flock)
+"""
+
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from atm_depo import palina_numarasi
+
+GECMIS_ENABLED = os.environ.get('ATM_HISTORY', 'False').lower() == 'true'
+GECMIS_DIR = os.environ.get('ATM_HISTORY_DIR', os.path.join(os.path.dirname(__file__), 'data', 'gecmis'))
+# Bu kadar günden eski bölümler silinir
+GECMIS_SAKLAMA_GUN = int(os.environ.get('ATM_HISTORY_RETENTION_DAYS', 90))
+# Bu kadar günden eski bölümler seyreltilir: her tahmini varış için son gözlem kalır
+GECMIS_HAM_GUN = int(os.environ.get('ATM_HISTORY_RAW_DAYS', 7))
+# Aynı varış bu süreden sık gözlenirse tekrar yazılmaz (saniye)
+GECMIS_MIN_ARALIK = float(os.environ.get('ATM_HISTORY_MIN_INTERVAL', 60))
+# Bekleyen satırlar en fazla bu kadar saniyede bir diske eklenir
+GECMIS_FLUSH_SN = float(os.environ.get('ATM_HISTORY_FLUSH', 30))
+# Bellekte tutulan (sorgu için yüklenmiş) en fazla gün bölümü
+GECMIS_ONBELLEK_GUN = int(os.environ.get('ATM_HISTORY_CACHE_DAYS', 7))
+
+# Sütunlar ve array tipleri: satır başına 15 byte
+SUTUNLAR = (
+    ('gozlem', 'I'),   # gözlem zamanı (unix saniye)
+    ('palina', 'I'),   # durak (palina numarası)
+    ('hat', 'H'),      # hat - dizgi indeksi
+    ('varis', 'H'),    # varış yeri - dizgi indeksi
+    ('saat', 'h'),     # varış saati, gece yarısından itibaren dakika (-1: bilinmiyor)
+    ('tip', 'B'),      # 0: Schedulato, 1: Tempo Reale
+)
+TIPLER = ('Schedulato', 'Tempo Reale')
+
+
+def saat_dakika(saat: Optional[str]) -> int:
+    """'18:05' -> 1085; çözülemezse -1"""
+    try:
+        saat_str, dakika_str = (saat or '').split(':')
+        dakika = int(saat_str) * 60 + int(dakika_str)
+    except ValueError:
+        return -1
+    return dakika if 0 <= dakika < 48 * 60 else -1
+
+
+def dakika_saat(dakika: int) -> Optional[str]:
+    if dakika < 0:
+        return None
+    return f'{dakika // 60:02d}:{dakika % 60:02d}'
+
+
+def gun_adi(zaman: float) -> str:
+    return time.strftime('%Y-%m-%d', time.localtime(zaman))
+
+
+class DizgiTablosu:
+    """
+    Hat ve varış metinleri için intern tablosu
+
+    Dosya sadece sona eklenir; birden fazla worker aynı dosyayı kullandığında
+    yeni metin eklenmeden önce (kilit altında) diğerlerinin eklediği satırlar
+    okunur, böylece her metnin indeksi tüm süreçlerde aynıdır.
+    """
+
+    def __init__(self, dosya: Optional[str]):
+        self.dosya = dosya
+        self._liste: List[str] = []
+        self._indeks: Dict[str, int] = {}
+        self._okunan = 0
+        self._tazele()
+
+    def _tazele(self):
+        """Dosyaya başka süreçlerin eklediği metinleri oku"""
+        if not self.dosya or not os.path.exists(self.dosya):
+            return
+        with open(self.dosya, 'rb') as f:
+            f.seek(self._okunan)
+            for satir in f:
+                if not satir.endswith(b'\n'):
+                    break  # yazılmakta olan satır
+                self._okunan += len(satir)
+                metin = json.loads(satir)
+                self._indeks.setdefault(metin, len(self._liste))
+                self._liste.append(metin)
+
+    def intern(self, metin: str) -> int:
+        """Metnin indeksi; yoksa dosyaya ekle (çağıran yazma kilidini tutmalı)"""
+        indeks = self._indeks.get(metin)
+        if indeks is not None:
+            return indeks
+        self._tazele()
+        indeks = self._indeks.get(metin)
+        if indeks is None:
+            if len(self._liste) >= 0xFFFF:
+                raise OverflowError('Dizgi tablosu dolu')
+            if self.dosya:
+                satir = (json.dumps(metin, ensure_ascii=False) + '\n').encode('utf-8')
+                with open(self.dosya, 'ab') as f:
+                    f.write(satir)
+                self._okunan += len(satir)
+            indeks = len(self._liste)
+            self._liste.append(metin)
+            self._indeks[metin] = indeks
+        return indeks
+
+    def bul(self, metin: str) -> Optional[int]:
+        """Metin daha önce görüldüyse indeksi (yeni kayıt açmaz)"""
+        if metin not in self._indeks:
+            self._tazele()
+        return self._indeks.get(metin)
+
+    def __getitem__(self, indeks: int) -> str:
+        if indeks >= len(self._liste):
+            self._tazele()
+        return self._liste[indeks]
+
+    def __len__(self) -> int:
+        return len(self._liste)
+
+
+class Bolum:
+    """Bir günün satırları: sütun başına bir array"""
+
+    __slots__ = ('gun', 'sutunlar', 'seyrek', 'okunan', 'inode')
+
+    def __init__(self, gun: str):
+        self.gun = gun
+        self.sutunlar: Dict[str, array] = {ad: array(kod) for ad, kod in SUTUNLAR}
+        # Seyreltilmiş (downsample edilmiş) bölüm mü
+        self.seyrek = False
+        # Dosyanın okunmuş kısmı (byte) ve dosyanın inode'u (seyreltmede dosya değişir)
+        self.okunan = 0
+        self.inode: Optional[int] = None
+
+    def __len__(self) -> int:
+        return len(self.sutunlar['gozlem'])
+
+    def ekle(self, satir: Tuple[int, ...]):
+        for (ad, _), deger in zip(SUTUNLAR, satir):
+            self.sutunlar[ad].append(deger)
+
+    def satir(self, i: int) -> Tuple[int, ...]:
+        return tuple(self.sutunlar[ad][i] for ad, _ in SUTUNLAR)
+
+    def blok(self) -> bytes:
+        """Tüm satırlar tek blok olarak (başlık + sütun byte'ları)"""
+        baslik = {'satir': len(self), 'seyrek': self.seyrek, 'byteorder': sys.byteorder}
+        parcalar = [json.dumps(baslik).encode('ascii') + b'\n']
+        parcalar.extend(self.sutunlar[ad].tobytes() for ad, _ in SUTUNLAR)
+        return b''.join(parcalar)
+
+    def dosyadan_oku(self, dosya: str):
+        """Dosyada son okunan yerden sonra eklenmiş blokları oku"""
+        with open(dosya, 'rb') as f:
+            durum = os.fstat(f.fileno())
+            if durum.st_ino != self.inode or durum.st_size < self.okunan:
+                # Dosya değişmiş (seyreltildi): baştan oku
+                for ad, kod in SUTUNLAR:
+                    self.sutunlar[ad] = array(kod)
+                self.seyrek = False
+                self.okunan = 0
+                self.inode = durum.st_ino
+            f.seek(self.okunan)
+            while True:
+                baslik_satiri = f.readline()
+                if not baslik_satiri.endswith(b'\n'):
+                    break
+                baslik = json.loads(baslik_satiri)
+                n = baslik['satir']
+                sutunlar = []
+                for ad, kod in SUTUNLAR:
+                    sutun = array(kod)
+                    ham = f.read(n * sutun.itemsize)
+                    if len(ham) != n * sutun.itemsize:
+                        # Yarım kalmış blok (ör. yazarken kapanma): sonra tekrar denenir
+                        return
+                    sutun.frombytes(ham)
+                    if baslik.get('byteorder', sys.byteorder) != sys.byteorder:
+                        sutun.byteswap()
+                    sutunlar.append(sutun)
+                for (ad, _), sutun in zip(SUTUNLAR, sutunlar):
+                    self.sutunlar[ad].extend(sutun)
+                self.seyrek = self.seyrek or baslik.get('seyrek', False)
+                self.okunan = f.tell()
+
+
+class GecmisDeposu:
+    """
+    Varış geçmişi: günlük bölümler, intern edilmiş metinler, saklama süresi
+    ve seyreltme
+
+    Yeni satırlar bellekteki bekleyen bölümde birikir ve GECMIS_FLUSH_SN'de bir
+    gün dosyasına blok olarak eklenir. Sorgular gün dosyalarını (değiştikçe,
+    kaldığı yerden) okur ve henüz yazılmamış satırları da görür; böylece
+    birden fazla worker aynı dizine yazıp okuyabilir.
+    """
+
+    def __init__(self, dizin: Optional[str] = GECMIS_DIR, saklama_gun: int = GECMIS_SAKLAMA_GUN,
+                 ham_gun: int = GECMIS_HAM_GUN, min_aralik: float = GECMIS_MIN_ARALIK,
+                 flush_sn: float = GECMIS_FLUSH_SN, onbellek_gun: int = GECMIS_ONBELLEK_GUN):
+        """
+        Args:
+            dizin (str): Bölüm dosyalarının dizini (None: sadece bellekte)
+            saklama_gun (int): Bu kadar günden eski bölümler silinir
+            ham_gun (int): Bu kadar günden eski bölümler seyreltilir
+            min_aralik (float): Aynı varışın tekrar yazılması için geçmesi gereken süre
+            flush_sn (float): Bekleyen satırların diske eklenme aralığı
+            onbellek_gun (int): Bellekte tutulan en fazla gün bölümü
+        """
+        self.dizin = dizin
+        self.saklama_gun = saklama_gun
+        self.ham_gun = ham_gun
+        self.min_aralik = min_aralik
+        self.flush_sn = flush_sn
+        self.onbellek_gun = onbellek_gun
+        if dizin:
+            os.makedirs(dizin, exist_ok=True)
+        self.dizgiler = DizgiTablosu(os.path.join(dizin, 'dizgiler.jsonl') if dizin else None)
+        # Diskteki günler (dizin yoksa tüm veri burada kalır)
+        self._bolumler: 'OrderedDict[str, Bolum]' = OrderedDict()
+        # Henüz diske yazılmamış satırlar (gün -> bölüm)
+        self._bekleyen: Dict[str, Bolum] = {}
+        self._bugun: Optional[str] = None
+        # (palina, hat, varis, saat, tip) -> son yazıldığı zaman; gün değişince sıfırlanır
+        self._son_gorulme: Dict[Tuple[int, int, int, int, int], int] = {}
+        self._son_flush = time.monotonic()
+        self._lock = threading.RLock()
+        # Her bakımdan sonra çağrılır (ör. günlük analiz özetlerini hazırlamak için)
+        self.bakim_sonrasi: List[Callable[[], None]] = []
+        self._sayaclar = {'gozlem': 0, 'yazilan': 0, 'tekrar': 0, 'flush': 0,
+                          'seyreltilen_gun': 0, 'silinen_gun': 0}
+
+    def _dosya(self, gun: str) -> str:
+        return os.path.join(self.dizin, f'{gun}.bin')
+
+    @contextmanager
+    def _kilitli(self):
+        """Süreç içi ve (flock ile) süreçler arası yazma kilidi"""
+        with self._lock:
+            if fcntl is None or not self.dizin:
+                yield
+                return
+            with open(os.path.join(self.dizin, '.lock'), 'w') as kilit:
+                fcntl.flock(kilit, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(kilit, fcntl.LOCK_UN)
+
+    # Yazma
+
+    def kaydet(self, url: str, otobusler: List[Dict], zaman: Optional[float] = None) -> int:
+        """
+        Bir durak yanıtındaki varışları kaydet
+
+        Returns:
+            int: Yazılan satır sayısı (kısa süre önce aynısı yazılmış olanlar hariç)
+        """
+        palina = palina_numarasi(url)
+        if palina is None or not palina.isdigit() or not otobusler:
+            return 0
+        zaman = int(zaman if zaman is not None else time.time())
+        gun = gun_adi(zaman)
+        metinler = {o.get('hat') or '' for o in otobusler} | {o.get('varis') or '' for o in otobusler}
+        yazilan = 0
+        with self._lock:
+            if any(self.dizgiler.bul(m) is None for m in metinler):
+                with self._kilitli():
+                    for metin in metinler:
+                        self.dizgiler.intern(metin)
+            if gun != self._bugun:
+                self._gun_degisti(gun)
+            bolum = self._bekleyen.setdefault(gun, Bolum(gun))
+            for otobus in otobusler:
+                anahtar = (int(palina),
+                           self.dizgiler.bul(otobus.get('hat') or ''),
+                           self.dizgiler.bul(otobus.get('varis') or ''),
+                           saat_dakika(otobus.get('saat')),
+                           1 if otobus.get('tip') == 'Tempo Reale' else 0)
+                self._sayaclar['gozlem'] += 1
+                son = self._son_gorulme.get(anahtar)
+                if son is not None and abs(zaman - son) < self.min_aralik:
+                    self._sayaclar['tekrar'] += 1
+                    continue
+                self._son_gorulme[anahtar] = zaman
+                bolum.ekle((zaman,) + anahtar)
+                yazilan += 1
+            self._sayaclar['yazilan'] += yazilan
+        if time.monotonic() - self._son_flush >= self.flush_sn:
+            self.flush()
+        return yazilan
+
+    def _gun_degisti(self, gun: str):
+        """Yeni güne geçildi: önceki günü diske yaz, arka planda bakım başlat"""
+        ilk = self._bugun is None
+        self._bugun = gun
+        self._son_gorulme.clear()
+        if not ilk:
+            self.flush()
+        if self.dizin:
+            threading.Thread(target=self.bakim, daemon=True, name='atm-gecmis-bakim').start()
+
+    def flush(self):
+        """Bekleyen satırları ilgili gün dosyalarına blok olarak ekle"""
+        with self._lock:
+            self._son_flush = time.monotonic()
+            if not self._bekleyen:
+                return
+            bekleyen, self._bekleyen = self._bekleyen, {}
+            if not self.dizin:
+                for gun, bolum in bekleyen.items():
+                    hedef = self._bolumler.setdefault(gun, Bolum(gun))
+                    for ad, _ in SUTUNLAR:
+                        hedef.sutunlar[ad].extend(bolum.sutunlar[ad])
+                return
+            with self._kilitli():
+                for gun, bolum in bekleyen.items():
+                    try:
+                        with open(self._dosya(gun), 'ab') as f:
+                            f.write(bolum.blok())
+                        self._sayaclar['flush'] += 1
+                    except OSError as e:
+                        print(f"Geçmiş yazma hatası ({gun}): {e}")
+
+    # Bakım: seyreltme ve saklama süresi
+
+    def gunler(self) -> List[str]:
+        """Kaydı olan günler (eskiden yeniye)"""
+        with self._lock:
+            gunler = set(self._bolumler) | set(self._bekleyen)
+        if self.dizin and os.path.isdir(self.dizin):
+            gunler.update(ad[:-4] for ad in os.listdir(self.dizin) if ad.endswith('.bin'))
+        return sorted(gunler)
+
+    @staticmethod
+    def seyrelt(bolum: Bolum) -> Bolum:
+        """Her (palina, hat, varış, saat, tip) için sadece son gözlemi tutan yeni bölüm"""
+        son_indeks: Dict[Tuple[int, ...], int] = {}
+        for i in range(len(bolum)):
+            son_indeks[bolum.satir(i)[1:]] = i
+        yeni = Bolum(bolum.gun)
+        for i in sorted(son_indeks.values()):
+            yeni.ekle(bolum.satir(i))
+        yeni.seyrek = True
+        return yeni
+
+    def bakim(self, simdi: Optional[float] = None):
+        """Saklama süresini aşan günleri sil, ham süresini aşanları seyrelt"""
+        simdi = simdi if simdi is not None else time.time()
+        sinir_sil = gun_adi(simdi - self.saklama_gun * 86400)
+        sinir_seyrelt = gun_adi(simdi - self.ham_gun * 86400)
+        for gun in self.gunler():
+            if gun >= sinir_seyrelt or gun in self._bekleyen:
+                continue
+            try:
+                with self._kilitli():
+                    if gun < sinir_sil:
+                        self._bolumler.pop(gun, None)
+                        if self.dizin and os.path.exists(self._dosya(gun)):
+                            os.remove(self._dosya(gun))
+                        self._sayaclar['silinen_gun'] += 1
+                        continue
+                    bolum = self._bolum_al(gun)
+                    if bolum is None or bolum.seyrek:
+                        continue
+                    yeni = self.seyrelt(bolum)
+                    if self.dizin:
+                        gecici = f'{self._dosya(gun)}.{os.getpid()}.tmp'
+                        with open(gecici, 'wb') as f:
+                            f.write(yeni.blok())
+                        os.replace(gecici, self._dosya(gun))
+                        # Bir sonraki okumada yeni dosya baştan okunur
+                        self._bolumler.pop(gun, None)
+                    else:
+                        self._bolumler[gun] = yeni
+                    self._sayaclar['seyreltilen_gun'] += 1
+            except Exception as e:
+                print(f"Geçmiş bakım hatası ({gun}): {e}")
+        for fn in self.bakim_sonrasi:
+            try:
+                fn()
+            except Exception as e:
+                print(f"Geçmiş bakım sonrası hata: {e}")
+
+    # Okuma
+
+    def _bolum_al(self, gun: str) -> Optional[Bolum]:
+        """Günün diskteki bölümü (dosya büyüdüyse yeni blokları okuyarak) veya None"""
+        with self._lock:
+            bolum = self._bolumler.get(gun)
+            if not self.dizin:
+                return bolum
+            dosya = self._dosya(gun)
+            if not os.path.exists(dosya):
+                self._bolumler.pop(gun, None)
+                return None
+            if bolum is None:
+                bolum = Bolum(gun)
+                self._bolumler[gun] = bolum
+            self._bolumler.move_to_end(gun)
+            try:
+                durum = os.stat(dosya)
+                if durum.st_ino != bolum.inode or durum.st_size != bolum.okunan:
+                    bolum.dosyadan_oku(dosya)
+            except (OSError, ValueError) as e:
+                print(f"Geçmiş bölümü okunamadı ({gun}): {e}")
+            while len(self._bolumler) > self.onbellek_gun:
+                self._bolumler.popitem(last=False)
+            return bolum
+
+    def gun_damgasi(self, gun: str) -> Optional[Tuple[int, int]]:
+        """Gün dosyasının (boyut, mtime_ns) bilgisi; dosya yoksa None"""
+        if not self.dizin:
+            return None
+        try:
+            durum = os.stat(self._dosya(gun))
+        except OSError:
+            return None
+        return durum.st_size, durum.st_mtime_ns
+
+    def gun_sutunlari(self, gun: str) -> Dict[str, array]:
+        """
+        Günün tüm satırları (disk + bekleyen) sütun başına bir array kopyası
+
+        Kopya döner: çağıran (ör. NumPy ile) buffer'ı tutarken yeni satır
+        eklenmesi engellenmesin.
+        """
+        sonuc = {ad: array(kod) for ad, kod in SUTUNLAR}
+        with self._lock:
+            for bolum in (self._bolum_al(gun), self._bekleyen.get(gun)):
+                if bolum is not None:
+                    for ad, _ in SUTUNLAR:
+                        sonuc[ad].extend(bolum.sutunlar[ad])
+        return sonuc
+
+    def bolumler(self, baslangic: Optional[float] = None,
+                 bitis: Optional[float] = None) -> Iterator[Bolum]:
+        """
+        Zaman aralığıyla kesişen günlerin bölümleri (eskiden yeniye)
+
+        Bir gün için hem diskteki hem bekleyen bölüm dönebilir.
+        """
+        ilk = gun_adi(baslangic) if baslangic is not None else None
+        son = gun_adi(bitis) if bitis is not None else None
+        for gun in self.gunler():
+            if (ilk and gun < ilk) or (son and gun > son):
+                continue
+            with self._lock:
+                bolum = self._bolum_al(gun)
+                bekleyen = self._bekleyen.get(gun)
+            if bolum is not None:
+                yield bolum
+            if bekleyen is not None:
+                yield bekleyen
+
+    def _gun_goruntusu(self, gun: str) -> List[Tuple[Dict[str, array], int]]:
+        """
+        Günün bölümlerinin (disk + bekleyen) o anki sütunları ve satır sayısı
+
+        Kilit altında alınır: Bolum.ekle sütunları tek tek büyüttüğü için
+        kilitsiz okunan satır sayısı sütunlar arasında tutarsız olabilir.
+        Array'ler sadece büyür (yeniden okumada yenisiyle değiştirilir), bu
+        yüzden sayının altındaki indeksler kilit bırakıldıktan sonra da geçerlidir.
+        """
+        with self._lock:
+            return [(dict(bolum.sutunlar), len(bolum))
+                    for bolum in (self._bolum_al(gun), self._bekleyen.get(gun)) if bolum is not None]
+
+    def sorgula(self, palina: Optional[int] = None, hat: Optional[str] = None,
+                baslangic: Optional[float] = None, bitis: Optional[float] = None,
+                limit: int = 1000) -> List[Dict]:
+        """
+        Durak (palina), hat ve zaman aralığına göre kayıtlar (eskiden yeniye)
+
+        Returns:
+            list: En fazla limit kayıt; aralık daha fazlasını içeriyorsa en yeni limit kayıt
+        """
+        hat_indeksi = self.dizgiler.bul(hat) if hat is not None else None
+        if (hat is not None and hat_indeksi is None) or limit <= 0:
+            return []
+        ilk = gun_adi(baslangic) if baslangic is not None else None
+        son = gun_adi(bitis) if bitis is not None else None
+        # Günler yeniden eskiye gezilir; limit dolunca daha eski günler okunmaz
+        gun_satirlari: List[List[Tuple[int, ...]]] = []
+        toplam = 0
+        for gun in reversed(self.gunler()):
+            if son and gun > son:
+                continue
+            if (ilk and gun < ilk) or toplam >= limit:
+                break
+            satirlar: List[Tuple[int, ...]] = []
+            for sutunlar, n in self._gun_goruntusu(gun):
+                gozlemler, palinalar, hatlar = sutunlar['gozlem'], sutunlar['palina'], sutunlar['hat']
+                for i in range(n):
+                    gozlem = gozlemler[i]
+                    if (baslangic is not None and gozlem < baslangic) or (bitis is not None and gozlem > bitis):
+                        continue
+                    if palina is not None and palinalar[i] != palina:
+                        continue
+                    if hat_indeksi is not None and hatlar[i] != hat_indeksi:
+                        continue
+                    satirlar.append(tuple(sutunlar[ad][i] for ad, _ in SUTUNLAR))
+            # Bir gün içinde worker'ların blokları iç içe olabilir: gün kendi içinde sıralanır
+            satirlar.sort(key=lambda r: r[0])
+            gun_satirlari.append(satirlar)
+            toplam += len(satirlar)
+        satirlar = [r for gun in reversed(gun_satirlari) for r in gun]
+        return [{
+            'gozlem': datetime.fromtimestamp(r[0]).isoformat(),
+            'palina': r[1],
+            'hat': self.dizgiler[r[2]],
+            'varis': self.dizgiler[r[3]],
+            'saat': dakika_saat(r[4]),
+            'tip': TIPLER[r[5]]
+        } for r in satirlar[-limit:]]
+
+    def istatistik(self) -> Dict:
+        with self._lock:
+            return {
+                'dizin': self.dizin,
+                'bellekteki_gun': len(self._bolumler),
+                'bellekteki_satir': sum(len(b) for b in self._bolumler.values()),
+                'bekleyen_satir': sum(len(b) for b in self._bekleyen.values()),
+                'dizgi_sayisi': len(self.dizgiler),
+                **self._sayaclar
+            }
+
+
+# Senkron ve async fetch yollarının paylaştığı geçmiş deposu (ATM_HISTORY=true değilse None)
+gecmis = GecmisDeposu() if GECMIS_ENABLED else None
+if gecmis is not None:
+    # Bekleyen satırlar normalde kaydet içinden yazılır; kapanışta son flush'tan
+    # beri biriken satırlar kaybolmasın
+    atexit.register(gecmis.flush)
+
+
+def gecmise_yaz(url: str, otobusler: List[Dict]):
+    """Fetch yollarından çağrılır; geçmiş kaydı hatası durak yanıtını bozmaz"""
+    if gecmis is None:
+        return
+    try:
+        gecmis.kaydet(url, otobusler)
+    except Exception as e:
+        print(f"Geçmiş kayıt hatası ({url}): {e}")
@@ -0,0 +1,475 @@
+"""
+ATM Messina upstream HTTP istemcisi
+Tüm süreç için tek, paylaşımlı ve bağlantı havuzlu requests.Session sağlar;
+upstream'e giden her istek merkezi, uyarlanabilir hız sınırlayıcıdan geçer
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+# Upstream sunucu - pre-connect bu adrese yapılır
+UPSTREAM_URL = 'https://www.atmmessinaspa.it/'
+
+# Havuz ayarları (environment variable ile değiştirilebilir)
+# POOL_HOSTS: Bellekte tutulacak host havuzu sayısı
+# POOL_MAXSIZE: Host başına açık tutulacak en fazla bağlantı sayısı
+# POOL_BLOCK: Havuz doluysa yeni bağlantı açmak yerine bekle
+POOL_HOSTS = int(os.environ.get('ATM_HTTP_POOL_HOSTS', 4))
+POOL_MAXSIZE = int(os.environ.get('ATM_HTTP_POOL_MAXSIZE', 16))
+POOL_BLOCK = os.environ.get('ATM_HTTP_POOL_BLOCK', 'False').lower() == 'true'
+PRECONNECT = os.environ.get('ATM_HTTP_PRECONNECT', 'False').lower() == 'true'
+
+# Aynı host'a aynı anda yapılabilecek en fazla istek (upstream'e karşı nezaket)
+HOST_CONCURRENCY = int(os.environ.get('ATM_HOST_CONCURRENCY', 4))
+
+# Upstream istek bütçesi (token bucket) - environment variable ile değiştirilebilir
+# UPSTREAM_RPS: Tüm sunucu için saniyedeki en fazla istek; worker'lar
+#               (WEB_CONCURRENCY) arasında eşit bölünür
+# UPSTREAM_BURST: Boşta biriken en fazla jeton (ani istek patlaması)
+# UPSTREAM_MIN_RPS: 429/5xx sonrası hızın düşebileceği alt sınır (worker başına)
+# UPSTREAM_MAX_WAIT: Jeton için en fazla bekleme; aşılırsa istek hiç gönderilmez
+# UPSTREAM_RETRIES: Timeout, bağlantı hatası, 429 veya 5xx sonrası en fazla tekrar
+UPSTREAM_RPS = float(os.environ.get('ATM_UPSTREAM_RPS', 10))
+UPSTREAM_BURST = float(os.environ.get('ATM_UPSTREAM_BURST', 10))
+UPSTREAM_MIN_RPS = float(os.environ.get('ATM_UPSTREAM_MIN_RPS', 0.5))
+UPSTREAM_MAX_WAIT = float(os.environ.get('ATM_UPSTREAM_MAX_WAIT', 30))
+UPSTREAM_RETRIES = int(os.environ.get('ATM_UPSTREAM_RETRIES', 1))
+
+# Bütçenin altına düştüğü durumda yeni upstream denemesi başlatılmayan kalan süre (saniye)
+DEADLINE_MIN_ATTEMPT = float(os.environ.get('ATM_DEADLINE_MIN_ATTEMPT', 0.3))
+
+# Devre kesici (host başına) - environment variable ile değiştirilebilir
+# BREAKER_FAILURES: Devreyi açan art arda başarısız çekim sayısı
+# BREAKER_RESET: Açık devrenin deneme (half-open) isteğine izin vermeden önce beklediği süre
+# BREAKER_PROBES: Half-open durumunda aynı anda gönderilebilecek deneme isteği
+BREAKER_FAILURES = int(os.environ.get('ATM_BREAKER_FAILURES', 5))
+BREAKER_RESET = float(os.environ.get('ATM_BREAKER_RESET', 30))
+BREAKER_PROBES = int(os.environ.get('ATM_BREAKER_PROBES', 1))
+
+# Geri çekilme gerektiren yanıtlar ve Retry-After için üst sınır (saniye)
+GERI_CEKILME_KODLARI = frozenset((429, 500, 502, 503, 504))
+RETRY_AFTER_UST_SINIR = 60.0
+
+VARSAYILAN_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'tr-TR,tr;q=0.9,en-US;q=0.8,en;q=0.7',
+    'Connection': 'keep-alive'
+}
+
+_session: Optional[requests.Session] = None
+_session_pid: Optional[int] = None
+_session_lock = threading.Lock()
+
+_host_semaforlari: Dict[str, threading.BoundedSemaphore] = {}
+_host_lock = threading.Lock()
+
+_devre_kesiciler: Dict[str, 'DevreKesici'] = {}
+
+
+def create_session(pool_connections: int = POOL_HOSTS,
+                   pool_maxsize: int = POOL_MAXSIZE,
+                   pool_block: bool = POOL_BLOCK) -> requests.Session:
+    """
+    Bağlantı havuzlu HTTP session oluştur
+
+    urllib3 sadece istek gönderilmeden kopan bağlantıları hemen tekrar dener;
+    timeout/429/5xx tekrarları hız sınırlayıcının bütçesiyle çağıran tarafta yapılır.
+    """
+    session = requests.Session()
+    retry_strategy = Retry(
+        total=2,
+        connect=2,
+        read=False,
+        status=0,
+        respect_retry_after_header=False,
+        allowed_methods=["GET", "HEAD"]
+    )
+    adapter = HTTPAdapter(
+        max_retries=retry_strategy,
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        pool_block=pool_block
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update(VARSAYILAN_HEADERS)
+    return session
+
+
+def get_session() -> requests.Session:
+    """
+    Süreç genelinde paylaşılan session'ı döndür
+
+    Gunicorn fork ettikten sonra her worker kendi havuzunu açar;
+    ebeveyn süreçten kalan soketler worker'lar arasında paylaşılmaz.
+    """
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is not None and _session_pid == pid:
+        return _session
+    with _session_lock:
+        if _session is None or _session_pid != pid:
+            _session = create_session()
+            _session_pid = pid
+        return _session
+
+
+def close_session():
+    """Paylaşılan session'ı ve havuzdaki bağlantıları kapat"""
+    global _session, _session_pid
+    with _session_lock:
+        if _session is not None and _session_pid == os.getpid():
+            _session.close()
+        _session = None
+        _session_pid = None
+
+
+def preconnect(urls: Optional[List[str]] = None, timeout: float = 5) -> int:
+    """
+    Havuzu önceden ısıt: verilen adreslere HEAD isteği atarak
+    TCP+TLS bağlantısını kur ve havuzda bırak
+
+    Returns:
+        int: Bağlantı kurulabilen adres sayısı
+    """
+    session = get_session()
+    basarili = 0
+    for url in urls or [UPSTREAM_URL]:
+        try:
+            session.head(url, timeout=timeout, allow_redirects=False)
+            basarili += 1
+        except requests.exceptions.RequestException as e:
+            print(f"Pre-connect hatası ({url}): {e}")
+    return basarili
+
+
+def preconnect_background(urls: Optional[List[str]] = None):
+    """Pre-connect işlemini uygulama açılışını bekletmeden arka planda yap"""
+    thread = threading.Thread(target=preconnect, args=(urls,), daemon=True, name='atm-preconnect')
+    thread.start()
+    return thread
+
+
+def _host_semaforu(url: str) -> threading.BoundedSemaphore:
+    """URL'nin host'una ait eşzamanlılık semaforunu döndür (yoksa oluştur)"""
+    host = urlsplit(url).netloc.lower()
+    semafor = _host_semaforlari.get(host)
+    if semafor is None:
+        with _host_lock:
+            semafor = _host_semaforlari.setdefault(host, threading.BoundedSemaphore(HOST_CONCURRENCY))
+    return semafor
+
+
+@contextmanager
+def host_slot(url: str):
+    """
+    Host başına eşzamanlı istek sınırı
+
+    Fan-out ne kadar geniş olursa olsun aynı host'a aynı anda
+    en fazla HOST_CONCURRENCY istek gider.
+    """
+    semafor = _host_semaforu(url)
+    semafor.acquire()
+    try:
+        yield
+    finally:
+        semafor.release()
+
+
+class HizSiniriAsildi(requests.exceptions.RequestException):
+    """Upstream bütçesi dolu: istek UPSTREAM_MAX_WAIT içinde gönderilemezdi"""
+
+
+def _worker_sayisi() -> int:
+    try:
+        return max(int(os.environ.get('WEB_CONCURRENCY', 1) or 1), 1)
+    except ValueError:
+        return 1
+
+
+class HizSinirlayici:
+    """
+    Upstream istekleri için uyarlanabilir token bucket
+
+    Her istek bir jeton harcar; jetonlar hiz (istek/saniye) ile dolar. 429/5xx,
+    timeout veya bağlantı hatası bildirildiğinde hız yarıya iner, biriken
+    jetonlar silinir ve varsa Retry-After süresince hiç istek gönderilmez.
+    Her başarılı yanıtta hız hedefe doğru kademeli olarak geri yükselir.
+    Bekleme, jeton rezerve edilip kilit dışında yapılır; böylece thread'ler
+    ve event loop aynı sınırlayıcıyı paylaşır.
+    """
+
+    def __init__(self, hiz: float = UPSTREAM_RPS / _worker_sayisi(), kapasite: float = UPSTREAM_BURST,
+                 min_hiz: float = UPSTREAM_MIN_RPS, max_bekleme: float = UPSTREAM_MAX_WAIT):
+        """
+        Args:
+            hiz (float): Hedef istek/saniye (bu süreç için)
+            kapasite (float): Kova kapasitesi (en az 1 jeton)
+            min_hiz (float): Geri çekilmede inilebilecek en düşük hız
+            max_bekleme (float): Bir isteğin jeton için en fazla bekleyeceği süre (saniye)
+        """
+        self.hedef_hiz = max(hiz, 0.01)
+        self.kapasite = max(kapasite, 1.0)
+        self.min_hiz = min(max(min_hiz, 0.01), self.hedef_hiz)
+        self.max_bekleme = max_bekleme
+        self._hiz = self.hedef_hiz
+        self._jeton = self.kapasite
+        self._son = time.monotonic()
+        self._duraklat_bitis = 0.0
+        self._lock = threading.Lock()
+        self._sayaclar = {'istek': 0, 'bekleyen': 0, 'reddedilen': 0, 'geri_cekilme': 0,
+                          'durum_429': 0, 'durum_5xx': 0, 'hata': 0}
+        self._toplam_bekleme = 0.0
+
+    def _doldur(self, simdi: float):
+        self._jeton = min(self.kapasite, self._jeton + (simdi - self._son) * self._hiz)
+        self._son = simdi
+
+    def rezerve(self, max_bekleme: Optional[float] = None) -> float:
+        """
+        Bir jeton rezerve et ve gönderimden önce beklenmesi gereken süreyi döndür
+
+        Raises:
+            HizSiniriAsildi: Bekleme max_bekleme'yi aşacaksa (jeton harcanmaz)
+        """
+        if max_bekleme is None:
+            max_bekleme = self.max_bekleme
+        with self._lock:
+            simdi = time.monotonic()
+            self._doldur(simdi)
+            # Jeton borçlanılabilir: eksi bakiye, sıradaki isteklerin bekleme süresidir
+            bekleme = max(self._duraklat_bitis - simdi, 0.0) + max(1.0 - self._jeton, 0.0) / self._hiz
+            if bekleme > max_bekleme:
+                self._sayaclar['reddedilen'] += 1
+                raise HizSiniriAsildi(f'Upstream hız sınırı: {bekleme:.1f} sn beklemek gerekirdi')
+            self._jeton -= 1.0
+            self._sayaclar['istek'] += 1
+            if bekleme > 0:
+                self._sayaclar['bekleyen'] += 1
+                self._toplam_bekleme += bekleme
+            return bekleme
+
+    def al(self, max_bekleme: Optional[float] = None) -> float:
+        """Jeton al (gerekirse bekleyerek); beklenen süreyi döndür"""
+        bekleme = self.rezerve(max_bekleme)
+        if bekleme > 0:
+            time.sleep(bekleme)
+        return bekleme
+
+    def yanit(self, durum_kodu: int, retry_after: Optional[str] = None) -> bool:
+        """
+        Yanıtı bildir ve hızı uyarla
+
+        Returns:
+            bool: Yanıt geri çekilme gerektiriyorsa (429/5xx) True - tekrar denenebilir
+        """
+        if durum_kodu not in GERI_CEKILME_KODLARI:
+            with self._lock:
+                # Toplamsal artış: yarıya inmiş hız ~20 başarılı yanıtta hedefe döner
+                self._hiz = min(self.hedef_hiz, self._hiz + self.hedef_hiz / 20)
+            return False
+        self._geri_cekil('durum_429' if durum_kodu == 429 else 'durum_5xx', retry_after)
+        return True
+
+    def hata(self):
+        """Timeout veya bağlantı hatasını bildir (upstream zorlanıyor olabilir)"""
+        self._geri_cekil('hata')
+
+    def _geri_cekil(self, sayac: str, retry_after: Optional[str] = None):
+        duraklat = 0.0
+        if retry_after:
+            try:
+                duraklat = min(max(float(retry_after), 0.0), RETRY_AFTER_UST_SINIR)
+            except ValueError:
+                # HTTP tarihi biçimindeki Retry-After yok sayılır; yarıya inen hız yeterli
+                pass
+        with self._lock:
+            simdi = time.monotonic()
+            self._doldur(simdi)
+            self._hiz = max(self.min_hiz, self._hiz / 2)
+            self._jeton = min(self._jeton, 0.0)
+            self._duraklat_bitis = max(self._duraklat_bitis, simdi + duraklat)
+            self._sayaclar[sayac] += 1
+            self._sayaclar['geri_cekilme'] += 1
+
+    def istatistik(self) -> Dict:
+        with self._lock:
+            simdi = time.monotonic()
+            self._doldur(simdi)
+            return {
+                'hedef_hiz': round(self.hedef_hiz, 3),
+                'hiz': round(self._hiz, 3),
+                'kapasite': self.kapasite,
+                'jeton': round(self._jeton, 2),
+                'duraklatma_kalan': round(max(self._duraklat_bitis - simdi, 0.0), 2),
+                'toplam_bekleme': round(self._toplam_bekleme, 2),
+                **self._sayaclar
+            }
+
+
+# Süreç genelinde tek sınırlayıcı; thread ve async motor birlikte kullanır
+hiz_sinirlayici = HizSinirlayici()
+
+
+class SureDoldu(requests.exceptions.RequestException):
+    """İsteğin süre bütçesi doldu; upstream hatası sayılmaz"""
+
+
+def son_zaman_olustur(butce: Optional[float]) -> Optional[float]:
+    """Saniye cinsinden bütçeden time.monotonic() tabanlı son zaman (0/None: sınırsız)"""
+    if not butce or butce <= 0:
+        return None
+    return time.monotonic() + butce
+
+
+def kalan_sure(son_zaman: Optional[float]) -> Optional[float]:
+    """Son zamana kalan süre (sınırsızsa None, geçtiyse eksi)"""
+    if son_zaman is None:
+        return None
+    return son_zaman - time.monotonic()
+
+
+def butce_timeout(varsayilan: Tuple[float, float],
+                  son_zaman: Optional[float]) -> Tuple[Tuple[float, float], bool]:
+    """
+    (connect, read) timeout'larını kalan bütçeye göre kırp
+
+    Returns:
+        tuple: ((connect, read), kirpildi) - kirpildi True ise olası bir
+               timeout upstream'in değil bütçenin sonucudur
+    """
+    kalan = kalan_sure(son_zaman)
+    if kalan is None or kalan >= max(varsayilan):
+        return varsayilan, False
+    kalan = max(kalan, 0.01)
+    return (min(varsayilan[0], kalan), min(varsayilan[1], kalan)), True
+
+
+def deneme_suresi_var(son_zaman: Optional[float]) -> bool:
+    """Kalan bütçe yeni bir upstream denemesine yeter mi"""
+    kalan = kalan_sure(son_zaman)
+    return kalan is None or kalan >= DEADLINE_MIN_ATTEMPT
+
+
+class DevreAcik(requests.exceptions.RequestException):
+    """Upstream devresi açık: istek gönderilmeden hemen başarısız olundu"""
+
+
+class DevreKesici:
+    """
+    Upstream host'u için devre kesici
+
+    kapali: istekler geçer; art arda basarisiz_esik upstream hatasında açılır.
+    acik: istekler DevreAcik ile hemen reddedilir (timeout beklenmez).
+    yari_acik: bekleme süresi dolunca en fazla deneme_sayisi istek geçer;
+    biri başarılı olursa devre kapanır, başarısız olursa yeniden açılır.
+    """
+
+    def __init__(self, host: str, basarisiz_esik: int = BREAKER_FAILURES,
+                 bekleme: float = BREAKER_RESET, deneme_sayisi: int = BREAKER_PROBES):
+        """
+        Args:
+            host (str): Upstream host'u (sadece raporlama için)
+            basarisiz_esik (int): Devreyi açan art arda hata sayısı
+            bekleme (float): Açık kalma süresi (saniye)
+            deneme_sayisi (int): Half-open durumunda eşzamanlı deneme isteği
+        """
+        self.host = host
+        self.basarisiz_esik = max(basarisiz_esik, 1)
+        self.bekleme = bekleme
+        self.deneme_sayisi = max(deneme_sayisi, 1)
+        self._durum = 'kapali'
+        self._art_arda = 0
+        self._acilis = 0.0
+        self._denemede = 0
+        self._lock = threading.Lock()
+        self._sayaclar = {'acilma': 0, 'reddedilen': 0, 'deneme': 0, 'basarili': 0, 'basarisiz': 0}
+
+    def izin_al(self) -> bool:
+        """
+        İstek gönderilebilir mi; gönderilebilirse sonucu bildir() ile bildirilmeli
+
+        Returns:
+            bool: İstek half-open deneme isteğiyse True
+
+        Raises:
+            DevreAcik: Devre açıksa veya half-open deneme kotası doluysa
+        """
+        with self._lock:
+            if self._durum == 'acik' and time.monotonic() - self._acilis >= self.bekleme:
+                self._durum = 'yari_acik'
+            if self._durum == 'kapali':
+                return False
+            if self._durum == 'yari_acik' and self._denemede < self.deneme_sayisi:
+                self._denemede += 1
+                self._sayaclar['deneme'] += 1
+                return True
+            self._sayaclar['reddedilen'] += 1
+            kalan = max(self.bekleme - (time.monotonic() - self._acilis), 0.0)
+        raise DevreAcik(f'{self.host} devresi açık ({kalan:.0f} sn sonra denenecek)')
+
+    def bildir(self, basarili: Optional[bool], deneme: bool = False):
+        """
+        İzin alınmış isteğin sonucunu bildir
+
+        Args:
+            basarili (bool): True başarılı, False upstream hatası (timeout,
+                             bağlantı, 429/5xx); None upstream'le ilgisiz
+                             sonuç (ör. 404, iptal) - sayaçları değiştirmez
+            deneme (bool): izin_al()'ın döndürdüğü değer
+        """
+        with self._lock:
+            deneme = deneme and self._durum == 'yari_acik'
+            if deneme:
+                self._denemede = max(self._denemede - 1, 0)
+            if basarili is None:
+                return
+            if basarili:
+                self._sayaclar['basarili'] += 1
+                self._art_arda = 0
+                if self._durum != 'kapali':
+                    print(f"Devre kapandı: {self.host}")
+                self._durum = 'kapali'
+                return
+            self._sayaclar['basarisiz'] += 1
+            self._art_arda += 1
+            if deneme or (self._durum == 'kapali' and self._art_arda >= self.basarisiz_esik):
+                if self._durum == 'kapali':
+                    print(f"Devre açıldı: {self.host} ({self._art_arda} art arda hata)")
+                self._durum = 'acik'
+                self._acilis = time.monotonic()
+                self._denemede = 0
+                self._sayaclar['acilma'] += 1
+
+    def istatistik(self) -> Dict:
+        with self._lock:
+            if self._durum == 'acik':
+                kalan = round(max(self.bekleme - (time.monotonic() - self._acilis), 0.0), 1)
+            else:
+                kalan = None
+            return {'durum': self._durum, 'art_arda_hata': self._art_arda,
+                    'deneme_icin_kalan': kalan, **self._sayaclar}
+
+
+def devre_kesici(url: str) -> DevreKesici:
+    """URL'nin host'una ait devre kesiciyi döndür (yoksa oluştur)"""
+    host = urlsplit(url).netloc.lower()
+    kesici = _devre_kesiciler.get(host)
+    if kesici is None:
+        with _host_lock:
+            kesici = _devre_kesiciler.setdefault(host, DevreKesici(host))
+    return kesici
+
+
+def devre_istatistik() -> Dict:
+    """Host başına devre kesici durumu"""
+    return {host: kesici.istatistik() for host, kesici in list(_devre_kesiciler.items())}
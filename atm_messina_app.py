@@ -3,18 +3,33 @@ ATM Messina Otobüs Durakları Takip Sistemi
 Durak URL'lerinden veri çekerek gelecek otobüsleri gösterir
 """
 
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, Response, render_template, jsonify, request
 from flask_cors import CORS
 import requests
-from requests.adapters import HTTPAdapter
-from requests.packages.urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
 import json
 import os
-import re
+import queue
+import threading
 from datetime import datetime
 import time
-from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError, as_completed
+from functools import partial
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from atm_analiz import analiz
+from atm_async import kopru as async_kopru
+from atm_cache import DurakOnbellegi, TekUcus, paylasimli_onbellek_olustur, sayfa_hafizasi, son_bilinen_veri
+from atm_delta import parmak_izi, surum_defteri_olustur
+from atm_depo import depo_olustur, palina_numarasi
+from atm_gecikme import gecikme_takipcisi, gecikmeyi_isle
+from atm_gecmis import gecmis, gecmise_yaz
+from atm_http import (DevreAcik, GERI_CEKILME_KODLARI, HizSiniriAsildi, SureDoldu, butce_timeout,
+                      deneme_suresi_var, devre_istatistik, devre_kesici, get_session, hiz_sinirlayici,
+                      host_slot, kalan_sure, preconnect_background, PRECONNECT, son_zaman_olustur,
+                      UPSTREAM_RETRIES)
+from atm_parser import parse_durak_html, strateji_hafizasi
+from atm_poller import DurakPoller, POLLER_ENABLED
 
 app = Flask(__name__)
 # CORS ekle - mobil ve farklı domain'lerden erişim için
@@ -45,10 +60,16 @@ def handle_exception(e):
         return response, 500
     return e
 
+# JSON'a çevrilmeyecek akış yanıtları (SSE, NDJSON)
+AKIS_MIMETYPES = {'text/event-stream', 'application/x-ndjson'}
+
 # Tüm API yanıtlarının JSON olduğundan emin ol
 @app.after_request
 def after_request(response):
-    if request.path.startswith('/api/'):
+    # 304 yanıtlarının gövdesi yoktur; olduğu gibi bırak
+    if response.status_code == 304:
+        return response
+    if request.path.startswith('/api/') and response.mimetype not in AKIS_MIMETYPES:
         # Eğer Content-Type HTML ise, JSON'a çevir
         if response.content_type and 'text/html' in response.content_type:
             error_data = {'success': False, 'error': 'Beklenmeyen hata oluştu'}
@@ -58,20 +79,41 @@ def after_request(response):
         response.headers['Content-Type'] = 'application/json; charset=utf-8'
     return response
 
-# Retry stratejisi ile session oluştur
-def create_session():
-    """Retry mekanizmalı HTTP session oluştur"""
-    session = requests.Session()
-    retry_strategy = Retry(
-        total=3,
-        backoff_factor=2,
-        status_forcelist=[429, 500, 502, 503, 504],
-        allowed_methods=["GET"]
-    )
-    adapter = HTTPAdapter(max_retries=retry_strategy)
-    session.mount("http://", adapter)
-    session.mount("https://", adapter)
-    return session
+# Upstream bağlantı havuzunu önceden ısıt (ATM_HTTP_PRECONNECT=true ise)
+if PRECONNECT:
+    preconnect_background()
+
+# Tüm durakları paralel çekmek için paylaşılan thread havuzu
+# Host başına eşzamanlılık ayrıca atm_http.HOST_CONCURRENCY ile sınırlı
+FANOUT_WORKERS = int(os.environ.get('ATM_FANOUT_WORKERS', 8))
+_fanout_executor = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix='atm-fanout')
+
+# Toplu yenileme motoru: 'thread' (varsayılan) veya 'async' (tek event loop, aiohttp)
+FETCH_ENGINE = os.environ.get('ATM_FETCH_ENGINE', 'thread').lower()
+
+# İstek başına toplam süre bütçesi (saniye, 0: sınırsız); bütçe içinde gelmeyen
+# duraklar beklenmez, son bilinen verileriyle 'pending' olarak döner
+DEADLINE_STOP = float(os.environ.get('ATM_DEADLINE_STOP', 3))
+DEADLINE_ALL = float(os.environ.get('ATM_DEADLINE_ALL', 8))
+
+# Parse edilmiş durak verisi önbelleği (durak URL'si anahtar); birden fazla
+# worker varsa arkasında worker'ların paylaştığı SQLite önbelleği (ATM_SHARED_CACHE)
+onbellek = DurakOnbellegi(paylasimli=paylasimli_onbellek_olustur())
+# Aynı durak için eşzamanlı upstream çekimlerini tek çekimde birleştir
+tek_ucus = TekUcus()
+# tum-veriler?since=<cursor> ve canlı akış için durak başına sürüm sayaçları
+# (paylaşılan önbellek açıksa worker'lar aynı defteri kullanır)
+surum_defteri = surum_defteri_olustur(onbellek.paylasimli)
+
+# SSE canlı akışı: heartbeat aralığı, bağlantının en uzun süresi (sonra istemci
+# Last-Event-ID ile yeniden bağlanır) ve istemciye önerilen yeniden bağlanma süresi
+SSE_HEARTBEAT = float(os.environ.get('ATM_SSE_HEARTBEAT', 15))
+SSE_MAX_SURE = float(os.environ.get('ATM_SSE_MAX_DURATION', 300))
+SSE_RETRY_MS = int(os.environ.get('ATM_SSE_RETRY_MS', 3000))
+# Her SSE bağlantısı bir gthread thread'ini tutar; sınır, normal API isteklerine
+# thread bırakmak içindir (Procfile: --threads 16)
+SSE_MAX_AKIS = int(os.environ.get('ATM_SSE_MAX_STREAMS', 8))
+_sse_yuvalari = threading.BoundedSemaphore(SSE_MAX_AKIS)
 
 # Durak URL'lerini saklayacak dosya
 # Cloud deploy için persistent storage kullan
@@ -80,313 +122,124 @@ DURAKLAR_FILE = os.path.join(os.path.dirname(__file__), 'data', 'duraklar.json')
 # data klasörünü oluştur
 os.makedirs(os.path.dirname(DURAKLAR_FILE), exist_ok=True)
 
+# Durak listesi bellekte tutulur; depolama (ATM_STORAGE: json/sqlite) sadece
+# değişince yeniden okunur
+depo = depo_olustur(json_dosya=DURAKLAR_FILE)
+
 def load_duraklar() -> List[Dict]:
     """Durak listesini yükle"""
-    if os.path.exists(DURAKLAR_FILE):
-        try:
-            with open(DURAKLAR_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                # Eğer data bir liste değilse, boş liste döndür
-                if not isinstance(data, list):
-                    print(f"Uyarı: duraklar.json dosyası geçersiz format - liste bekleniyordu")
-                    return []
-                return data
-        except json.JSONDecodeError as e:
-            print(f"JSON parse hatası: {e}")
-            return []
-        except Exception as e:
-            print(f"Dosya okuma hatası: {e}")
-            return []
-    return []
+    return depo.listele()
 
 def save_duraklar(duraklar: List[Dict]):
     """Durak listesini kaydet"""
+    depo.kaydet(duraklar)
+
+def kosullu_json(etag: str, govde) -> Response:
+    """
+    ETag'li JSON yanıtı; istemcinin If-None-Match'i tutuyorsa gövdesiz 304 döndür
+
+    govde, sadece gerçekten gerekirse çağrılır (304'te serialize edilmez).
+    Cache-Control: no-cache - tarayıcı saklar ama her kullanımda doğrulatır.
+    """
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(govde())
+        response.headers['Content-Type'] = 'application/json; charset=utf-8'
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def _sayfa_getir(session: requests.Session, url: str, headers: Optional[Dict] = None,
+                 son_zaman: Optional[float] = None) -> requests.Response:
+    """
+    Durak sayfasını host'un devre kesicisi üzerinden indir
+
+    Devre açıksa upstream'e hiç gidilmez (DevreAcik); sonuç devre kesiciye
+    bildirilir: timeout, bağlantı hatası ve 429/5xx hata, 4xx ise upstream'in
+    çalıştığını gösterir ama durağa özgüdür, sayılmaz. Süre bütçesinin
+    (son_zaman) dolması da upstream hatası sayılmaz.
+    """
+    kesici = devre_kesici(url)
+    deneme = kesici.izin_al()
+    basarili = None
     try:
-        os.makedirs(os.path.dirname(DURAKLAR_FILE), exist_ok=True)
-        # Atomic write: önce geçici dosyaya yaz, sonra taşı
-        temp_file = DURAKLAR_FILE + '.tmp'
-        with open(temp_file, 'w', encoding='utf-8') as f:
-            json.dump(duraklar, f, ensure_ascii=False, indent=2)
-            f.flush()
-            os.fsync(f.fileno())  # Disk'e yazıldığından emin ol
-        
-        # Geçici dosyayı asıl dosyaya taşı
-        os.replace(temp_file, DURAKLAR_FILE)
-    except Exception as e:
-        print(f"Dosya kaydetme hatası: {e}")
+        response = _tekrarli_getir(session, url, headers, son_zaman)
+        basarili = True
+        return response
+    except (HizSiniriAsildi, SureDoldu):
         raise
+    except requests.exceptions.HTTPError as e:
+        basarili = False if e.response is not None and e.response.status_code in GERI_CEKILME_KODLARI else None
+        raise
+    except requests.exceptions.RequestException:
+        basarili = False
+        raise
+    finally:
+        kesici.bildir(basarili, deneme)
+
+def _tekrarli_getir(session: requests.Session, url: str, headers: Optional[Dict] = None,
+                    son_zaman: Optional[float] = None) -> requests.Response:
+    """
+    Durak sayfasını indir; timeout, bağlantı hatası, 429 veya 5xx olursa
+    daha uzun timeout ile tekrar dene
 
-def fetch_durak_data(url: str) -> Dict:
+    Her deneme hız sınırlayıcıdan jeton alır; geri çekilme beklemesi sabit bir
+    sleep yerine sınırlayıcının düşürdüğü hızdan (ve Retry-After'dan) gelir.
+    son_zaman verilirse timeout'lar ve jeton beklemesi kalan bütçeyle sınırlanır,
+    bütçe yeni bir denemeye yetmiyorsa tekrar denenmez.
+    """
+    for deneme in range(UPSTREAM_RETRIES + 1):
+        if not deneme_suresi_var(son_zaman):
+            raise SureDoldu('Süre bütçesi doldu')
+        kalan = kalan_sure(son_zaman)
+        hiz_sinirlayici.al(None if kalan is None else min(hiz_sinirlayici.max_bekleme, kalan))
+        # İlk deneme (10, 30), tekrarlar (15, 45): (connect timeout, read timeout)
+        timeout, kirpildi = butce_timeout((10, 30) if deneme == 0 else (15, 45), son_zaman)
+        # host_slot: aynı host'a giden eşzamanlı istek sayısını sınırla
+        with host_slot(url):
+            try:
+                response = session.get(url, headers=headers, timeout=timeout)
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                if kirpildi and isinstance(e, requests.exceptions.Timeout):
+                    raise SureDoldu(f'Süre bütçesi doldu ({timeout[1]:.1f} sn)') from e
+                hiz_sinirlayici.hata()
+                if deneme == UPSTREAM_RETRIES or not deneme_suresi_var(son_zaman):
+                    raise
+                continue
+        son_deneme = deneme == UPSTREAM_RETRIES or not deneme_suresi_var(son_zaman)
+        if hiz_sinirlayici.yanit(response.status_code, response.headers.get('Retry-After')) and not son_deneme:
+            response.close()
+            continue
+        response.raise_for_status()
+        return response
+
+def fetch_durak_data(url: str, son_zaman: Optional[float] = None) -> Dict:
     """
     ATM Messina durağından otobüs bilgilerini çek
     
     URL formatı: https://www.atmmessinaspa.it/smartpoles2.php?palina=1766&rnd=7
+    son_zaman (time.monotonic) verilirse çekim o ana kadar bitmezse son
+    bilinen veri 'pending' olarak döner.
     """
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-            'Accept-Language': 'tr-TR,tr;q=0.9,en-US;q=0.8,en;q=0.7'
-        }
-        
-        # Retry mekanizmalı session kullan
-        session = create_session()
-        
-        # Timeout'u artır (30 saniye)
-        try:
-            response = session.get(url, headers=headers, timeout=(10, 30))  # (connect timeout, read timeout)
-            response.raise_for_status()
-        except requests.exceptions.Timeout:
-            # Timeout durumunda daha fazla bekle ve tekrar dene
-            time.sleep(3)
-            response = session.get(url, headers=headers, timeout=(15, 45))
-            response.raise_for_status()
-        
-        # Encoding'i düzelt
-        response.encoding = response.apparent_encoding or 'utf-8'
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        otobusler = []
-        durak_adi = 'Bilinmeyen Durak'
-        
-        # Durak adını bul - daha esnek yöntem
-        # Önce tüm metni al ve FERMATA içeren kısmı bul
-        page_text = soup.get_text()
-        fermata_match = re.search(r'FERMATA[^•]*•[^*]*\*\*_?([^*]+?)_?\*\*', page_text, re.IGNORECASE)
-        if fermata_match:
-            durak_adi = fermata_match.group(1).replace('_', '').strip()
-        else:
-            # Alternatif: başlık elementlerinde ara
-            title_elements = soup.find_all(['h1', 'h2', 'h3', 'p', 'div', 'b', 'strong'])
-            for elem in title_elements:
-                text = elem.get_text()
-                if 'FERMATA' in text.upper():
-                    # ** ile çevrili kısmı bul
-                    match = re.search(r'\*\*_?([^*]+?)_?\*\*', text)
-                    if match:
-                        durak_adi = match.group(1).replace('_', '').strip()
-                        break
-        
-        # Tüm tabloları bul
-        tables = soup.find_all('table')
-        
-        # Eğer tablo yoksa, tüm HTML'i text olarak parse et
-        if not tables or len(tables) == 0:
-            # Direkt metinden parse et
-            page_text = soup.get_text()
-            # Pattern: **32** **Staz. Centrale** **18:05** formatını bul
-            pattern = r'\*\*(\d+[A-Z\s]*)\*\*\s*\*\*([^*]+?)\*\*\s*\*\*(\d{1,2}):(\d{1,2})\*\*'
-            matches = re.finditer(pattern, page_text, re.IGNORECASE)
-            for match in matches:
-                hour = match.group(3).zfill(2)
-                minute = match.group(4).zfill(2)
-                otobus = {
-                    'hat': match.group(1).strip(),
-                    'varis': match.group(2).strip(),
-                    'saat': f"{hour}:{minute}",
-                    'tip': 'Schedulato'
-                }
-                if not any(o['hat'] == otobus['hat'] and o['saat'] == otobus['saat'] for o in otobusler):
-                    otobusler.append(otobus)
-        
-        # Tablolardan TÜM otobüs bilgilerini çek (geçmiş/gelecek ayrımı yapmadan)
-        # Her otobüs için ayrı bir tablo var
-        # Format: | Linea | Destinazione | Orario |
-        # İkinci satır: _(Orario Schedulato)_ veya _(Orario aggiornato in Tempo Reale ...)_
-        
-        for table in tables:
-            try:
-                # Tablo içeriğini al
-                table_html = str(table)
-                table_text = table.get_text()
-                
-                # Önce regex ile direkt tablo HTML'inden çek
-                # Pattern: <td> veya <th> içinde **32** **Staz. Centrale** **18:05** formatı
-                pattern = r'<t[dh][^>]*>\s*\*\*(\d+[A-Z\s]*)\*\*\s*</t[dh]>\s*<t[dh][^>]*>\s*\*\*([^*]+?)\*\*\s*</t[dh]>\s*<t[dh][^>]*>\s*\*\*(\d{1,2}):(\d{1,2})\*\*\s*</t[dh]'
-                matches = re.finditer(pattern, table_html, re.IGNORECASE | re.DOTALL)
-                for match in matches:
-                    hour = match.group(3).zfill(2)
-                    minute = match.group(4).zfill(2)
-                    otobus = {
-                        'hat': match.group(1).strip(),
-                        'varis': match.group(2).strip(),
-                        'saat': f"{hour}:{minute}",
-                        'tip': 'Schedulato'
-                    }
-                    # Tip bilgisini kontrol et
-                    if 'tempo reale' in table_text.lower() or 'aggiornato' in table_text.lower():
-                        otobus['tip'] = 'Tempo Reale'
-                    if not any(o['hat'] == otobus['hat'] and o['saat'] == otobus['saat'] for o in otobusler):
-                        otobusler.append(otobus)
-                
-                # Tablo hücrelerini manuel parse et (hem ** işaretli hem de düz metin formatı için)
-                rows = table.find_all('tr')
-                
-                # Başlık satırını atla (Linea, Destinazione, Orario içeren)
-                data_rows = []
-                for row in rows:
-                    row_text = row.get_text(strip=True).lower()
-                    # Başlık satırı değilse ve veri içeriyorsa ekle
-                    if 'linea' not in row_text or len(row.find_all(['td', 'th'])) > 0:
-                        cells = row.find_all(['td', 'th'])
-                        if len(cells) >= 2:  # En az 2 hücre varsa veri satırı olabilir
-                            data_rows.append(row)
-                
-                # Her veri satırını işle
-                for row in data_rows:
-                    try:
-                        cells = row.find_all(['td', 'th'])
-                        cell_texts = [cell.get_text(strip=True) for cell in cells]
-                        
-                        # Başlık satırını atla
-                        if any(text.lower() in ['linea', 'destinazione', 'orario'] for text in cell_texts):
-                            continue
-                        
-                        linea = ''
-                        destinazione = ''
-                        orario = ''
-                        tip = 'Schedulato'
-                        
-                        # Hücreleri analiz et
-                        for i, text in enumerate(cell_texts):
-                            # Temizle (** işaretlerini kaldır)
-                            clean_text = re.sub(r'\*+', '', text).strip()
-                            
-                            # Linea: Sadece sayı veya sayı + harf (örn: "1", "31 BIS")
-                            if re.match(r'^\d+[A-Z\s]*$', clean_text) and not linea:
-                                linea = clean_text
-                                continue
-                            
-                            # Saat: HH:MM formatı
-                            time_match = re.search(r'(\d{1,2}):(\d{1,2})', clean_text)
-                            if time_match and not orario:
-                                hour = time_match.group(1).zfill(2)
-                                minute = time_match.group(2).zfill(2)
-                                orario = f"{hour}:{minute}"
-                                continue
-                            
-                            # Destinazione: Uzun metin (Linea ve Orario değilse)
-                            if clean_text and len(clean_text) > 2 and not destinazione:
-                                if clean_text not in ['Linea', 'Destinazione', 'Orario']:
-                                    if not re.match(r'^\d+[A-Z\s]*$', clean_text):
-                                        if not re.match(r'^\d{1,2}:\d{2}', clean_text):
-                                            destinazione = clean_text
-                        
-                        # Tip bilgisini kontrol et (aynı satırda veya sonraki satırda)
-                        row_text_lower = row.get_text(strip=True).lower()
-                        if 'tempo reale' in row_text_lower or 'aggiornato' in row_text_lower:
-                            tip = 'Tempo Reale'
-                        
-                        # Sonraki satırı da kontrol et (tip bilgisi orada olabilir)
-                        row_index = rows.index(row) if row in rows else -1
-                        if row_index >= 0 and row_index + 1 < len(rows):
-                            next_row_text = rows[row_index + 1].get_text(strip=True).lower()
-                            if 'tempo reale' in next_row_text or 'aggiornato' in next_row_text:
-                                tip = 'Tempo Reale'
-                        
-                        # Eğer hala bulamadıysak, tablo metninden regex ile ara
-                        if not orario:
-                            time_matches = re.findall(r'(\d{1,2}):(\d{1,2})', table_text)
-                            if time_matches:
-                                hour, minute = time_matches[0]
-                                orario = f"{hour.zfill(2)}:{minute.zfill(2)}"
-                        
-                        if not linea:
-                            # Tablo metninden sayı ile başlayan metni bul
-                            linea_match = re.search(r'\b(\d+[A-Z\s]*)\b', table_text)
-                            if linea_match:
-                                potential_linea = linea_match.group(1).strip()
-                                if not re.match(r'^\d{1,2}:\d{2}', potential_linea):
-                                    linea = potential_linea
-                        
-                        # Otobüsü ekle (Linea ve Orario varsa)
-                        if linea and orario:
-                            otobus = {
-                                'hat': linea,
-                                'varis': destinazione if destinazione else 'Bilinmiyor',
-                                'saat': orario,
-                                'tip': tip
-                            }
-                            if not any(o['hat'] == otobus['hat'] and o['saat'] == otobus['saat'] for o in otobusler):
-                                otobusler.append(otobus)
-                    except Exception as e:
-                        # Bu satırı atla
-                        continue
-            except Exception as e:
-                # Bu tabloyu atla, diğerlerine devam et
-                continue
+        # Süreç genelinde paylaşılan, bağlantı havuzlu session kullan
+        # (header'lar session üzerinde tanımlı)
+        session = get_session()
         
-        # Eğer hala otobüs bulunamadıysa, tüm sayfadan regex ile ara
-        if not otobusler:
-            # Tüm HTML'i text olarak al
-            page_html = str(soup)
-            page_text = soup.get_text()
-            
-            # Pattern 1: **32** **Staz. Centrale** **18:05** formatı (HTML içinde)
-            pattern1 = r'\*\*(\d+[A-Z\s]*)\*\*\s*\*\*([^*]+?)\*\*\s*\*\*(\d{1,2}):(\d{1,2})\*\*'
-            matches1 = re.finditer(pattern1, page_html, re.IGNORECASE | re.DOTALL)
-            for match in matches1:
-                hour = match.group(3).zfill(2)
-                minute = match.group(4).zfill(2)
-                otobus = {
-                    'hat': match.group(1).strip(),
-                    'varis': match.group(2).strip(),
-                    'saat': f"{hour}:{minute}",
-                    'tip': 'Schedulato'
-                }
-                # Tip kontrolü - eğer bu otobüsün yakınında "tempo reale" varsa
-                match_start = match.start()
-                context = page_html[max(0, match_start-200):match_start+200].lower()
-                if 'tempo reale' in context or 'aggiornato' in context:
-                    otobus['tip'] = 'Tempo Reale'
-                if not any(o['hat'] == otobus['hat'] and o['saat'] == otobus['saat'] for o in otobusler):
-                    otobusler.append(otobus)
-            
-            # Pattern 2: Sadece text'ten (eğer HTML pattern çalışmadıysa)
-            if not otobusler:
-                matches2 = re.finditer(pattern1, page_text, re.IGNORECASE)
-                for match in matches2:
-                    hour = match.group(3).zfill(2)
-                    minute = match.group(4).zfill(2)
-                    otobus = {
-                        'hat': match.group(1).strip(),
-                        'varis': match.group(2).strip(),
-                        'saat': f"{hour}:{minute}",
-                        'tip': 'Schedulato'
-                    }
-                    if not any(o['hat'] == otobus['hat'] and o['saat'] == otobus['saat'] for o in otobusler):
-                        otobusler.append(otobus)
-            
-            # Pattern 3: Tüm ** ile çevrili metinleri bul ve grupla
-            if not otobusler:
-                bold_matches = re.findall(r'\*\*([^*]+)\*\*', page_text)
-                i = 0
-                while i < len(bold_matches) - 2:
-                    # Linea, Destinazione, Orario sırası
-                    if re.match(r'^\d+[A-Z\s]*$', bold_matches[i].strip()):
-                        linea = bold_matches[i].strip()
-                        destinazione = bold_matches[i+1].strip() if i+1 < len(bold_matches) else 'Bilinmiyor'
-                        orario_text = bold_matches[i+2].strip() if i+2 < len(bold_matches) else ''
-                        time_match = re.search(r'(\d{1,2}):(\d{1,2})', orario_text)
-                        if time_match:
-                            hour = time_match.group(1).zfill(2)
-                            minute = time_match.group(2).zfill(2)
-                            otobus = {
-                                'hat': linea,
-                                'varis': destinazione,
-                                'saat': f"{hour}:{minute}",
-                                'tip': 'Schedulato'
-                            }
-                            if not any(o['hat'] == otobus['hat'] and o['saat'] == otobus['saat'] for o in otobusler):
-                                otobusler.append(otobus)
-                        i += 3
-                    else:
-                        i += 1
+        # Önceki yanıtın ETag/Last-Modified bilgisi varsa koşullu GET yap
+        response = _sayfa_getir(session, url, sayfa_hafizasi.kosullu_headers(url), son_zaman)
         
-        # TÜM otobüsleri göster - hiçbir filtreleme yapma
-        # Sayfada ne varsa hepsini göster (geçmiş/gelecek ayrımı yapmadan)
-        # Sadece saate göre sırala
-        otobusler.sort(key=lambda x: x['saat'])
+        # Sayfa değişmediyse (304 veya aynı hash) parse etmeden önceki sonucu kullan
+        parse = partial(parse_durak_html, anahtar=url)
+        sonuc = sayfa_hafizasi.cozumle(url, response.status_code, response.headers, response.content, parse)
+        if sonuc is None:
+            # 304 geldi ama önceki sonuç hafızadan düşmüş: koşulsuz tekrar çek
+            response = _sayfa_getir(session, url, son_zaman=son_zaman)
+            sonuc = sayfa_hafizasi.cozumle(url, response.status_code, response.headers, response.content, parse)
+        durak_adi, otobusler = sonuc
+        gecmise_yaz(url, otobusler)
+        gecikmeyi_isle(url, otobusler)
         
         return {
             'success': True,
@@ -396,6 +249,11 @@ def fetch_durak_data(url: str) -> Dict:
             'timestamp': datetime.now().isoformat()
         }
         
+    except DevreAcik as e:
+        # Upstream çökmüş görünüyor: timeout beklemeden son bilinen veriyi sun
+        return son_bilinen_veri(url, e)
+    except SureDoldu as e:
+        return son_bilinen_veri(url, e, bekliyor=True)
     except requests.exceptions.RequestException as e:
         return {
             'success': False,
@@ -409,6 +267,253 @@ def fetch_durak_data(url: str) -> Dict:
             'timestamp': datetime.now().isoformat()
         }
 
+def tekil_durak_verisi(url: str, son_zaman: Optional[float] = None) -> Dict:
+    """
+    fetch_durak_data'nın single-flight sarmalayıcısı
+
+    Aynı URL için o anda uçuşta bir çekim varsa yenisini başlatmaz,
+    onun sonucunu (hata dahil) paylaşır. Süre bütçeli ve bütçesiz çekimler
+    ayrı uçuşlardır: poller veya arka plan yenilemesi, bir isteğin kısa
+    bütçesiyle dönen timeout/bekleyen sonucu devralmasın.
+    """
+    anahtar = url if son_zaman is None else f'{url}#sureli'
+    veri, _ = tek_ucus.do(anahtar, lambda: fetch_durak_data(url, son_zaman))
+    return veri
+
+def _onbellek_bilgisi_ekle(veri: Dict, yas: float, durum: str) -> Dict:
+    """Önbellekteki sözlüğü kopyala ve yanıta önbellek yaşını/durumunu ekle"""
+    veri = dict(veri)
+    veri['cache_yasi'] = round(yas, 1)
+    veri['cache'] = durum
+    return veri
+
+def _hazir_veri(url: str) -> Optional[Tuple[Dict, float, str]]:
+    """
+    Upstream'e gitmeden sunulabilecek veri: önce poller snapshot'ı, sonra önbellek
+
+    Returns:
+        tuple: (veri, yas, durum) veya None
+    """
+    if poller.calisiyor:
+        snapshot = poller.bak(url)
+        if snapshot is not None:
+            return snapshot[0], snapshot[1], 'snapshot'
+    # Arka plan yenilemesi isteğin süre bütçesine bağlı değildir
+    return onbellek.bak(url, lambda: tekil_durak_verisi(url))
+
+def onbellekli_durak_verisi(url: str, son_zaman: Optional[float] = None) -> Dict:
+    """fetch_durak_data'yı snapshot/önbellek (TTL + stale-while-revalidate) üzerinden çağır"""
+    hazir = _hazir_veri(url)
+    if hazir is None:
+        hazir = onbellek.getir(url, lambda: tekil_durak_verisi(url, son_zaman))
+    return _onbellek_bilgisi_ekle(*hazir)
+
+def _bekleyen_veri(url: str) -> Dict:
+    """
+    Süre bütçesi içinde gelmeyen durak: önbellekte (yaşına bakmadan) ne varsa
+    o, yoksa son parse sonucu; ikisi de yoksa hata - hepsi 'pending' işaretli
+    """
+    mevcut = onbellek.get(url)
+    if mevcut is not None:
+        veri = _onbellek_bilgisi_ekle(mevcut[0], mevcut[1], 'stale')
+        veri['stale'] = True
+    else:
+        veri = son_bilinen_veri(url, SureDoldu('Süre bütçesi doldu, veri hazırlanıyor'))
+    veri['pending'] = True
+    return veri
+
+def sureli_durak_verisi(url: str, son_zaman: Optional[float]) -> Dict:
+    """
+    onbellekli_durak_verisi; son_zaman'a kadar bitmezse bekleyen/eski veri döner
+
+    Çekim (veya başka bir isteğin/worker'ın çekimini bekleme) arka planda
+    sürer ve bittiğinde önbelleğe işlenir.
+    """
+    hazir = _hazir_veri(url)
+    if hazir is not None:
+        return _onbellek_bilgisi_ekle(*hazir)
+    if son_zaman is None:
+        return onbellekli_durak_verisi(url)
+    future = _fanout_executor.submit(onbellekli_durak_verisi, url, son_zaman)
+    try:
+        return future.result(timeout=max(kalan_sure(son_zaman), 0.0))
+    except FuturesTimeoutError:
+        return _bekleyen_veri(url)
+
+def durak_verisi_cek(durak: Dict, son_zaman: Optional[float] = None) -> Dict:
+    """Tek bir durağın verisini çek; hata olursa hata kaydı döndür"""
+    try:
+        veri = onbellekli_durak_verisi(durak.get('url'), son_zaman)
+        veri['durak_adi'] = durak.get('ad', 'Bilinmeyen')
+        veri['durak_id'] = durak.get('id')
+        return veri
+    except Exception as e:
+        # Bir durakta hata olsa bile diğerlerini çekmeye devam et
+        return {
+            'success': False,
+            'durak_adi': durak.get('ad', 'Bilinmeyen'),
+            'durak_id': durak.get('id'),
+            'error': str(e)
+        }
+
+def _bekleyen_durak(durak: Dict) -> Dict:
+    """Süre bütçesi içinde gelmeyen durağın 'pending' kaydı"""
+    veri = _bekleyen_veri(durak['url'])
+    veri['durak_adi'] = durak.get('ad', 'Bilinmeyen')
+    veri['durak_id'] = durak.get('id')
+    return veri
+
+def tum_duraklari_cek(duraklar: List[Dict], son_zaman: Optional[float] = None) -> List[Dict]:
+    """
+    URL'si olan tüm durakları paralel çek
+
+    Sonuçlar durak listesindeki sırayla döner; toplam süre en yavaş
+    durağın süresine yakındır. son_zaman verilirse o ana kadar gelmeyen
+    duraklar 'pending' kaydıyla döner.
+    """
+    hedefler = [d for d in duraklar if d.get('url')]
+    sonuclar: List[Optional[Dict]] = [None] * len(hedefler)
+    for i, veri in tum_duraklari_akis(hedefler, son_zaman):
+        sonuclar[i] = veri
+    return sonuclar
+
+def tum_duraklari_akis(duraklar: List[Dict], son_zaman: Optional[float] = None) -> Iterator[Tuple[int, Dict]]:
+    """
+    URL'si olan tüm durakları paralel çek; her durak biter bitmez (sira, veri) üret
+
+    sira, durağın URL'li duraklar içindeki sırasıdır; sonuçlar bitiş sırasıyla gelir.
+    son_zaman verilirse o ana kadar bitmeyen duraklar en sonda 'pending'
+    kaydıyla gelir; çekimleri arka planda sürer ve önbelleğe işlenir.
+    """
+    hedefler = [d for d in duraklar if d.get('url')]
+    gelenler = set()
+    akis = _async_akis(hedefler, son_zaman) if FETCH_ENGINE == 'async' else _thread_akis(hedefler, son_zaman)
+    for i, veri in akis:
+        gelenler.add(i)
+        yield i, veri
+    for i, durak in enumerate(hedefler):
+        if i not in gelenler:
+            yield i, _bekleyen_durak(durak)
+
+def _thread_akis(hedefler: List[Dict], son_zaman: Optional[float]) -> Iterator[Tuple[int, Dict]]:
+    """Durakları fan-out havuzunda çek; son_zaman'a kadar bitenleri üret"""
+    futures = {_fanout_executor.submit(durak_verisi_cek, d, son_zaman): i for i, d in enumerate(hedefler)}
+    kalan = kalan_sure(son_zaman)
+    try:
+        for future in as_completed(futures, timeout=None if kalan is None else max(kalan, 0.0)):
+            yield futures[future], future.result()
+    except FuturesTimeoutError:
+        return
+
+def _async_akis(hedefler: List[Dict], son_zaman: Optional[float]) -> Iterator[Tuple[int, Dict]]:
+    """Hazır olanları hemen, kalanları async motor bitirdikçe (son_zaman'a kadar) üret"""
+    eksikler = []
+    for i, durak in enumerate(hedefler):
+        bulunan = _hazir_veri(durak['url'])
+        if bulunan is None:
+            eksikler.append(i)
+            continue
+        veri = _onbellek_bilgisi_ekle(*bulunan)
+        veri['durak_adi'] = durak.get('ad', 'Bilinmeyen')
+        veri['durak_id'] = durak.get('id')
+        yield i, veri
+    if not eksikler:
+        return
+
+    # Loop thread'inden (ve bekleyen thread'lerden) gelen sonuçları kuyruk
+    # üzerinden bu thread'e aktar; ikinci alan sonucun önbelleğe işlenip işlenmediği
+    biten: 'queue.Queue[Tuple[int, Dict, bool]]' = queue.Queue()
+    toplam = len(eksikler)
+
+    # Başka bir worker'ın çekmekte olduğu duraklar onun sonucunu bekler
+    for i in [i for i in eksikler if not onbellek.kira_al(hedefler[i]['url'])]:
+        _fanout_executor.submit(durak_verisi_cek, hedefler[i], son_zaman).add_done_callback(
+            lambda f, i=i: biten.put((i, f.result(), True)))
+        eksikler.remove(i)
+    siralar = {id(hedefler[i]): i for i in eksikler}
+
+    def bitince(durak: Dict, veri: Dict):
+        biten.put((siralar[id(durak)], veri, False))
+
+    future = async_kopru.gonder(
+        lambda istemci, duraklar: istemci.tum_duraklari_cek(duraklar, bitince, son_zaman),
+        [hedefler[i] for i in eksikler])
+    for gelen in range(toplam):
+        kalan = kalan_sure(son_zaman)
+        try:
+            i, veri, hazir = biten.get(timeout=None if kalan is None else max(kalan, 0.0))
+        except queue.Empty:
+            # Bütçe doldu: geç kalanlar bitince arka planda önbelleğe işlenir
+            _fanout_executor.submit(_gec_kalanlari_isle, biten, hedefler, toplam - gelen)
+            return
+        if hazir:
+            yield i, veri
+        else:
+            yield i, _onbellek_bilgisi_ekle(*onbellek.getir(hedefler[i]['url'], lambda veri=veri: veri))
+    future.result()
+
+def _gec_kalanlari_isle(biten: 'queue.Queue[Tuple[int, Dict, bool]]', hedefler: List[Dict], adet: int):
+    """Süre bütçesinden sonra biten async çekimleri önbelleğe işle"""
+    for _ in range(adet):
+        try:
+            # Çekimlerin kendi timeout'ları var; bu sadece takılmaya karşı bir emniyet
+            i, veri, hazir = biten.get(timeout=300)
+        except queue.Empty:
+            return
+        if not hazir:
+            onbellek.getir(hedefler[i]['url'], lambda veri=veri: veri)
+
+def _canliya_yayinla(durak: Dict, veri: Dict):
+    """Başarılı ve tamamlanmış sonucu durak bilgisiyle birlikte sürüm defterine (canlı akışa) işle"""
+    if not veri.get('success') or veri.get('pending'):
+        return
+    yayin = _onbellek_bilgisi_ekle(veri, 0.0, 'canli')
+    yayin['durak_adi'] = durak.get('ad', 'Bilinmeyen')
+    yayin['durak_id'] = durak.get('id')
+    surum_defteri.guncelle(yayin)
+
+def _poller_icin_cek(hedefler: List[Dict]) -> List[Dict]:
+    """
+    Poller turu: tüm durakları taze çek (yarım turdan yeni kaydı olanlar hariç), önbelleği de güncelle
+
+    Her durak parse edilir edilmez canlı akışa yayınlanır; turun sonunda
+    silinmiş duraklar defterden düşülür.
+    """
+    # Bu turun yarısından yeni kayıtlar (ör. başka bir worker'ın poller'ı çekti) tekrar çekilmez
+    max_yas = poller.interval / 2
+    sonuclar: List[Optional[Dict]] = [None] * len(hedefler)
+    if FETCH_ENGINE == 'async':
+        eksikler = []
+        for i, durak in enumerate(hedefler):
+            mevcut = onbellek.get(durak['url'])
+            if mevcut is not None and mevcut[1] <= max_yas:
+                sonuclar[i] = mevcut[0]
+                _canliya_yayinla(durak, mevcut[0])
+            else:
+                eksikler.append(i)
+        cekilenler = async_kopru.tum_duraklari_cek([hedefler[i] for i in eksikler], geri_cagir=_canliya_yayinla)
+        for i, veri in zip(eksikler, cekilenler):
+            sonuclar[i] = veri
+            onbellek.kaydet(hedefler[i]['url'], veri)
+    else:
+        futures = {_fanout_executor.submit(onbellek.tazele, d['url'],
+                                           partial(tekil_durak_verisi, d['url']), max_yas): i
+                   for i, d in enumerate(hedefler)}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                sonuclar[i] = future.result()
+            except Exception as e:
+                sonuclar[i] = {'success': False, 'error': str(e), 'timestamp': datetime.now().isoformat()}
+            _canliya_yayinla(hedefler[i], sonuclar[i])
+    surum_defteri.budama([d.get('id') for d in hedefler])
+    return sonuclar
+
+# Arka plan poller'ı: açıkken route'lar snapshot'tan cevap verir (ATM_POLLER=true)
+poller = DurakPoller(load_duraklar, _poller_icin_cek)
+if POLLER_ENABLED:
+    poller.start()
+
 @app.route('/')
 def index():
     """Ana sayfa"""
@@ -424,14 +529,31 @@ def health_check():
         'service': 'ATM Messina Bot'
     }), 200
 
+@app.route('/api/istatistik', methods=['GET'])
+def get_istatistik():
+    """Önbellek ve fetch katmanı istatistikleri"""
+    return jsonify({
+        'cache': onbellek.istatistik(),
+        'singleflight': tek_ucus.istatistik(),
+        'poller': poller.istatistik(),
+        'parser': strateji_hafizasi.istatistik(),
+        'sayfa': sayfa_hafizasi.istatistik(),
+        'delta': surum_defteri.istatistik(),
+        'depo': depo.istatistik(),
+        'gecmis': gecmis.istatistik() if gecmis is not None else None,
+        'analiz': analiz.istatistik() if analiz is not None else None,
+        'gecikme': gecikme_takipcisi.istatistik() if gecikme_takipcisi is not None else None,
+        'hiz_siniri': hiz_sinirlayici.istatistik(),
+        'devre_kesici': devre_istatistik(),
+        'timestamp': datetime.now().isoformat()
+    })
+
 @app.route('/api/duraklar', methods=['GET'])
 def get_duraklar():
     """Tüm durakları getir"""
     try:
-        duraklar = load_duraklar()
-        response = jsonify(duraklar)
-        response.headers['Content-Type'] = 'application/json; charset=utf-8'
-        return response
+        # Dosya değişmediyse okumadan/serialize etmeden 304
+        return kosullu_json(f'duraklar-{depo.surum()}', load_duraklar)
     except Exception as e:
         response = jsonify({'success': False, 'error': str(e), 'duraklar': []})
         response.headers['Content-Type'] = 'application/json; charset=utf-8'
@@ -454,34 +576,74 @@ def add_durak():
             response.headers['Content-Type'] = 'application/json; charset=utf-8'
             return response, 400
         
-        duraklar = load_duraklar()
-        
-        # Yeni ID: Mevcut durakların en yüksek ID'sini bul ve +1 yap
-        # Eğer hiç durak yoksa 1'den başla
-        if duraklar:
-            max_id = max((d.get('id', 0) for d in duraklar), default=0)
-            yeni_id = max_id + 1
-        else:
-            yeni_id = 1
+        # Yeni ID: Mevcut durakların en yüksek ID'si + 1 (depo atar)
+        yeni_durak = depo.ekle(_yeni_durak_alanlari({**data, 'favori': False}))
         
-        yeni_durak = {
-            'id': yeni_id,
-            'ad': data.get('ad', 'İsimsiz Durak'),
-            'url': data.get('url', ''),
-            'not': data.get('not', ''),
-            'favori': False,
-            'eklenme_tarihi': datetime.now().isoformat()
-        }
+        response = jsonify(yeni_durak)
+        response.headers['Content-Type'] = 'application/json; charset=utf-8'
+        return response, 201
+    except Exception as e:
+        response = jsonify({'success': False, 'error': str(e)})
+        response.headers['Content-Type'] = 'application/json; charset=utf-8'
+        return response, 500
+
+def _yeni_durak_alanlari(data: Dict) -> Dict:
+    """İstek verisinden yeni durak alanları (id hariç)"""
+    return {
+        'ad': data.get('ad', 'İsimsiz Durak'),
+        'url': data.get('url', ''),
+        'not': data.get('not', ''),
+        'favori': bool(data.get('favori', False)),
+        'eklenme_tarihi': datetime.now().isoformat()
+    }
+
+def _toplu_govdeyi_oku() -> List:
+    """Toplu ekleme gövdesi: JSON dizisi veya NDJSON (satır başına bir durak)"""
+    if request.mimetype == 'application/x-ndjson':
+        kayitlar = []
+        for satir_no, satir in enumerate(request.get_data(as_text=True).splitlines(), 1):
+            if not satir.strip():
+                continue
+            try:
+                kayitlar.append(json.loads(satir))
+            except json.JSONDecodeError as e:
+                raise ValueError(f'{satir_no}. satır geçersiz JSON: {e}')
+        return kayitlar
+    data = request.get_json(silent=True)
+    if not isinstance(data, list):
+        raise ValueError('Gövde bir JSON dizisi (veya application/x-ndjson) olmalı')
+    return data
+
+@app.route('/api/duraklar/bulk', methods=['POST'])
+def bulk_add_duraklar():
+    """
+    Toplu durak ekle: JSON dizisi veya NDJSON
+
+    Tüm kayıtlar önce doğrulanır; biri bile hatalıysa hiçbiri eklenmez.
+    id'ler tek seferde verilir ve depoya tek yazmada kaydedilir.
+    """
+    try:
+        try:
+            kayitlar = _toplu_govdeyi_oku()
+        except ValueError as e:
+            response = jsonify({'success': False, 'error': str(e)})
+            response.headers['Content-Type'] = 'application/json; charset=utf-8'
+            return response, 400
         
-        duraklar.append(yeni_durak)
-        save_duraklar(duraklar)
+        hatalar = []
+        for i, kayit in enumerate(kayitlar):
+            if not isinstance(kayit, dict):
+                hatalar.append({'index': i, 'error': 'Kayıt bir nesne olmalı'})
+            elif not kayit.get('ad') or not kayit.get('url'):
+                hatalar.append({'index': i, 'error': 'Durak adı ve URL gerekli'})
+        if hatalar:
+            response = jsonify({'success': False, 'error': f'{len(hatalar)} kayıt geçersiz', 'hatalar': hatalar})
+            response.headers['Content-Type'] = 'application/json; charset=utf-8'
+            return response, 400
         
-        # Kaydetme işleminin başarılı olduğunu doğrula
-        kaydedilen_duraklar = load_duraklar()
-        if not any(d.get('id') == yeni_id for d in kaydedilen_duraklar):
-            raise Exception('Durak kaydedilemedi - dosya yazma hatası')
+        eklenenler = depo.toplu_ekle([_yeni_durak_alanlari(k) for k in kayitlar])
         
-        response = jsonify(yeni_durak)
+        response = jsonify({'success': True, 'eklenen': len(eklenenler), 'duraklar': eklenenler})
         response.headers['Content-Type'] = 'application/json; charset=utf-8'
         return response, 201
     except Exception as e:
@@ -489,13 +651,53 @@ def add_durak():
         response.headers['Content-Type'] = 'application/json; charset=utf-8'
         return response, 500
 
+@app.route('/api/duraklar/export', methods=['GET'])
+def export_duraklar():
+    """
+    Tüm durakları akış olarak dışa aktar
+
+    Varsayılan NDJSON'dur (bulk ile doğrudan geri yüklenebilir); ?format=json
+    verilirse aynı içerik tek bir JSON dizisi olarak akar.
+    """
+    duraklar = load_duraklar()
+    parca = 500  # yield başına satır
+
+    if request.args.get('format') == 'json':
+        def akis():
+            yield '['
+            for i in range(0, len(duraklar), parca):
+                yield (',' if i else '') + ','.join(
+                    json.dumps(d, ensure_ascii=False) for d in duraklar[i:i + parca])
+            yield ']\n'
+        mimetype, uzanti = 'application/json', 'json'
+    else:
+        def akis():
+            for i in range(0, len(duraklar), parca):
+                yield ''.join(json.dumps(d, ensure_ascii=False) + '\n' for d in duraklar[i:i + parca])
+        mimetype, uzanti = 'application/x-ndjson', 'ndjson'
+
+    response = Response(akis(), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=duraklar.{uzanti}'
+    return response
+
+@app.route('/api/duraklar/palina/<palina>', methods=['GET'])
+def get_palina_duraklari(palina):
+    """Bu palina numarasını takip eden duraklar (indeksten, tarama yapmadan)"""
+    try:
+        duraklar = depo.palina_ile_bul(palina)
+        response = jsonify({'success': True, 'palina': palina, 'takipte': bool(duraklar), 'duraklar': duraklar})
+        response.headers['Content-Type'] = 'application/json; charset=utf-8'
+        return response
+    except Exception as e:
+        response = jsonify({'success': False, 'error': str(e)})
+        response.headers['Content-Type'] = 'application/json; charset=utf-8'
+        return response, 500
+
 @app.route('/api/duraklar/<int:durak_id>', methods=['DELETE'])
 def delete_durak(durak_id):
     """Durak sil"""
     try:
-        duraklar = load_duraklar()
-        duraklar = [d for d in duraklar if d.get('id') != durak_id]
-        save_duraklar(duraklar)
+        depo.sil(durak_id)
         response = jsonify({'success': True})
         response.headers['Content-Type'] = 'application/json; charset=utf-8'
         return response
@@ -514,25 +716,16 @@ def update_durak(durak_id):
             return response, 400
         
         data = request.get_json() or {}
-        duraklar = load_duraklar()
         
-        durak = next((d for d in duraklar if d.get('id') == durak_id), None)
+        # Güncelle
+        alanlar = {k: data[k] for k in ('ad', 'url', 'not') if k in data}
+        alanlar['guncelleme_tarihi'] = datetime.now().isoformat()
+        durak = depo.guncelle(durak_id, alanlar)
         if not durak:
             response = jsonify({'success': False, 'error': 'Durak bulunamadı'})
             response.headers['Content-Type'] = 'application/json; charset=utf-8'
             return response, 404
         
-        # Güncelle
-        if 'ad' in data:
-            durak['ad'] = data['ad']
-        if 'url' in data:
-            durak['url'] = data['url']
-        if 'not' in data:
-            durak['not'] = data['not']
-        durak['guncelleme_tarihi'] = datetime.now().isoformat()
-        
-        save_duraklar(duraklar)
-        
         response = jsonify(durak)
         response.headers['Content-Type'] = 'application/json; charset=utf-8'
         return response
@@ -545,19 +738,15 @@ def update_durak(durak_id):
 def toggle_favori(durak_id):
     """Favori durumu değiştir"""
     try:
-        duraklar = load_duraklar()
-        durak = next((d for d in duraklar if d.get('id') == durak_id), None)
+        # Favori durumunu toggle et
+        favori = depo.favori_degistir(durak_id)
         
-        if not durak:
+        if favori is None:
             response = jsonify({'success': False, 'error': 'Durak bulunamadı'})
             response.headers['Content-Type'] = 'application/json; charset=utf-8'
             return response, 404
         
-        # Favori durumunu toggle et
-        durak['favori'] = not durak.get('favori', False)
-        save_duraklar(duraklar)
-        
-        response = jsonify({'success': True, 'favori': durak['favori']})
+        response = jsonify({'success': True, 'favori': favori})
         response.headers['Content-Type'] = 'application/json; charset=utf-8'
         return response
     except Exception as e:
@@ -569,8 +758,7 @@ def toggle_favori(durak_id):
 def get_durak_veri(durak_id):
     """Belirli bir durağın verisini çek"""
     try:
-        duraklar = load_duraklar()
-        durak = next((d for d in duraklar if d.get('id') == durak_id), None)
+        durak = depo.getir(durak_id)
         
         if not durak:
             response = jsonify({'success': False, 'error': 'Durak bulunamadı'})
@@ -583,13 +771,13 @@ def get_durak_veri(durak_id):
             response.headers['Content-Type'] = 'application/json; charset=utf-8'
             return response, 400
         
-        veri = fetch_durak_data(url)
+        veri = sureli_durak_verisi(url, son_zaman_olustur(DEADLINE_STOP))
         veri['durak_adi'] = durak.get('ad', 'Bilinmeyen')
         veri['durak_id'] = durak_id
         
-        response = jsonify(veri)
-        response.headers['Content-Type'] = 'application/json; charset=utf-8'
-        return response
+        # ETag parse edilmiş verinin içerik özetidir (timestamp/cache alanları hariç);
+        # sürüm defterine dokunmaz, canlı akışı poller besler
+        return kosullu_json(f'{durak_id}-{parmak_izi(veri).hex()}', lambda: veri)
     except Exception as e:
         response = jsonify({'success': False, 'error': str(e)})
         response.headers['Content-Type'] = 'application/json; charset=utf-8'
@@ -597,30 +785,273 @@ def get_durak_veri(durak_id):
 
 @app.route('/api/duraklar/tum-veriler', methods=['GET'])
 def get_tum_veriler():
-    """Tüm durakların verilerini çek"""
+    """
+    Tüm durakların verilerini çek
+
+    ?since=<cursor> verilirse dizi yerine delta nesnesi döner: sadece o
+    cursor'dan sonra değişen duraklar ve yeni cursor. İlk istekte since
+    boş gönderilebilir (since=), bu durumda tüm duraklar gelir.
+
+    ?format=ndjson verilirse her durak çekilir çekilmez bir satır olarak
+    yazılır (application/x-ndjson); satırlarda durağın sırası 'sira' alanındadır.
+    """
     try:
         duraklar = load_duraklar()
-        sonuclar = []
+        if request.args.get('format') == 'ndjson':
+            return _tum_veriler_ndjson(duraklar)
         
-        for durak in duraklar:
-            url = durak.get('url')
-            if url:
-                try:
-                    veri = fetch_durak_data(url)
-                    veri['durak_adi'] = durak.get('ad', 'Bilinmeyen')
-                    veri['durak_id'] = durak.get('id')
-                    sonuclar.append(veri)
-                    time.sleep(0.5)  # Rate limiting
-                except Exception as e:
-                    # Bir durakta hata olsa bile diğerlerini çekmeye devam et
-                    sonuclar.append({
-                        'success': False,
-                        'durak_adi': durak.get('ad', 'Bilinmeyen'),
-                        'durak_id': durak.get('id'),
-                        'error': str(e)
-                    })
+        sonuclar = tum_duraklari_cek(duraklar, son_zaman_olustur(DEADLINE_ALL))
         
-        response = jsonify(sonuclar)
+        # ETag: sonuç kümesinin cursor'ı (delta modunda since ile birlikte)
+        if 'since' in request.args:
+            delta = surum_defteri.delta(sonuclar, request.args.get('since'))
+            return kosullu_json(f"{delta['cursor']}~{request.args.get('since')}", lambda: delta)
+        _, cursor = surum_defteri.isle(sonuclar)
+        return kosullu_json(cursor, lambda: sonuclar)
+    except Exception as e:
+        response = jsonify({'success': False, 'error': str(e)})
+        response.headers['Content-Type'] = 'application/json; charset=utf-8'
+        return response, 500
+
+def _tum_veriler_ndjson(duraklar: List[Dict]) -> Response:
+    """tum-veriler'in akış hali: bitiş sırasıyla satır başına bir durak"""
+    def akis():
+        idler = []
+        for sira, veri in tum_duraklari_akis(duraklar, son_zaman_olustur(DEADLINE_ALL)):
+            # Başarısız/bekleyen satırlar defteri değiştirmez, durak yine de listede kalır
+            surum_defteri.guncelle(veri)
+            idler.append(veri.get('durak_id'))
+            satir = dict(veri)
+            satir['sira'] = sira
+            yield json.dumps(satir, ensure_ascii=False) + '\n'
+        surum_defteri.budama(idler)
+
+    response = Response(akis(), mimetype='application/x-ndjson')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def _sse_olayi(olay: str, veri: Dict, olay_id: Optional[str] = None) -> str:
+    """Tek bir SSE olayını metin olarak biçimlendir"""
+    satirlar = []
+    if olay_id:
+        satirlar.append(f'id: {olay_id}')
+    satirlar.append(f'event: {olay}')
+    satirlar.append('data: ' + json.dumps(veri, ensure_ascii=False))
+    return '\n'.join(satirlar) + '\n\n'
+
+@app.route('/api/duraklar/canli', methods=['GET'])
+def canli_akis():
+    """
+    Canlı varışlar (Server-Sent Events)
+
+    Olaylar:
+        tam     - bağlanınca (veya geride kalınca) tüm duraklar: cursor, idler, duraklar
+        durak   - verisi değişen tek bir durak
+        silindi - silinen durak: {durak_id}
+    Her olayın id'si bir cursor'dır; tarayıcı yeniden bağlanırken Last-Event-ID
+    ile gönderir ve sadece kaçırdığı olaylar tekrar oynatılır.
+
+    Worker başına en fazla ATM_SSE_MAX_STREAMS akış açık kalır; dolunca 503
+    döner (EventSource kapanır, arayüz polling'e geçer). Canlı veri poller'dan
+    gelir: ATM_POLLER kapalıysa poller ilk abonede başlar ve son abone
+    ayrıldıktan ATM_POLLER_IDLE saniye sonra durur.
+    """
+    if not _sse_yuvalari.acquire(blocking=False):
+        response = jsonify({'success': False, 'error': 'Canlı akış kapasitesi dolu'})
+        response.headers['Content-Type'] = 'application/json; charset=utf-8'
+        response.headers['Retry-After'] = str(max(1, SSE_RETRY_MS // 1000))
+        return response, 503
+    poller.abone_ol()
+    birakildi = threading.Event()
+
+    def yuvayi_birak():
+        # Yanıt kapanınca (akış bitti veya istemci koptu) bir kez bırak
+        if not birakildi.is_set():
+            birakildi.set()
+            _sse_yuvalari.release()
+            poller.abonelikten_cik()
+
+    try:
+        return _canli_akis_yaniti(yuvayi_birak)
+    except BaseException:
+        yuvayi_birak()
+        raise
+
+def _canli_akis_yaniti(yuvayi_birak) -> Response:
+    son = surum_defteri.cursor_coz(request.headers.get('Last-Event-ID') or request.args.get('since'))
+
+    def akis(son: Optional[int]):
+        yield f'retry: {SSE_RETRY_MS}\n\n'
+        bitis = time.monotonic() + SSE_MAX_SURE
+        while True:
+            if son is None:
+                tam = surum_defteri.delta(
+                    tum_duraklari_cek(load_duraklar(), son_zaman_olustur(DEADLINE_ALL)), None)
+                yield _sse_olayi('tam', tam, tam['cursor'])
+                son = surum_defteri.cursor_coz(tam['cursor'])
+            if time.monotonic() >= bitis:
+                # Bağlantıyı kapat; istemci Last-Event-ID ile kaldığı yerden devam eder
+                return
+            olaylar = surum_defteri.olaylari_bekle(son, min(SSE_HEARTBEAT, max(bitis - time.monotonic(), 0.1)))
+            if olaylar is None:
+                # Kaçırılan olaylar halkadan düşmüş: tam liste gönder
+                son = None
+            elif not olaylar:
+                yield ': ping\n\n'
+            else:
+                for surum, tur, veri in olaylar:
+                    yield _sse_olayi(tur, veri, f'{surum_defteri.donem}:{surum}')
+                son = olaylar[-1][0]
+
+    response = Response(akis(son), mimetype='text/event-stream')
+    response.call_on_close(yuvayi_birak)
+    response.headers['Cache-Control'] = 'no-cache'
+    # Nginx vb. proxy'ler akışı tamponlamasın
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def _zaman_parametresi(ad: str) -> Optional[float]:
+    """Sorgu parametresindeki zaman: unix saniye veya ISO tarih/saat"""
+    deger = request.args.get(ad)
+    if not deger:
+        return None
+    try:
+        return float(deger)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(deger).timestamp()
+    except ValueError:
+        raise ValueError(f'Geçersiz {ad}: {deger}')
+
+@app.route('/api/gecmis', methods=['GET'])
+def get_gecmis():
+    """
+    Kaydedilmiş varış geçmişi
+
+    Parametreler: durak_id veya palina, hat, baslangic, bitis (unix saniye
+    veya ISO), limit (varsayılan 1000, en fazla 10000)
+    """
+    if gecmis is None:
+        response = jsonify({'success': False, 'error': 'Varış geçmişi kapalı (açmak için ATM_HISTORY=true)'})
+        response.headers['Content-Type'] = 'application/json; charset=utf-8'
+        return response, 404
+    try:
+        palina = request.args.get('palina')
+        durak_id = request.args.get('durak_id', type=int)
+        if durak_id is not None:
+            durak = depo.getir(durak_id)
+            if not durak:
+                response = jsonify({'success': False, 'error': 'Durak bulunamadı'})
+                response.headers['Content-Type'] = 'application/json; charset=utf-8'
+                return response, 404
+            palina = palina_numarasi(durak.get('url'))
+        if palina is not None and not palina.isdigit():
+            raise ValueError(f'Geçersiz palina: {palina}')
+        baslangic = _zaman_parametresi('baslangic')
+        bitis = _zaman_parametresi('bitis')
+        limit = min(max(request.args.get('limit', 1000, type=int), 0), 10000)
+    except ValueError as e:
+        response = jsonify({'success': False, 'error': str(e)})
+        response.headers['Content-Type'] = 'application/json; charset=utf-8'
+        return response, 400
+
+    try:
+        kayitlar = gecmis.sorgula(palina=int(palina) if palina else None, hat=request.args.get('hat'),
+                                  baslangic=baslangic, bitis=bitis, limit=limit)
+        response = jsonify({
+            'success': True,
+            'palina': palina,
+            'hat': request.args.get('hat'),
+            'sayi': len(kayitlar),
+            'kayitlar': kayitlar
+        })
+        response.headers['Content-Type'] = 'application/json; charset=utf-8'
+        return response
+    except Exception as e:
+        response = jsonify({'success': False, 'error': str(e)})
+        response.headers['Content-Type'] = 'application/json; charset=utf-8'
+        return response, 500
+
+@app.route('/api/analiz/duzenlilik', methods=['GET'])
+def get_duzenlilik():
+    """
+    Hat düzenliliği: gözlenen sefer aralıkları, varyans, yığılma ve boşluklar
+
+    Parametreler: durak_id veya palina, hat, baslangic ve bitis (YYYY-MM-DD,
+    varsayılan son 7 gün)
+    """
+    if analiz is None:
+        response = jsonify({'success': False, 'error': 'Varış geçmişi kapalı (açmak için ATM_HISTORY=true)'})
+        response.headers['Content-Type'] = 'application/json; charset=utf-8'
+        return response, 404
+    try:
+        palina = request.args.get('palina')
+        durak_id = request.args.get('durak_id', type=int)
+        if durak_id is not None:
+            durak = depo.getir(durak_id)
+            if not durak:
+                response = jsonify({'success': False, 'error': 'Durak bulunamadı'})
+                response.headers['Content-Type'] = 'application/json; charset=utf-8'
+                return response, 404
+            palina = palina_numarasi(durak.get('url'))
+        if palina is not None and not palina.isdigit():
+            raise ValueError(f'Geçersiz palina: {palina}')
+        simdi = datetime.now()
+        bitis = request.args.get('bitis') or simdi.strftime('%Y-%m-%d')
+        baslangic = request.args.get('baslangic') or datetime.fromtimestamp(
+            simdi.timestamp() - 6 * 86400).strftime('%Y-%m-%d')
+        for ad, deger in (('baslangic', baslangic), ('bitis', bitis)):
+            try:
+                datetime.strptime(deger, '%Y-%m-%d')
+            except ValueError:
+                raise ValueError(f'Geçersiz {ad} (YYYY-MM-DD): {deger}')
+    except ValueError as e:
+        response = jsonify({'success': False, 'error': str(e)})
+        response.headers['Content-Type'] = 'application/json; charset=utf-8'
+        return response, 400
+
+    try:
+        sonuc = analiz.duzenlilik(baslangic, bitis, palina=int(palina) if palina else None,
+                                  hat=request.args.get('hat'))
+        response = jsonify({'success': True, 'baslangic': baslangic, 'bitis': bitis, **sonuc})
+        response.headers['Content-Type'] = 'application/json; charset=utf-8'
+        return response
+    except Exception as e:
+        response = jsonify({'success': False, 'error': str(e)})
+        response.headers['Content-Type'] = 'application/json; charset=utf-8'
+        return response, 500
+
+@app.route('/api/gecikme', methods=['GET'])
+def get_gecikme():
+    """
+    Gerçek zamanlı tahmin ile tarife arasındaki gecikme
+
+    Parametreler: hat, durak_id veya palina. Yanıt: hat başına kayan pencere
+    dağılımı (p50/p90, dakika) ve izlenen seferlerin anlık gecikmesi
+    """
+    if gecikme_takipcisi is None:
+        response = jsonify({'success': False, 'error': 'Gecikme takibi kapalı (açmak için ATM_DELAY_TRACKING=true)'})
+        response.headers['Content-Type'] = 'application/json; charset=utf-8'
+        return response, 404
+    try:
+        hat = request.args.get('hat')
+        palina = request.args.get('palina')
+        durak_id = request.args.get('durak_id', type=int)
+        if durak_id is not None:
+            durak = depo.getir(durak_id)
+            if not durak:
+                response = jsonify({'success': False, 'error': 'Durak bulunamadı'})
+                response.headers['Content-Type'] = 'application/json; charset=utf-8'
+                return response, 404
+            palina = palina_numarasi(durak.get('url'))
+        response = jsonify({
+            'success': True,
+            'hatlar': gecikme_takipcisi.hatlar(hat),
+            'seferler': gecikme_takipcisi.seferler(palina=palina, hat=hat),
+            'timestamp': datetime.now().isoformat()
+        })
         response.headers['Content-Type'] = 'application/json; charset=utf-8'
         return response
     except Exception as e:
@@ -631,8 +1062,7 @@ def get_tum_veriler():
 @app.route('/api/debug/<int:durak_id>', methods=['GET'])
 def debug_durak(durak_id):
     """Debug: Durak HTML'ini göster"""
-    duraklar = load_duraklar()
-    durak = next((d for d in duraklar if d.get('id') == durak_id), None)
+    durak = depo.getir(durak_id)
     
     if not durak:
         return jsonify({'error': 'Durak bulunamadı'}), 404
@@ -642,18 +1072,7 @@ def debug_durak(durak_id):
         return jsonify({'error': 'Durak URL\'si yok'}), 400
     
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
-        session = create_session()
-        try:
-            response = session.get(url, headers=headers, timeout=(10, 30))
-            response.raise_for_status()
-        except requests.exceptions.Timeout:
-            time.sleep(3)
-            response = session.get(url, headers=headers, timeout=(15, 45))
-            response.raise_for_status()
-        response.encoding = response.apparent_encoding or 'utf-8'
+        response = _sayfa_getir(get_session(), url)
         soup = BeautifulSoup(response.content, 'html.parser')
         
         return jsonify({
@@ -668,7 +1087,7 @@ def debug_durak(durak_id):
 
 if __name__ == '__main__':
     # Örnek duraklar dosyası oluştur (eğer yoksa)
-    if not os.path.exists(DURAKLAR_FILE):
+    if not os.path.exists(DURAKLAR_FILE) and not load_duraklar():
         ornek_duraklar = [
             {
                 'id': 1,
@@ -687,7 +1106,7 @@ if __name__ == '__main__':
     print("🚌 ATM Messina Otobüs Takip Sistemi")
     print("=" * 60)
     print(f"🌐 Uygulama başlatılıyor: http://0.0.0.0:{port}")
-    print(f"📁 Duraklar dosyası: {DURAKLAR_FILE}")
+    print(f"📁 Duraklar: {depo.depolama.ad} ({getattr(depo.depolama, 'yol', DURAKLAR_FILE)})")
     print("=" * 60)
     
     app.run(debug=debug, host='0.0.0.0', port=port)
@@ -0,0 +1,956 @@
+"""
+ATM Messina durak sayfası parser'ı
+smartpoles2.php HTML'inden durak adını ve otobüs listesini çıkarır
+
+Backend'ler:
+    lxml        - C tabanlı, en hızlı (kuruluysa varsayılan)
+    html.parser - Standart kütüphane, BeautifulSoup ağacı kurmadan tek geçiş
+    bs4         - Eski BeautifulSoup uygulaması (referans, karşılaştırma için)
+
+Hızlı backend'ler sayfayı bir kez dolaşıp metin parçalarını ve tablo/satır/hücre
+sınırlarını çıkarır; tüm stratejiler bu özet üzerinde çalışır.
+"""
+
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Tuple
+
+from bs4 import BeautifulSoup
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+
+# 'auto': lxml varsa lxml, yoksa html.parser
+PARSER_BACKEND = os.environ.get('ATM_PARSER_BACKEND', 'auto').lower()
+# Strateji hafızasında tutulacak en fazla durak/sayfa düzeni sayısı
+STRATEJI_HAFIZA_BOYUTU = int(os.environ.get('ATM_PARSER_MEMO_SIZE', 4096))
+
+# Önceden derlenmiş desenler
+_FERMATA_RE = re.compile(r'FERMATA[^•]*•[^*]*\*\*_?([^*]+?)_?\*\*', re.IGNORECASE)
+_KALIN_AD_RE = re.compile(r'\*\*_?([^*]+?)_?\*\*')
+_UCLU_RE = re.compile(r'\*\*(\d+[A-Z\s]*)\*\*\s*\*\*([^*]+?)\*\*\s*\*\*(\d{1,2}):(\d{1,2})\*\*', re.IGNORECASE)
+_UCLU_HTML_RE = re.compile(_UCLU_RE.pattern, re.IGNORECASE | re.DOTALL)
+_HUCRE_LINEA_RE = re.compile(r'\s*\*\*(\d+[A-Z\s]*)\*\*\s*', re.IGNORECASE)
+_HUCRE_VARIS_RE = re.compile(r'\s*\*\*([^*]+?)\*\*\s*', re.IGNORECASE)
+_HUCRE_SAAT_RE = re.compile(r'\s*\*\*(\d{1,2}):(\d{1,2})\*\*\s*', re.IGNORECASE)
+_YILDIZ_RE = re.compile(r'\*+')
+_LINEA_RE = re.compile(r'^\d+[A-Z\s]*$')
+_SAAT_RE = re.compile(r'(\d{1,2}):(\d{1,2})')
+_SAAT_BASI_RE = re.compile(r'^\d{1,2}:\d{2}')
+_METIN_LINEA_RE = re.compile(r'\b(\d+[A-Z\s]*)\b')
+_KALIN_RE = re.compile(r'\*\*([^*]+)\*\*')
+_ETIKET_RE = re.compile(r'<(/?)([A-Za-z][A-Za-z0-9]*)')
+_META_CHARSET_RE = re.compile(rb'<meta[^>]+charset=["\']?([A-Za-z0-9_\-]+)', re.IGNORECASE)
+
+_BASLIK_ETIKETLERI = frozenset(('h1', 'h2', 'h3', 'p', 'div', 'b', 'strong'))
+_HUCRE_ETIKETLERI = frozenset(('td', 'th'))
+_BASLIK_HUCRELERI = frozenset(('linea', 'destinazione', 'orario'))
+_HAM_ICERIK = frozenset(('script', 'style'))
+# BeautifulSoup'un hemen kapattığı boş elementler
+_BOS_ELEMENTLER = frozenset((
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link', 'menuitem',
+    'meta', 'param', 'source', 'track', 'wbr', 'basefont', 'bgsound', 'command', 'frame',
+    'image', 'isindex', 'nextid', 'spacer'
+))
+
+
+class _Hucre:
+    __slots__ = ('bas', 'son', 'temiz', 'onceki')
+
+    def __init__(self, bas: int, onceki: Optional['_Hucre']):
+        self.bas = bas
+        self.son = bas
+        # temiz: içinde alt element/yorum yok (HTML deseni sadece bunlarda eşleşir)
+        self.temiz = True
+        # onceki: arada sadece boşluk olan, hemen önce kapanmış hücre
+        self.onceki = onceki
+
+
+class _Satir:
+    __slots__ = ('bas', 'son', 'hucreler')
+
+    def __init__(self, bas: int):
+        self.bas = bas
+        self.son = bas
+        self.hucreler: List[_Hucre] = []
+
+
+class _Tablo:
+    __slots__ = ('bas', 'son', 'satirlar', 'hucreler')
+
+    def __init__(self, bas: int):
+        self.bas = bas
+        self.son = bas
+        self.satirlar: List[_Satir] = []
+        self.hucreler: List[_Hucre] = []
+
+
+class _Baslik:
+    __slots__ = ('bas', 'son')
+
+    def __init__(self, bas: int):
+        self.bas = bas
+        self.son = bas
+
+
+class _Sayfa:
+    """
+    Sayfanın tek geçişte çıkarılan özeti
+
+    Bir elementin metni, belgedeki metin parçalarının kesintisiz bir aralığıdır;
+    elementler bu yüzden sadece parça indekslerini (bas, son) tutar.
+    """
+
+    def __init__(self, parcalar: List[str], tablolar: List[_Tablo], basliklar: List[_Baslik],
+                 content: bytes = b'', ham_parcalar: Optional[Dict[int, str]] = None):
+        self.parcalar = parcalar
+        # str(element) çıktısında kaçışsız yazılan parçalar (CDATA): indeks -> ham hali
+        self.ham_parcalar = ham_parcalar or {}
+        self.tablolar = tablolar
+        self.basliklar = basliklar
+        self.metin = ''.join(parcalar)
+        self._ofsetler = None
+        self._html = None
+        self._content = content
+
+    def aralik(self, bas: int, son: int) -> str:
+        """Elementin get_text() karşılığı"""
+        if self._ofsetler is None:
+            ofsetler = [0]
+            toplam = 0
+            for parca in self.parcalar:
+                toplam += len(parca)
+                ofsetler.append(toplam)
+            self._ofsetler = ofsetler
+        return self.metin[self._ofsetler[bas]:self._ofsetler[son]]
+
+    def aralik_strip(self, bas: int, son: int) -> str:
+        """Elementin get_text(strip=True) karşılığı"""
+        return ''.join([p.strip() for p in self.parcalar[bas:son]])
+
+    def aralik_html(self, bas: int, son: int) -> str:
+        """Elementin metninin str(element) içindeki (kaçışlı) hali"""
+        if not self.ham_parcalar:
+            return _html_kacis(self.aralik(bas, son))
+        return ''.join([self.ham_parcalar[i] if i in self.ham_parcalar else _html_kacis(self.parcalar[i])
+                        for i in range(bas, son)])
+
+    @property
+    def html(self) -> str:
+        """
+        Sayfanın str(BeautifulSoup(...)) çıktısı (sadece son çare deseni için)
+
+        Eski parser bu deseni ham kaynakta değil bs4'ün yeniden yazdığı HTML'de
+        arar (<br/>, &amp; ...); 'tempo reale' yakınlık penceresi ve varış metni
+        ona göre değiştiğinden bu nadir yol bs4 ile birebir aynı kalsın diye
+        sayfa ihtiyaç olunca bs4 ile serialize edilir.
+        """
+        if self._html is None:
+            self._html = str(BeautifulSoup(self._content, 'html.parser'))
+        return self._html
+
+
+class _AgacKurucu:
+    """
+    Backend'lerden gelen başla/bitir/metin olaylarından _Sayfa kurar
+
+    Etiket kapatma kuralları BeautifulSoup'un html.parser ağacıyla aynıdır:
+    açık olmayan bir etiketin kapanışı yok sayılır, kapanış gelince aradaki
+    açık etiketler de kapanır.
+    """
+
+    def __init__(self):
+        self.parcalar: List[str] = []
+        self.tablolar: List[_Tablo] = []
+        self.basliklar: List[_Baslik] = []
+        self.ham_parcalar: Dict[int, str] = {}
+        self._yigin: List[Tuple[str, object]] = []
+        self._acik_sayisi: Dict[str, int] = {}
+        self._acik_tablolar: List[_Tablo] = []
+        self._acik_satirlar: List[_Satir] = []
+        self._son_kapanan_hucre: Optional[_Hucre] = None
+        self._son_metin = False
+
+    def baslat(self, etiket: str):
+        self._son_metin = False
+        if self._yigin:
+            ust = self._yigin[-1][1]
+            if ust.__class__ is _Hucre:
+                ust.temiz = False
+        konum = len(self.parcalar)
+        nesne = None
+        if etiket in _HUCRE_ETIKETLERI:
+            nesne = _Hucre(konum, self._son_kapanan_hucre)
+            for satir in self._acik_satirlar:
+                satir.hucreler.append(nesne)
+            for tablo in self._acik_tablolar:
+                tablo.hucreler.append(nesne)
+        elif etiket == 'tr':
+            nesne = _Satir(konum)
+            for tablo in self._acik_tablolar:
+                tablo.satirlar.append(nesne)
+            self._acik_satirlar.append(nesne)
+        elif etiket == 'table':
+            nesne = _Tablo(konum)
+            self.tablolar.append(nesne)
+            self._acik_tablolar.append(nesne)
+        elif etiket in _BASLIK_ETIKETLERI:
+            nesne = _Baslik(konum)
+            self.basliklar.append(nesne)
+        self._son_kapanan_hucre = None
+        self._yigin.append((etiket, nesne))
+        self._acik_sayisi[etiket] = self._acik_sayisi.get(etiket, 0) + 1
+
+    def _kapat(self) -> Tuple[str, object]:
+        etiket, nesne = self._yigin.pop()
+        self._acik_sayisi[etiket] -= 1
+        if nesne is not None:
+            nesne.son = len(self.parcalar)
+            if nesne.__class__ is _Tablo:
+                self._acik_tablolar.remove(nesne)
+            elif nesne.__class__ is _Satir:
+                self._acik_satirlar.remove(nesne)
+        return etiket, nesne
+
+    def bitir(self, etiket: str):
+        if not self._acik_sayisi.get(etiket):
+            return
+        self._son_metin = False
+        while self._yigin:
+            kapanan, nesne = self._kapat()
+            if kapanan == etiket:
+                break
+        self._son_kapanan_hucre = nesne if etiket in _HUCRE_ETIKETLERI else None
+
+    def metin(self, veri: str):
+        if not veri:
+            return
+        if self._yigin and self._yigin[-1][0] in _HAM_ICERIK:
+            return
+        if veri.strip():
+            self._son_kapanan_hucre = None
+        if self._son_metin:
+            # Ardışık metin olayları tek bir metin düğümüdür
+            self.parcalar[-1] += veri
+        else:
+            self.parcalar.append(veri)
+            self._son_metin = True
+
+    def cdata(self, veri: str):
+        """<![CDATA[...]]>: bs4'te komşu metinlerle birleşmeyen, kaçışsız yazılan metin düğümü"""
+        if self._yigin and self._yigin[-1][0] in _HAM_ICERIK:
+            return
+        if veri.strip():
+            self._son_kapanan_hucre = None
+        self.ham_parcalar[len(self.parcalar)] = f'<![CDATA[{veri}]]>'
+        self.parcalar.append(veri)
+        self._son_metin = False
+
+    def yorum(self):
+        self._son_metin = False
+        self._son_kapanan_hucre = None
+        if self._yigin:
+            ust = self._yigin[-1][1]
+            if ust.__class__ is _Hucre:
+                ust.temiz = False
+
+    def sayfa(self, content: bytes = b'') -> _Sayfa:
+        while self._yigin:
+            self._kapat()
+        return _Sayfa(self.parcalar, self.tablolar, self.basliklar, content, self.ham_parcalar)
+
+
+def _coz(content: bytes) -> str:
+    """Yanıt gövdesini çöz: BOM, meta charset, UTF-8, son çare windows-1252"""
+    if content.startswith(b'\xef\xbb\xbf'):
+        return content[3:].decode('utf-8', errors='replace')
+    meta = _META_CHARSET_RE.search(content, 0, 2048)
+    if meta:
+        try:
+            return content.decode(meta.group(1).decode('ascii'))
+        except (LookupError, UnicodeDecodeError):
+            pass
+    try:
+        return content.decode('utf-8')
+    except UnicodeDecodeError:
+        return content.decode('windows-1252', errors='replace')
+
+
+class _StdlibParser(HTMLParser):
+    """html.parser olaylarını doğrudan _AgacKurucu'ya aktarır (ara ağaç kurmadan)"""
+
+    def __init__(self, kurucu: _AgacKurucu):
+        super().__init__(convert_charrefs=True)
+        self.kurucu = kurucu
+
+    def handle_starttag(self, tag, attrs):
+        self.kurucu.baslat(tag)
+        if tag in _BOS_ELEMENTLER:
+            self.kurucu.bitir(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.kurucu.baslat(tag)
+        self.kurucu.bitir(tag)
+
+    def handle_endtag(self, tag):
+        if tag not in _BOS_ELEMENTLER:
+            self.kurucu.bitir(tag)
+
+    def handle_data(self, data):
+        self.kurucu.metin(data)
+
+    def handle_comment(self, data):
+        self.kurucu.yorum()
+
+    def handle_decl(self, decl):
+        self.kurucu.yorum()
+
+    def handle_pi(self, data):
+        self.kurucu.yorum()
+
+    def unknown_decl(self, data):
+        if data.upper().startswith('CDATA['):
+            self.kurucu.cdata(data[len('CDATA['):])
+        else:
+            self.kurucu.yorum()
+
+
+def _sayfa_stdlib(content: bytes) -> _Sayfa:
+    ham_html = _coz(content)
+    kurucu = _AgacKurucu()
+    parser = _StdlibParser(kurucu)
+    parser.feed(ham_html)
+    parser.close()
+    return kurucu.sayfa(content)
+
+
+_lxml_yerel = threading.local()
+
+
+def _lxml_parser():
+    # lxml parser nesneleri thread'ler arasında paylaşılmamalı
+    parser = getattr(_lxml_yerel, 'parser', None)
+    if parser is None:
+        parser = _lxml_yerel.parser = lxml_etree.HTMLParser(remove_comments=False)
+    return parser
+
+
+def _etiketler_dengeli(ham_html: str) -> bool:
+    """Boş elementler dışındaki her etiket için açılış ve kapanış sayısı eşit mi"""
+    acilan, kapanan = Counter(), Counter()
+    for kapanis, ad in _ETIKET_RE.findall(ham_html):
+        ad = ad.lower()
+        if ad not in _BOS_ELEMENTLER:
+            (kapanan if kapanis else acilan)[ad] += 1
+    return acilan == kapanan
+
+
+def _sayfa_lxml(content: bytes) -> _Sayfa:
+    # lxml.html yerine düz etree: element sınıfı araması olmadan çok daha hızlı.
+    # Meta charset olmayan sayfalarda libxml2 latin-1 varsaydığı için metni
+    # diğer backend'lerle aynı şekilde kendimiz çözüp veriyoruz.
+    ham_html = _coz(content)
+    try:
+        kok = lxml_etree.fromstring(ham_html, _lxml_parser())
+    except (lxml_etree.ParserError, lxml_etree.XMLSyntaxError, ValueError):
+        kok = None
+    if kok is None:
+        # Boş veya bozuk belge: standart kütüphane parser'ına düş
+        return _sayfa_stdlib(content)
+    if _lxml_parser().error_log or '<![' in ham_html or not _etiketler_dengeli(ham_html):
+        # libxml2 bozuk iç içeliği HTML kurallarıyla onarır (ör. kapanmamış <td>'yi
+        # sonraki <td>'de kapatır) ve CDATA bölümlerini sessizce atar; html.parser/bs4
+        # ise olduğu gibi bırakır. Ağaçlar farklı olacağından bu sayfalarda
+        # referansla aynı kurucuya düş.
+        return _sayfa_stdlib(content)
+    kurucu = _AgacKurucu()
+    # iterwalk yorum/PI düğümleri için olay üretmez; onların tail metni de
+    # kaybolmasın diye çocukları kendimiz (özyinelemesiz) geziyoruz
+    yigin = [(kok, False)]
+    while yigin:
+        el, kapanis = yigin.pop()
+        etiket = el.tag
+        if kapanis:
+            kurucu.bitir(etiket)
+            kurucu.metin(el.tail)
+            continue
+        if not isinstance(etiket, str):
+            # Yorum, PI (veya entity): kendisi metin değil ama tail'i metindir
+            if etiket is lxml_etree.Comment or etiket is lxml_etree.ProcessingInstruction:
+                kurucu.yorum()
+            kurucu.metin(el.tail)
+            continue
+        kurucu.baslat(etiket)
+        if etiket not in _HAM_ICERIK:
+            kurucu.metin(el.text)
+        yigin.append((el, True))
+        yigin.extend((cocuk, False) for cocuk in reversed(el))
+    return kurucu.sayfa(content)
+
+
+def _ekle(otobusler: List[Dict], gorulen: set, hat: str, varis: str, saat: str, tip: str):
+    """Aynı hat+saat ikilisi daha önce eklenmediyse otobüsü ekle"""
+    anahtar = (hat, saat)
+    if anahtar not in gorulen:
+        gorulen.add(anahtar)
+        otobusler.append({'hat': hat, 'varis': varis, 'saat': saat, 'tip': tip})
+
+
+def _saat(hour: str, minute: str) -> str:
+    return f"{hour.zfill(2)}:{minute.zfill(2)}"
+
+
+def _durak_adi_bul(sayfa: _Sayfa) -> str:
+    fermata_match = _FERMATA_RE.search(sayfa.metin)
+    if fermata_match:
+        return fermata_match.group(1).replace('_', '').strip()
+    # Alternatif: başlık elementlerinde ara
+    for baslik in sayfa.basliklar:
+        text = sayfa.aralik(baslik.bas, baslik.son)
+        if 'FERMATA' in text.upper():
+            match = _KALIN_AD_RE.search(text)
+            if match:
+                return match.group(1).replace('_', '').strip()
+    return 'Bilinmeyen Durak'
+
+
+def _strateji_metin(sayfa: _Sayfa) -> List[Dict]:
+    """Tablo yoksa: **32** **Staz. Centrale** **18:05** desenini sayfa metninde ara"""
+    otobusler, gorulen = [], set()
+    if sayfa.tablolar:
+        return otobusler
+    for match in _UCLU_RE.finditer(sayfa.metin):
+        _ekle(otobusler, gorulen, match.group(1).strip(), match.group(2).strip(),
+              _saat(match.group(3), match.group(4)), 'Schedulato')
+    return otobusler
+
+
+def _tablo_html_deseni(sayfa: _Sayfa, tablo: _Tablo, tempo_reale: bool,
+                       otobusler: List[Dict], gorulen: set):
+    """
+    Eski parser'ın str(table) üzerindeki <td>**32**</td><td>**..**</td><td>**18:05**</td>
+    deseninin karşılığı: aralarında sadece boşluk olan, ardışık üç temiz hücre
+    """
+    hucreler = tablo.hucreler
+    tip = 'Tempo Reale' if tempo_reale else 'Schedulato'
+    i = 0
+    son = len(hucreler) - 2
+    while i < son:
+        h1, h2, h3 = hucreler[i], hucreler[i + 1], hucreler[i + 2]
+        if h1.temiz and h2.temiz and h3.temiz and h2.onceki is h1 and h3.onceki is h2:
+            m1 = _HUCRE_LINEA_RE.fullmatch(sayfa.aralik_html(h1.bas, h1.son))
+            m2 = m1 and _HUCRE_VARIS_RE.fullmatch(sayfa.aralik_html(h2.bas, h2.son))
+            m3 = m2 and _HUCRE_SAAT_RE.fullmatch(sayfa.aralik(h3.bas, h3.son))
+            if m3:
+                _ekle(otobusler, gorulen, m1.group(1).strip(), m2.group(1).strip(),
+                      _saat(m3.group(1), m3.group(2)), tip)
+                i += 3
+                continue
+        i += 1
+
+
+def _html_kacis(metin: str) -> str:
+    # BeautifulSoup'un str() çıktısındaki minimal kaçış
+    if '&' in metin or '<' in metin or '>' in metin:
+        return metin.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+    return metin
+
+
+def _tempo_reale_mi(metin_kucuk: str) -> bool:
+    return 'tempo reale' in metin_kucuk or 'aggiornato' in metin_kucuk
+
+
+def _strateji_tablo(sayfa: _Sayfa) -> List[Dict]:
+    """Her tablo için önce HTML deseni, sonra hücre hücre tarama"""
+    otobusler, gorulen = [], set()
+    for tablo in sayfa.tablolar:
+        table_text = sayfa.aralik(tablo.bas, tablo.son)
+        _tablo_html_deseni(sayfa, tablo, _tempo_reale_mi(table_text.lower()), otobusler, gorulen)
+
+        satirlar = tablo.satirlar
+        satir_metinleri = [None] * len(satirlar)
+        for row_index, satir in enumerate(satirlar):
+            if len(satir.hucreler) < 2:
+                continue
+            cell_texts = [sayfa.aralik_strip(h.bas, h.son) for h in satir.hucreler]
+
+            # Başlık satırını atla
+            if any(text.lower() in _BASLIK_HUCRELERI for text in cell_texts):
+                continue
+
+            linea = ''
+            destinazione = ''
+            orario = ''
+            tip = 'Schedulato'
+
+            for text in cell_texts:
+                clean_text = _YILDIZ_RE.sub('', text).strip()
+                linea_mi = _LINEA_RE.match(clean_text) is not None
+                if linea_mi and not linea:
+                    linea = clean_text
+                    continue
+                time_match = _SAAT_RE.search(clean_text)
+                if time_match and not orario:
+                    orario = _saat(time_match.group(1), time_match.group(2))
+                    continue
+                if clean_text and len(clean_text) > 2 and not destinazione:
+                    if clean_text not in ('Linea', 'Destinazione', 'Orario'):
+                        if not linea_mi and not _SAAT_BASI_RE.match(clean_text):
+                            destinazione = clean_text
+
+            # Tip bilgisi aynı satırda veya sonraki satırda olabilir
+            if _tempo_reale_mi(sayfa.aralik_strip(satir.bas, satir.son).lower()):
+                tip = 'Tempo Reale'
+            elif row_index + 1 < len(satirlar):
+                sonraki = satir_metinleri[row_index + 1]
+                if sonraki is None:
+                    sonraki_satir = satirlar[row_index + 1]
+                    sonraki = sayfa.aralik_strip(sonraki_satir.bas, sonraki_satir.son).lower()
+                    satir_metinleri[row_index + 1] = sonraki
+                if _tempo_reale_mi(sonraki):
+                    tip = 'Tempo Reale'
+
+            if not orario:
+                time_match = _SAAT_RE.search(table_text)
+                if time_match:
+                    orario = _saat(time_match.group(1), time_match.group(2))
+
+            if not linea:
+                linea_match = _METIN_LINEA_RE.search(table_text)
+                if linea_match:
+                    potential_linea = linea_match.group(1).strip()
+                    if not _SAAT_BASI_RE.match(potential_linea):
+                        linea = potential_linea
+
+            if linea and orario:
+                _ekle(otobusler, gorulen, linea, destinazione if destinazione else 'Bilinmiyor', orario, tip)
+    return otobusler
+
+
+def _strateji_html(sayfa: _Sayfa) -> List[Dict]:
+    """Son çare 1: desen ham HTML'de; yakınında 'tempo reale' varsa gerçek zamanlı"""
+    otobusler, gorulen = [], set()
+    page_html = sayfa.html
+    for match in _UCLU_HTML_RE.finditer(page_html):
+        match_start = match.start()
+        context = page_html[max(0, match_start - 200):match_start + 200].lower()
+        _ekle(otobusler, gorulen, match.group(1).strip(), match.group(2).strip(),
+              _saat(match.group(3), match.group(4)),
+              'Tempo Reale' if _tempo_reale_mi(context) else 'Schedulato')
+    return otobusler
+
+
+def _strateji_sayfa_metni(sayfa: _Sayfa) -> List[Dict]:
+    """Son çare 2: aynı desen sayfa metninde"""
+    otobusler, gorulen = [], set()
+    for match in _UCLU_RE.finditer(sayfa.metin):
+        _ekle(otobusler, gorulen, match.group(1).strip(), match.group(2).strip(),
+              _saat(match.group(3), match.group(4)), 'Schedulato')
+    return otobusler
+
+
+def _strateji_kalin(sayfa: _Sayfa) -> List[Dict]:
+    """Son çare 3: ** ile çevrili metinleri Linea, Destinazione, Orario üçlüleri olarak grupla"""
+    otobusler, gorulen = [], set()
+    bold_matches = _KALIN_RE.findall(sayfa.metin)
+    i = 0
+    while i < len(bold_matches) - 2:
+        if _LINEA_RE.match(bold_matches[i].strip()):
+            time_match = _SAAT_RE.search(bold_matches[i + 2].strip())
+            if time_match:
+                _ekle(otobusler, gorulen, bold_matches[i].strip(), bold_matches[i + 1].strip(),
+                      _saat(time_match.group(1), time_match.group(2)), 'Schedulato')
+            i += 3
+        else:
+            i += 1
+    return otobusler
+
+
+# Sırayla denenen stratejiler; ilk boş olmayan sonuç kazanır
+STRATEJILER = (
+    ('metin', _strateji_metin),
+    ('tablo', _strateji_tablo),
+    ('html', _strateji_html),
+    ('sayfa_metni', _strateji_sayfa_metni),
+    ('kalin', _strateji_kalin),
+)
+
+_SAYFA_KURUCULAR = {
+    'html.parser': _sayfa_stdlib,
+}
+if lxml_etree is not None:
+    _SAYFA_KURUCULAR['lxml'] = _sayfa_lxml
+
+
+def varsayilan_backend() -> str:
+    """Ortam ayarına ve kurulu paketlere göre kullanılacak backend"""
+    if PARSER_BACKEND == 'auto':
+        return 'lxml' if 'lxml' in _SAYFA_KURUCULAR else 'html.parser'
+    if PARSER_BACKEND in _SAYFA_KURUCULAR or PARSER_BACKEND == 'bs4':
+        return PARSER_BACKEND
+    return 'html.parser'
+
+
+class StratejiHafizasi:
+    """
+    Durak/sayfa düzeni başına hangi stratejinin işe yaradığını hatırlar
+
+    Bir sonraki parse'ta önce o strateji denenir; sonuç boşsa (ıska) tüm
+    sıra baştan denenir ve kazanan strateji hafızaya yazılır.
+    """
+
+    def __init__(self, boyut: int = STRATEJI_HAFIZA_BOYUTU):
+        self.boyut = boyut
+        self._hafiza: 'OrderedDict[Tuple[str, bool], str]' = OrderedDict()
+        self._lock = threading.Lock()
+        # isabet: hafızadaki strateji tuttu, iska: tutmadı, yeni: hafızada kayıt yoktu
+        self._sayaclar = {'isabet': 0, 'iska': 0, 'yeni': 0, 'bos': 0}
+        self._kazananlar = {ad: 0 for ad, _ in STRATEJILER}
+
+    def getir(self, anahtar: Tuple[str, bool]) -> Optional[str]:
+        with self._lock:
+            ad = self._hafiza.get(anahtar)
+            if ad is not None:
+                self._hafiza.move_to_end(anahtar)
+            return ad
+
+    def kaydet(self, anahtar: Optional[Tuple[str, bool]], ad: str, durum: str):
+        """Kazanan stratejiyi say; hafızadan gelmediyse hafızaya yaz"""
+        with self._lock:
+            self._kazananlar[ad] += 1
+            if anahtar is None:
+                return
+            self._sayaclar[durum] += 1
+            if durum != 'isabet':
+                self._hafiza[anahtar] = ad
+                self._hafiza.move_to_end(anahtar)
+                while len(self._hafiza) > self.boyut:
+                    self._hafiza.popitem(last=False)
+
+    def bos_kaydet(self):
+        with self._lock:
+            self._sayaclar['bos'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._hafiza.clear()
+
+    def istatistik(self) -> Dict:
+        with self._lock:
+            return {
+                'kayit_sayisi': len(self._hafiza),
+                **self._sayaclar,
+                'strateji_kazanan': dict(self._kazananlar)
+            }
+
+
+# Süreç genelinde paylaşılan strateji hafızası
+strateji_hafizasi = StratejiHafizasi()
+_STRATEJI_FONKSIYONLARI = dict(STRATEJILER)
+
+
+def _otobusleri_bul(sayfa: _Sayfa, anahtar: Optional[str]) -> List[Dict]:
+    """Hafızadaki stratejiyi önce dene; ıskalarsa tüm sırayı dene"""
+    hafiza_anahtari = (anahtar, bool(sayfa.tablolar)) if anahtar else None
+    denenen = None
+    if hafiza_anahtari is not None:
+        denenen = strateji_hafizasi.getir(hafiza_anahtari)
+        if denenen is not None:
+            otobusler = _STRATEJI_FONKSIYONLARI[denenen](sayfa)
+            if otobusler:
+                strateji_hafizasi.kaydet(hafiza_anahtari, denenen, 'isabet')
+                return otobusler
+
+    for ad, strateji in STRATEJILER:
+        if ad == denenen:
+            continue
+        otobusler = strateji(sayfa)
+        if otobusler:
+            strateji_hafizasi.kaydet(hafiza_anahtari, ad, 'iska' if denenen else 'yeni')
+            return otobusler
+    strateji_hafizasi.bos_kaydet()
+    return []
+
+
+def parse_durak_html(content: bytes, backend: Optional[str] = None,
+                     anahtar: Optional[str] = None) -> Tuple[str, List[Dict]]:
+    """
+    Durak sayfasının HTML'ini parse et
+
+    Args:
+        content (bytes): smartpoles2.php yanıt gövdesi
+        backend (str): 'lxml', 'html.parser' veya 'bs4' (varsayılan: ATM_PARSER_BACKEND)
+        anahtar (str): Durak anahtarı (URL); verilirse işe yarayan strateji hatırlanır
+
+    Returns:
+        tuple: (durak_adi, otobusler) - otobüsler saate göre sıralı
+    """
+    backend = backend or varsayilan_backend()
+    if backend == 'bs4':
+        return _parse_bs4(content)
+    sayfa = _SAYFA_KURUCULAR.get(backend, _sayfa_stdlib)(content)
+
+    durak_adi = _durak_adi_bul(sayfa)
+    otobusler = _otobusleri_bul(sayfa, anahtar)
+
+    # TÜM otobüsleri göster - sadece saate göre sırala
+    otobusler.sort(key=lambda x: x['saat'])
+    return durak_adi, otobusler
+
+
+def _parse_bs4(content: bytes) -> Tuple[str, List[Dict]]:
+    """
+    Eski BeautifulSoup tabanlı parser (referans backend)
+
+    Hızlı backend'lerin çıktısı bu fonksiyonla karşılaştırılarak doğrulanır.
+    """
+    soup = BeautifulSoup(content, 'html.parser')
+
+    otobusler = []
+    durak_adi = 'Bilinmeyen Durak'
+
+    # Durak adını bul - daha esnek yöntem
+    # Önce tüm metni al ve FERMATA içeren kısmı bul
+    page_text = soup.get_text()
+    fermata_match = re.search(r'FERMATA[^•]*•[^*]*\*\*_?([^*]+?)_?\*\*', page_text, re.IGNORECASE)
+    if fermata_match:
+        durak_adi = fermata_match.group(1).replace('_', '').strip()
+    else:
+        # Alternatif: başlık elementlerinde ara
+        title_elements = soup.find_all(['h1', 'h2', 'h3', 'p', 'div', 'b', 'strong'])
+        for elem in title_elements:
+            text = elem.get_text()
+            if 'FERMATA' in text.upper():
+                # ** ile çevrili kısmı bul
+                match = re.search(r'\*\*_?([^*]+?)_?\*\*', text)
+                if match:
+                    durak_adi = match.group(1).replace('_', '').strip()
+                    break
+
+    # Tüm tabloları bul
+    tables = soup.find_all('table')
+
+    # Eğer tablo yoksa, tüm HTML'i text olarak parse et
+    if not tables or len(tables) == 0:
+        # Direkt metinden parse et
+        page_text = soup.get_text()
+        # Pattern: **32** **Staz. Centrale** **18:05** formatını bul
+        pattern = r'\*\*(\d+[A-Z\s]*)\*\*\s*\*\*([^*]+?)\*\*\s*\*\*(\d{1,2}):(\d{1,2})\*\*'
+        matches = re.finditer(pattern, page_text, re.IGNORECASE)
+        for match in matches:
+            hour = match.group(3).zfill(2)
+            minute = match.group(4).zfill(2)
+            otobus = {
+                'hat': match.group(1).strip(),
+                'varis': match.group(2).strip(),
+                'saat': f"{hour}:{minute}",
+                'tip': 'Schedulato'
+            }
+            if not any(o['hat'] == otobus['hat'] and o['saat'] == otobus['saat'] for o in otobusler):
+                otobusler.append(otobus)
+
+    # Tablolardan TÜM otobüs bilgilerini çek (geçmiş/gelecek ayrımı yapmadan)
+    # Her otobüs için ayrı bir tablo var
+    # Format: | Linea | Destinazione | Orario |
+    # İkinci satır: _(Orario Schedulato)_ veya _(Orario aggiornato in Tempo Reale ...)_
+
+    for table in tables:
+        try:
+            # Tablo içeriğini al
+            table_html = str(table)
+            table_text = table.get_text()
+
+            # Önce regex ile direkt tablo HTML'inden çek
+            # Pattern: <td> veya <th> içinde **32** **Staz. Centrale** **18:05** formatı
+            pattern = r'<t[dh][^>]*>\s*\*\*(\d+[A-Z\s]*)\*\*\s*</t[dh]>\s*<t[dh][^>]*>\s*\*\*([^*]+?)\*\*\s*</t[dh]>\s*<t[dh][^>]*>\s*\*\*(\d{1,2}):(\d{1,2})\*\*\s*</t[dh]'
+            matches = re.finditer(pattern, table_html, re.IGNORECASE | re.DOTALL)
+            for match in matches:
+                hour = match.group(3).zfill(2)
+                minute = match.group(4).zfill(2)
+                otobus = {
+                    'hat': match.group(1).strip(),
+                    'varis': match.group(2).strip(),
+                    'saat': f"{hour}:{minute}",
+                    'tip': 'Schedulato'
+                }
+                # Tip bilgisini kontrol et
+                if 'tempo reale' in table_text.lower() or 'aggiornato' in table_text.lower():
+                    otobus['tip'] = 'Tempo Reale'
+                if not any(o['hat'] == otobus['hat'] and o['saat'] == otobus['saat'] for o in otobusler):
+                    otobusler.append(otobus)
+
+            # Tablo hücrelerini manuel parse et (hem ** işaretli hem de düz metin formatı için)
+            rows = table.find_all('tr')
+
+            # Başlık satırını atla (Linea, Destinazione, Orario içeren)
+            data_rows = []
+            for row in rows:
+                row_text = row.get_text(strip=True).lower()
+                # Başlık satırı değilse ve veri içeriyorsa ekle
+                if 'linea' not in row_text or len(row.find_all(['td', 'th'])) > 0:
+                    cells = row.find_all(['td', 'th'])
+                    if len(cells) >= 2:  # En az 2 hücre varsa veri satırı olabilir
+                        data_rows.append(row)
+
+            # Her veri satırını işle
+            for row in data_rows:
+                try:
+                    cells = row.find_all(['td', 'th'])
+                    cell_texts = [cell.get_text(strip=True) for cell in cells]
+
+                    # Başlık satırını atla
+                    if any(text.lower() in ['linea', 'destinazione', 'orario'] for text in cell_texts):
+                        continue
+
+                    linea = ''
+                    destinazione = ''
+                    orario = ''
+                    tip = 'Schedulato'
+
+                    # Hücreleri analiz et
+                    for i, text in enumerate(cell_texts):
+                        # Temizle (** işaretlerini kaldır)
+                        clean_text = re.sub(r'\*+', '', text).strip()
+
+                        # Linea: Sadece sayı veya sayı + harf (örn: "1", "31 BIS")
+                        if re.match(r'^\d+[A-Z\s]*$', clean_text) and not linea:
+                            linea = clean_text
+                            continue
+
+                        # Saat: HH:MM formatı
+                        time_match = re.search(r'(\d{1,2}):(\d{1,2})', clean_text)
+                        if time_match and not orario:
+                            hour = time_match.group(1).zfill(2)
+                            minute = time_match.group(2).zfill(2)
+                            orario = f"{hour}:{minute}"
+                            continue
+
+                        # Destinazione: Uzun metin (Linea ve Orario değilse)
+                        if clean_text and len(clean_text) > 2 and not destinazione:
+                            if clean_text not in ['Linea', 'Destinazione', 'Orario']:
+                                if not re.match(r'^\d+[A-Z\s]*$', clean_text):
+                                    if not re.match(r'^\d{1,2}:\d{2}', clean_text):
+                                        destinazione = clean_text
+
+                    # Tip bilgisini kontrol et (aynı satırda veya sonraki satırda)
+                    row_text_lower = row.get_text(strip=True).lower()
+                    if 'tempo reale' in row_text_lower or 'aggiornato' in row_text_lower:
+                        tip = 'Tempo Reale'
+
+                    # Sonraki satırı da kontrol et (tip bilgisi orada olabilir)
+                    row_index = rows.index(row) if row in rows else -1
+                    if row_index >= 0 and row_index + 1 < len(rows):
+                        next_row_text = rows[row_index + 1].get_text(strip=True).lower()
+                        if 'tempo reale' in next_row_text or 'aggiornato' in next_row_text:
+                            tip = 'Tempo Reale'
+
+                    # Eğer hala bulamadıysak, tablo metninden regex ile ara
+                    if not orario:
+                        time_matches = re.findall(r'(\d{1,2}):(\d{1,2})', table_text)
+                        if time_matches:
+                            hour, minute = time_matches[0]
+                            orario = f"{hour.zfill(2)}:{minute.zfill(2)}"
+
+                    if not linea:
+                        # Tablo metninden sayı ile başlayan metni bul
+                        linea_match = re.search(r'\b(\d+[A-Z\s]*)\b', table_text)
+                        if linea_match:
+                            potential_linea = linea_match.group(1).strip()
+                            if not re.match(r'^\d{1,2}:\d{2}', potential_linea):
+                                linea = potential_linea
+
+                    # Otobüsü ekle (Linea ve Orario varsa)
+                    if linea and orario:
+                        otobus = {
+                            'hat': linea,
+                            'varis': destinazione if destinazione else 'Bilinmiyor',
+                            'saat': orario,
+                            'tip': tip
+                        }
+                        if not any(o['hat'] == otobus['hat'] and o['saat'] == otobus['saat'] for o in otobusler):
+                            otobusler.append(otobus)
+                except Exception as e:
+                    # Bu satırı atla
+                    continue
+        except Exception as e:
+            # Bu tabloyu atla, diğerlerine devam et
+            continue
+
+    # Eğer hala otobüs bulunamadıysa, tüm sayfadan regex ile ara
+    if not otobusler:
+        # Tüm HTML'i text olarak al
+        page_html = str(soup)
+        page_text = soup.get_text()
+
+        # Pattern 1: **32** **Staz. Centrale** **18:05** formatı (HTML içinde)
+        pattern1 = r'\*\*(\d+[A-Z\s]*)\*\*\s*\*\*([^*]+?)\*\*\s*\*\*(\d{1,2}):(\d{1,2})\*\*'
+        matches1 = re.finditer(pattern1, page_html, re.IGNORECASE | re.DOTALL)
+        for match in matches1:
+            hour = match.group(3).zfill(2)
+            minute = match.group(4).zfill(2)
+            otobus = {
+                'hat': match.group(1).strip(),
+                'varis': match.group(2).strip(),
+                'saat': f"{hour}:{minute}",
+                'tip': 'Schedulato'
+            }
+            # Tip kontrolü - eğer bu otobüsün yakınında "tempo reale" varsa
+            match_start = match.start()
+            context = page_html[max(0, match_start-200):match_start+200].lower()
+            if 'tempo reale' in context or 'aggiornato' in context:
+                otobus['tip'] = 'Tempo Reale'
+            if not any(o['hat'] == otobus['hat'] and o['saat'] == otobus['saat'] for o in otobusler):
+                otobusler.append(otobus)
+
+        # Pattern 2: Sadece text'ten (eğer HTML pattern çalışmadıysa)
+        if not otobusler:
+            matches2 = re.finditer(pattern1, page_text, re.IGNORECASE)
+            for match in matches2:
+                hour = match.group(3).zfill(2)
+                minute = match.group(4).zfill(2)
+                otobus = {
+                    'hat': match.group(1).strip(),
+                    'varis': match.group(2).strip(),
+                    'saat': f"{hour}:{minute}",
+                    'tip': 'Schedulato'
+                }
+                if not any(o['hat'] == otobus['hat'] and o['saat'] == otobus['saat'] for o in otobusler):
+                    otobusler.append(otobus)
+
+        # Pattern 3: Tüm ** ile çevrili metinleri bul ve grupla
+        if not otobusler:
+            bold_matches = re.findall(r'\*\*([^*]+)\*\*', page_text)
+            i = 0
+            while i < len(bold_matches) - 2:
+                # Linea, Destinazione, Orario sırası
+                if re.match(r'^\d+[A-Z\s]*$', bold_matches[i].strip()):
+                    linea = bold_matches[i].strip()
+                    destinazione = bold_matches[i+1].strip() if i+1 < len(bold_matches) else 'Bilinmiyor'
+                    orario_text = bold_matches[i+2].strip() if i+2 < len(bold_matches) else ''
+                    time_match = re.search(r'(\d{1,2}):(\d{1,2})', orario_text)
+                    if time_match:
+                        hour = time_match.group(1).zfill(2)
+                        minute = time_match.group(2).zfill(2)
+                        otobus = {
+                            'hat': linea,
+                            'varis': destinazione,
+                            'saat': f"{hour}:{minute}",
+                            'tip': 'Schedulato'
+                        }
+                        if not any(o['hat'] == otobus['hat'] and o['saat'] == otobus['saat'] for o in otobusler):
+                            otobusler.append(otobus)
+                    i += 3
+                else:
+                    i += 1
+
+    # TÜM otobüsleri göster - hiçbir filtreleme yapma
+    # Sayfada ne varsa hepsini göster (geçmiş/gelecek ayrımı yapmadan)
+    # Sadece saate göre sırala
+    otobusler.sort(key=lambda x: x['saat'])
+
+    return durak_adi, otobusler
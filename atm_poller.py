@@ -0,0 +1,173 @@
+"""
+ATM Messina arka plan poller'ı
+Tüm durakları belirli aralıklarla yeniler ve bellekte canlı bir snapshot tutar
+"""
+
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Poller uygulama ile birlikte başlasın mı ve kaç saniyede bir yenilesin
+POLLER_ENABLED = os.environ.get('ATM_POLLER', 'False').lower() == 'true'
+POLLER_INTERVAL = float(os.environ.get('ATM_POLLER_INTERVAL', 15))
+# ATM_POLLER kapalıyken canlı akış abonesi için başlatılan poller, son abone
+# ayrıldıktan bu kadar sonra durur (saniye)
+POLLER_BOSTA_SURE = float(os.environ.get('ATM_POLLER_IDLE', 60))
+
+
+class DurakPoller:
+    """
+    Arka planda tüm durakları yenileyen poller
+
+    Snapshot her turda yeni bir sözlük olarak kurulup tek atamayla
+    değiştirilir; okuyucular kilit almadan okur.
+
+    start() ile başlatılan poller sürekli çalışır. abone_ol() ile (canlı
+    akış için) başlatılan poller ise abone sayısını tutar ve son abone
+    ayrıldıktan bosta_sure sonra durur.
+    """
+
+    def __init__(self, durak_yukle: Callable[[], List[Dict]],
+                 cekici: Callable[[List[Dict]], List[Dict]],
+                 interval: float = POLLER_INTERVAL, bosta_sure: float = POLLER_BOSTA_SURE):
+        """
+        Args:
+            durak_yukle: Güncel durak listesini döndüren fonksiyon
+            cekici: Durak listesini alıp aynı sırayla fetch sonuçlarını döndüren fonksiyon
+            interval (float): İki tur arasındaki süre (saniye)
+            bosta_sure (float): Abonesiz kalan talep üzerine poller'ın durma gecikmesi (saniye)
+        """
+        self.durak_yukle = durak_yukle
+        self.cekici = cekici
+        self.interval = interval
+        self.bosta_sure = bosta_sure
+        # url -> (veri, zaman)
+        self._snapshot: Dict[str, Tuple[Dict, float]] = {}
+        self._dur = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._surekli = False
+        self._aboneler = 0
+        self._durdurucu: Optional[threading.Timer] = None
+        self.tur_sayisi = 0
+        self.son_tur_suresi = 0.0
+        self.son_tur_zamani: Optional[float] = None
+        self.son_hata: Optional[str] = None
+
+    @property
+    def calisiyor(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Poller thread'ini sürekli çalışmak üzere başlat (zaten çalışıyorsa bir şey yapma)"""
+        with self._lock:
+            self._surekli = True
+            self._baslat()
+
+    def _baslat(self):
+        # Kilit altında çağrılır. Durmakta olan thread henüz çıkmadıysa
+        # (çıkışı kilit altında) bayrağı kaldırmak onu devam ettirmeye yeter.
+        self._dur.clear()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._dongu, daemon=True, name='atm-poller')
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        with self._lock:
+            self._surekli = False
+            self._zamanlayiciyi_iptal_et()
+            self._dur.set()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def abone_ol(self):
+        """Canlı akış abonesi geldi: poller çalışmıyorsa başlat"""
+        with self._lock:
+            self._aboneler += 1
+            self._zamanlayiciyi_iptal_et()
+            self._baslat()
+
+    def abonelikten_cik(self):
+        """Abone ayrıldı: son abone ise ve poller sürekli değilse bosta_sure sonra durdur"""
+        with self._lock:
+            self._aboneler = max(self._aboneler - 1, 0)
+            if self._aboneler or self._surekli:
+                return
+            self._zamanlayiciyi_iptal_et()
+            self._durdurucu = threading.Timer(self.bosta_sure, self._bostaysa_durdur)
+            self._durdurucu.daemon = True
+            self._durdurucu.start()
+
+    def _zamanlayiciyi_iptal_et(self):
+        if self._durdurucu is not None:
+            self._durdurucu.cancel()
+            self._durdurucu = None
+
+    def _bostaysa_durdur(self):
+        with self._lock:
+            if self._aboneler or self._surekli:
+                return
+            self._durdurucu = None
+            self._dur.set()
+
+    def _dongu(self):
+        while True:
+            with self._lock:
+                if self._dur.is_set():
+                    self._thread = None
+                    return
+            baslangic = time.monotonic()
+            try:
+                self.yenile()
+            except Exception as e:
+                self.son_hata = str(e)
+                print(f"Poller hatası: {e}")
+            # Tur süresini aralıktan düş; yavaş turlar arka arkaya binmesin
+            kalan = self.interval - (time.monotonic() - baslangic)
+            self._dur.wait(max(kalan, 0.5))
+
+    def yenile(self):
+        """Tüm durakları bir kez yenile ve snapshot'ı değiştir"""
+        baslangic = time.monotonic()
+        hedefler = [d for d in self.durak_yukle() if d.get('url')]
+        sonuclar = self.cekici(hedefler)
+        simdi = time.time()
+
+        eski = self._snapshot
+        yeni: Dict[str, Tuple[Dict, float]] = {}
+        for durak, veri in zip(hedefler, sonuclar):
+            url = durak['url']
+            if veri.get('success') or url not in eski:
+                yeni[url] = (veri, simdi)
+            else:
+                # Hata durumunda son başarılı veriyi koru
+                yeni[url] = eski[url]
+        self._snapshot = yeni
+
+        self.tur_sayisi += 1
+        self.son_tur_suresi = time.monotonic() - baslangic
+        self.son_tur_zamani = simdi
+        self.son_hata = None
+
+    def bak(self, url: str) -> Optional[Tuple[Dict, float]]:
+        """Snapshot'taki veriyi döndür: (veri, yas) veya None"""
+        kayit = self._snapshot.get(url)
+        if kayit is None:
+            return None
+        veri, zaman = kayit
+        return veri, time.time() - zaman
+
+    def istatistik(self) -> Dict:
+        return {
+            'calisiyor': self.calisiyor,
+            'surekli': self._surekli,
+            'abone_sayisi': self._aboneler,
+            'interval_sn': self.interval,
+            'durak_sayisi': len(self._snapshot),
+            'tur_sayisi': self.tur_sayisi,
+            'son_tur_suresi': round(self.son_tur_suresi, 3),
+            'son_tur_zamani': self.son_tur_zamani,
+            'son_hata': self.son_hata
+        }
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Parser benchmark'ı - ağ gerektirmez
+
+benchmarks/corpus altındaki smartpoles2.php sayfalarını her parser backend'i ile
+parse eder; saniyedeki işlem sayısını, sayfa başı gecikme yüzdeliklerini ve
+tepe bellek kullanımını raporlar. Her backend'in çıktısı hem beklenen.json ile
+hem de aynı sayfanın canlı bs4 çıktısıyla karşılaştırılır; herhangi bir fark
+varsa çıkış kodu 1 olur. Corpus, backend'lerin ayrışabileceği sayfaları da
+içerir: hücre/başlık içinde yorum ve PI, CDATA, kapanmamış <td>/<tr>, fazladan
+</div>.
+
+Kullanım:
+    python benchmarks/bench_parser.py
+    python benchmarks/bench_parser.py --backend lxml --sure 2
+    python benchmarks/bench_parser.py --beklenen-guncelle   # referans: bs4
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import atm_parser  # noqa: E402
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+BEKLENEN_FILE = os.path.join(CORPUS_DIR, 'beklenen.json')
+REFERANS_BACKEND = 'bs4'
+
+
+def sayfalari_yukle() -> Dict[str, bytes]:
+    sayfalar = {}
+    for yol in sorted(glob.glob(os.path.join(CORPUS_DIR, '*.html'))):
+        with open(yol, 'rb') as f:
+            sayfalar[os.path.basename(yol)] = f.read()
+    return sayfalar
+
+
+def backendleri_bul() -> List[str]:
+    return [REFERANS_BACKEND] + sorted(atm_parser._SAYFA_KURUCULAR)
+
+
+def _yuzdelik(sirali: List[float], oran: float) -> float:
+    indeks = min(len(sirali) - 1, int(round(oran * (len(sirali) - 1))))
+    return sirali[indeks]
+
+
+def olc(content: bytes, backend: str, anahtar: str, sure: float) -> Dict:
+    """Tek sayfa + backend için gecikme ve bellek ölçümü"""
+    # Isınma (strateji hafızası da dolar)
+    atm_parser.parse_durak_html(content, backend, anahtar=anahtar)
+
+    gecikmeler = []
+    bitis = time.perf_counter() + sure
+    while time.perf_counter() < bitis or len(gecikmeler) < 5:
+        t0 = time.perf_counter_ns()
+        atm_parser.parse_durak_html(content, backend, anahtar=anahtar)
+        gecikmeler.append((time.perf_counter_ns() - t0) / 1e6)
+    gecikmeler.sort()
+    toplam_ms = sum(gecikmeler)
+
+    tracemalloc.start()
+    atm_parser.parse_durak_html(content, backend, anahtar=anahtar)
+    _, tepe = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'tekrar': len(gecikmeler),
+        'ops_sn': len(gecikmeler) / (toplam_ms / 1000) if toplam_ms else 0.0,
+        'p50_ms': _yuzdelik(gecikmeler, 0.50),
+        'p95_ms': _yuzdelik(gecikmeler, 0.95),
+        'p99_ms': _yuzdelik(gecikmeler, 0.99),
+        'tepe_bellek_kb': tepe / 1024
+    }
+
+
+def dogrula(sayfalar: Dict[str, bytes], backendler: List[str], beklenen: Dict) -> List[str]:
+    """Her backend'in çıktısını beklenen.json ve canlı bs4 çıktısıyla karşılaştır"""
+    hatalar = []
+    for ad, content in sayfalar.items():
+        referans = atm_parser.parse_durak_html(content, REFERANS_BACKEND)
+        for backend in backendler:
+            if backend == REFERANS_BACKEND:
+                continue
+            sonuc = atm_parser.parse_durak_html(content, backend)
+            if sonuc != referans:
+                hatalar.append(f"{ad} [{backend}]: {REFERANS_BACKEND} çıktısından farklı "
+                               f"({sonuc[0]!r}, {len(sonuc[1])} otobüs / "
+                               f"{referans[0]!r}, {len(referans[1])} otobüs)")
+
+        if ad not in beklenen:
+            hatalar.append(f"{ad}: beklenen.json'da kayıt yok (--beklenen-guncelle)")
+            continue
+        for backend in backendler:
+            durak_adi, otobusler = atm_parser.parse_durak_html(content, backend)
+            if otobusler != beklenen[ad]['otobusler']:
+                hatalar.append(f"{ad} [{backend}]: otobüs listesi farklı "
+                               f"({len(otobusler)} / beklenen {len(beklenen[ad]['otobusler'])})")
+            if durak_adi != beklenen[ad]['durak_adi']:
+                hatalar.append(f"{ad} [{backend}]: durak adı '{durak_adi}' != '{beklenen[ad]['durak_adi']}'")
+    return hatalar
+
+
+def beklenen_guncelle(sayfalar: Dict[str, bytes]):
+    beklenen = {}
+    for ad, content in sayfalar.items():
+        durak_adi, otobusler = atm_parser.parse_durak_html(content, REFERANS_BACKEND)
+        beklenen[ad] = {'durak_adi': durak_adi, 'otobusler': otobusler}
+    with open(BEKLENEN_FILE, 'w', encoding='utf-8') as f:
+        json.dump(beklenen, f, ensure_ascii=False, indent=2)
+        f.write('\n')
+    print(f"{BEKLENEN_FILE} güncellendi ({len(beklenen)} sayfa, referans: {REFERANS_BACKEND})")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='ATM Messina parser benchmark')
+    parser.add_argument('--backend', action='append', help='Sadece bu backend(ler)i ölç')
+    parser.add_argument('--sure', type=float, default=0.5, help='Sayfa+backend başına ölçüm süresi (saniye)')
+    parser.add_argument('--json', action='store_true', help='Sonuçları JSON olarak yazdır')
+    parser.add_argument('--beklenen-guncelle', action='store_true',
+                        help=f'beklenen.json dosyasını {REFERANS_BACKEND} çıktısından yeniden üret')
+    args = parser.parse_args(argv)
+
+    sayfalar = sayfalari_yukle()
+    if args.beklenen_guncelle:
+        beklenen_guncelle(sayfalar)
+        return 0
+
+    backendler = args.backend or backendleri_bul()
+    with open(BEKLENEN_FILE, 'r', encoding='utf-8') as f:
+        beklenen = json.load(f)
+
+    hatalar = dogrula(sayfalar, backendler, beklenen)
+
+    sonuclar = []
+    for ad, content in sayfalar.items():
+        for backend in backendler:
+            olcum = olc(content, backend, anahtar=ad, sure=args.sure)
+            sonuclar.append({'sayfa': ad, 'backend': backend, 'boyut_kb': len(content) / 1024, **olcum})
+
+    if args.json:
+        json.dump({'sonuclar': sonuclar, 'hatalar': hatalar}, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    else:
+        print(f"{'Sayfa':<20} {'Backend':<12} {'KB':>6} {'ops/sn':>9} {'p50 ms':>8} "
+              f"{'p95 ms':>8} {'p99 ms':>8} {'Tepe KB':>9}")
+        print('-' * 86)
+        for s in sonuclar:
+            print(f"{s['sayfa']:<20} {s['backend']:<12} {s['boyut_kb']:>6.1f} {s['ops_sn']:>9.0f} "
+                  f"{s['p50_ms']:>8.3f} {s['p95_ms']:>8.3f} {s['p99_ms']:>8.3f} {s['tepe_bellek_kb']:>9.1f}")
+        print()
+        if hatalar:
+            print("❌ Doğruluk hataları:")
+            for hata in hatalar:
+                print(f"   - {hata}")
+        else:
+            print(f"✅ {len(sayfalar)} sayfa x {len(backendler)} backend beklenen çıktıyla aynı")
+
+    return 1 if hatalar else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())